@@ -0,0 +1,70 @@
+"""Compare two pytest-benchmark JSON reports and flag regressions.
+
+Usage::
+
+    pytest benchmarks --benchmark-json=benchmarks/baseline.json   # once
+    pytest benchmarks --benchmark-json=current.json
+    python -m benchmarks.compare benchmarks/baseline.json current.json -t 10
+
+The command exits with status 1 when any benchmark's chosen statistic is
+more than ``threshold`` percent slower than in the baseline.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+def load(path: Path, stat: str) -> Dict[str, float]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {b["fullname"]: b["stats"][stat] for b in data.get("benchmarks", [])}
+
+
+def compare(
+    baseline: Dict[str, float], current: Dict[str, float], threshold: float
+) -> List[Tuple[str, float, float, float, bool]]:
+    """Return ``(name, baseline, current, change %, regressed)`` rows."""
+    rows = []
+    for name in sorted(baseline.keys() & current.keys()):
+        old, new = baseline[name], current[name]
+        change = (new - old) / old * 100 if old else 0.0
+        rows.append((name, old, new, change, change > threshold))
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("current", type=Path)
+    parser.add_argument(
+        "-t", "--threshold", type=float, default=10.0, help="Allowed slowdown in %%"
+    )
+    parser.add_argument(
+        "--stat", default="median", help="Statistic to compare (default: median)"
+    )
+    args = parser.parse_args(argv)
+
+    rows = compare(
+        load(args.baseline, args.stat), load(args.current, args.stat), args.threshold
+    )
+    regressions = 0
+    for name, old, new, change, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        regressions += regressed
+        print(
+            f"{name:<70} {old * 1e6:>10.1f}us {new * 1e6:>10.1f}us "
+            f"{change:>+7.1f}% {flag}"
+        )
+    if regressions:
+        print(f"{regressions} benchmark(s) regressed by more than {args.threshold}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import asyncio
+import os
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("MOOGLA_JWT_SECRET", "benchmark-secret")
+
+
+class StubExecutor:
+    """Executor returning instantly so only server overhead is measured."""
+
+    def __init__(self, tokens: int = 32) -> None:
+        self.tokens = ["tok"] * tokens
+
+    async def acomplete(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ) -> str:
+        return prompt
+
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ):
+        for token in self.tokens:
+            yield token
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def stub_executor(monkeypatch):
+    from moogla import server
+
+    executor = StubExecutor()
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: executor)
+    return executor
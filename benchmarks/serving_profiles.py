@@ -0,0 +1,107 @@
+"""Compare serving profiles end to end on the synthetic backend.
+
+Usage::
+
+    python -m benchmarks.serving_profiles -n 2000 -c 32
+
+Each profile starts ``moogla serve --model synthetic`` in a subprocess with a
+different event loop and HTTP implementation and drives it with
+:func:`moogla.bench.run_benchmark`. Profiles whose packages are not installed
+are skipped.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import httpx
+
+from moogla.bench import BenchConfig, run_benchmark
+
+PROFILES: List[Tuple[str, str]] = [
+    ("asyncio", "h11"),
+    ("uvloop", "h11"),
+    ("asyncio", "httptools"),
+    ("uvloop", "httptools"),
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url + "/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+def run_profile(loop: str, http: str, config: BenchConfig) -> dict:
+    port = _free_port()
+    config.url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, OPENAI_API_KEY="unused", MOOGLA_LOG_LEVEL="WARNING")
+    env.pop("MOOGLA_API_KEY", None)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "moogla", "serve", "--model", "synthetic"]
+        + ["--port", str(port), "--loop", loop, "--http", http],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_ready(config.url)
+        return asyncio.run(run_benchmark(config))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--max-tokens", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    print(f"{'profile':<22}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for loop, http in PROFILES:
+        name = f"{loop}+{http}"
+        missing = [m for m in (loop, http) if not importlib.util.find_spec(m)]
+        if missing:
+            print(f"{name:<22}skipped, {', '.join(missing)} not installed")
+            continue
+        config = BenchConfig(
+            requests=args.requests,
+            concurrency=args.concurrency,
+            stream=args.stream,
+            max_tokens=args.max_tokens,
+        )
+        report = run_profile(loop, http, config)
+        latency = report["latency"]
+        print(
+            f"{name:<22}{report['throughput_rps']:>10.1f}"
+            f"{latency['p50'] * 1000:>10.1f}{latency['p99'] * 1000:>10.1f}"
+            f"{report['failed']:>8}"
+        )
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover - manual tool
+    sys.exit(main())
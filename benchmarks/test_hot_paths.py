@@ -0,0 +1,112 @@
+"""Microbenchmarks for per-request server overhead.
+
+Run with ``pytest benchmarks --benchmark-json=current.json`` and compare
+against a stored baseline using ``python -m benchmarks.compare``.
+"""
+
+import types
+
+import httpx
+import pytest
+
+from moogla import plugins_config
+from moogla.plugins import Plugin
+from moogla.server import create_app, encode_stream_chunk
+
+pytest.importorskip("pytest_benchmark")
+
+
+def make_client(app):
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench"
+    )
+
+
+def test_completion_request(benchmark, loop, stub_executor):
+    client = make_client(create_app(["tests.dummy_plugin"]))
+
+    def run():
+        return loop.run_until_complete(
+            client.post("/v1/completions", json={"prompt": "hello world"})
+        )
+
+    assert benchmark(run).status_code == 200
+    loop.run_until_complete(client.aclose())
+
+
+def test_chat_stream_request(benchmark, loop, stub_executor):
+    client = make_client(create_app())
+    body = {"messages": [{"role": "user", "content": "hi"}], "stream": True}
+
+    def run():
+        return loop.run_until_complete(client.post("/v1/chat/completions", json=body))
+
+    assert benchmark(run).status_code == 200
+    loop.run_until_complete(client.aclose())
+
+
+def test_request_validation_error(benchmark, loop, stub_executor):
+    client = make_client(create_app())
+
+    def run():
+        return loop.run_until_complete(
+            client.post("/v1/chat/completions", json={"messages": [{"role": "x"}]})
+        )
+
+    assert benchmark(run).status_code == 422
+    loop.run_until_complete(client.aclose())
+
+
+@pytest.mark.parametrize("hook", ["sync", "async"])
+def test_plugin_run_preprocess(benchmark, loop, hook):
+    mod = types.ModuleType(f"bench_{hook}_plugin")
+    if hook == "sync":
+        mod.preprocess = lambda text: text.upper()
+    else:
+
+        async def preprocess_async(text: str) -> str:
+            return text.upper()
+
+        mod.preprocess_async = preprocess_async
+    plugin = Plugin(mod)
+    assert benchmark(lambda: loop.run_until_complete(plugin.run_preprocess("abc")))
+
+
+def test_plugin_store_load(benchmark, tmp_path):
+    store = plugins_config.PluginStore(tmp_path / "plugins.yaml")
+    for i in range(20):
+        store.add_plugin(f"plugin_{i}", option=str(i))
+
+    def run():
+        store.invalidate()
+        return store.load()
+
+    assert len(benchmark(run)["plugins"]) == 20
+
+
+def test_plugin_store_cached_settings(benchmark, tmp_path):
+    store = plugins_config.PluginStore(tmp_path / "plugins.yaml")
+    store.add_plugin("plugin", option="1")
+    assert benchmark(store.get_plugin_settings, "plugin") == {"option": "1"}
+
+
+@pytest.mark.parametrize("scheme", ["api_key", "jwt"])
+def test_verify_auth(benchmark, loop, stub_executor, tmp_path, scheme):
+    app = create_app(server_api_key="bench-key", db_url=f"sqlite:///{tmp_path}/db")
+    client = make_client(app)
+    headers = {"X-API-Key": "bench-key"}
+    if scheme == "jwt":
+        creds = {"username": "bench", "password": "pw"}
+        loop.run_until_complete(client.post("/register", json=creds))
+        token = loop.run_until_complete(client.post("/login", json=creds)).json()
+        headers = {"Authorization": f"Bearer {token['access_token']}"}
+
+    def run():
+        return loop.run_until_complete(client.get("/plugin-cache", headers=headers))
+
+    assert benchmark(run).status_code == 200
+    loop.run_until_complete(client.aclose())
+
+
+def test_encode_stream_chunk(benchmark):
+    assert benchmark(encode_stream_chunk, "token").endswith("\n")
@@ -0,0 +1,584 @@
+"""Offline batch jobs processed in the background.
+
+A client uploads a JSONL file with one request per line::
+
+    {"custom_id": "q1", "url": "/v1/chat/completions", "body": {...}}
+
+The job is stored in the database and the file next to its output in the
+batch directory. :class:`BatchRunner` works through queued jobs one at a
+time with a small pool of concurrent requests and appends one result line
+per request to the output file. Batch requests run in a low-priority lane:
+workers only start a request while interactive traffic is below a limit.
+
+Results already in the output file are skipped when a job runs again, so a
+cancelled job, or one interrupted by a restart, resumes where it stopped.
+
+Several server processes may share the database. A runner claims a queued
+job with a conditional update and records itself as the job's ``owner``, so
+each job runs in one process at a time. Jobs left running by a process that
+is gone are queued again by the other runners.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import secrets
+import socket
+import time
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterable,
+    Awaitable,
+    BinaryIO,
+    Callable,
+    Collection,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import httpx
+from sqlmodel import Field, Session, SQLModel, select, update
+
+from .metrics import BATCH_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = "/v1/completions"
+# Statuses of jobs that are not going to change without a client request
+FINAL_STATUSES = ("completed", "cancelled", "failed")
+
+Handler = Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class BatchJob(SQLModel, table=True):
+    """Persistent state of a batch job."""
+
+    id: str = Field(primary_key=True)
+    status: str = Field(default="queued", index=True)
+    # ``host:pid`` of the process running the job
+    owner: Optional[str] = None
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+    output_tokens: int = 0
+    # Seconds spent running, summed over all runs of the job
+    elapsed: float = 0.0
+    created_at: float = Field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+
+def owner_alive(owner: Optional[str]) -> bool:
+    """Return whether the process named by a job ``owner`` may still run.
+
+    Processes on other hosts cannot be checked and are assumed alive.
+    """
+    if not owner:
+        return False
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def describe_job(job: BatchJob) -> Dict[str, Any]:
+    """Return the API representation of ``job`` with throughput stats."""
+    done = job.completed + job.failed
+    rate = done / job.elapsed if job.elapsed else 0.0
+    remaining = job.total - done
+    return {
+        "id": job.id,
+        "object": "batch",
+        "status": job.status,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "error": job.error,
+        "request_counts": {
+            "total": job.total,
+            "completed": job.completed,
+            "failed": job.failed,
+        },
+        "stats": {
+            "elapsed_seconds": round(job.elapsed, 3),
+            "requests_per_second": round(rate, 3),
+            "tokens_per_second": (
+                round(job.output_tokens / job.elapsed, 3) if job.elapsed else 0.0
+            ),
+            "output_tokens": job.output_tokens,
+            "eta_seconds": (
+                round(remaining / rate, 1)
+                if rate and remaining and job.status not in FINAL_STATUSES
+                else None
+            ),
+        },
+    }
+
+
+class BatchRunner:
+    """Store batch jobs and process them with a pool of workers.
+
+    ``handle(url, body)`` answers one request and returns the response body.
+    Exceptions with a ``status_code`` are recorded with that code and any
+    other exception as a 500. ``busy()`` reports whether interactive
+    traffic should go first; workers wait while it returns true. While idle,
+    the runner looks for jobs queued by other processes every
+    ``idle_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        engine: Any,
+        directory: Path | str,
+        handle: Handler,
+        *,
+        endpoints: Collection[str] = (DEFAULT_URL,),
+        workers: int = 4,
+        busy: Optional[Callable[[], bool]] = None,
+        poll_interval: float = 0.05,
+        progress_interval: float = 1.0,
+        idle_interval: float = 5.0,
+    ) -> None:
+        self.engine = engine
+        self.directory = Path(directory)
+        self.handle = handle
+        self.endpoints = endpoints
+        self.workers = max(1, workers)
+        self.busy = busy
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self.idle_interval = idle_interval
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._cancelled: Set[str] = set()
+        self._calls: Set[asyncio.Future] = set()
+
+    def input_path(self, job_id: str) -> Path:
+        return self.directory / f"{job_id}.input.jsonl"
+
+    def output_path(self, job_id: str) -> Path:
+        return self.directory / f"{job_id}.output.jsonl"
+
+    @property
+    def owner(self) -> str:
+        # Read on every use, a forked worker has its own pid
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        with Session(self.engine) as session:
+            return session.get(BatchJob, job_id)
+
+    def jobs(self, limit: int = 20) -> List[BatchJob]:
+        """Return the most recently created jobs first."""
+        with Session(self.engine) as session:
+            query = select(BatchJob).order_by(BatchJob.created_at.desc())
+            return list(session.exec(query.limit(limit)).all())
+
+    def _update(self, job_id: str, **fields: Any) -> BatchJob:
+        with Session(self.engine) as session:
+            job = session.get(BatchJob, job_id)
+            for name, value in fields.items():
+                setattr(job, name, value)
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            return job
+
+    def _notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _check_line(self, line: bytes, number: int, index: int, ids: Set[str]) -> None:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            raise ValueError(f"Line {number}: invalid JSON") from None
+        if not isinstance(request, dict) or not isinstance(request.get("body"), dict):
+            raise ValueError(f"Line {number}: expected an object with a body")
+        url = request.get("url", DEFAULT_URL)
+        if url not in self.endpoints:
+            raise ValueError(f"Line {number}: unsupported url {url!r}")
+        custom_id = request.get("custom_id") or f"request-{index}"
+        if not isinstance(custom_id, str):
+            raise ValueError(f"Line {number}: custom_id must be a string")
+        if custom_id in ids:
+            raise ValueError(f"Line {number}: duplicate custom_id {custom_id!r}")
+        ids.add(custom_id)
+
+    async def submit(self, chunks: AsyncIterable[bytes]) -> BatchJob:
+        """Store an uploaded JSONL file and queue a job for it.
+
+        Every line is validated while the upload is written to disk. Blank
+        lines are dropped. :class:`ValueError` is raised for an invalid or
+        empty file. Validation, writes and the job insert run in threads.
+        """
+        await self._call(self.directory.mkdir, parents=True, exist_ok=True)
+        job_id = "batch_" + secrets.token_hex(12)
+        path = self.input_path(job_id)
+        ids: Set[str] = set()
+        total = number = 0
+
+        def write_lines(out: BinaryIO, lines: List[bytes]) -> None:
+            nonlocal total, number
+            for line in lines:
+                number += 1
+                if line.strip():
+                    self._check_line(line, number, total, ids)
+                    out.write(line.rstrip(b"\r") + b"\n")
+                    total += 1
+
+        try:
+            out = await self._call(path.open, "wb")
+            try:
+                pending = bytearray()
+                async for chunk in chunks:
+                    # Bytes of a line spanning several chunks are collected
+                    # and copied once, when the line is complete
+                    end = chunk.rfind(b"\n")
+                    if end < 0:
+                        pending += chunk
+                        continue
+                    lines = bytes(pending + chunk[:end]).split(b"\n")
+                    pending = bytearray(chunk[end + 1 :])
+                    await self._call(write_lines, out, lines)
+                if pending.strip():
+                    await self._call(write_lines, out, [bytes(pending)])
+            finally:
+                await self._call(out.close)
+            if not total:
+                raise ValueError("The batch holds no requests")
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        job = await self._call(self._insert, job_id, total)
+        self._notify()
+        return job
+
+    def _insert(self, job_id: str, total: int) -> BatchJob:
+        with Session(self.engine) as session:
+            job = BatchJob(id=job_id, total=total)
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            return job
+
+    def cancel(self, job_id: str) -> BatchJob:
+        """Stop a job. Requests already running are finished and recorded."""
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        if job.status == "queued":
+            return self._update(job_id, status="cancelled", finished_at=time.time())
+        if job.status == "running":
+            self._cancelled.add(job_id)
+            return self._update(job_id, status="cancelling")
+        return job
+
+    def resume(self, job_id: str) -> BatchJob:
+        """Queue a cancelled or failed job to process its remaining requests."""
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        if job.status not in ("cancelled", "failed"):
+            raise RuntimeError(f"Cannot resume a {job.status} job")
+        job = self._update(job_id, status="queued", finished_at=None, error=None)
+        self._notify()
+        return job
+
+    def start(self) -> None:
+        """Start processing queued jobs in the running event loop."""
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def _requeue_interrupted(self) -> None:
+        """Queue jobs again whose owner process is gone."""
+        with Session(self.engine) as session:
+            query = select(BatchJob).where(
+                BatchJob.status.in_(("running", "cancelling"))
+            )
+            for job in session.exec(query):
+                if owner_alive(job.owner):
+                    continue
+                logger.info("Requeueing batch job %s of %s", job.id, job.owner)
+                job.status = "queued" if job.status == "running" else "cancelled"
+                job.owner = None
+                session.add(job)
+            session.commit()
+
+    async def _call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run blocking database or file access in a thread.
+
+        Cancelling the caller does not stop the thread, so the calls still
+        running are tracked for :meth:`stop` to wait for.
+        """
+        future = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+        self._calls.add(future)
+        future.add_done_callback(self._calls.discard)
+        return await asyncio.shield(future)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # The engine may be disposed next, which must not happen mid-query
+        await asyncio.gather(*self._calls, return_exceptions=True)
+
+    def _claim(self, job_id: str) -> bool:
+        """Mark a queued job as running in this process.
+
+        The update only matches while the job is still queued, so of several
+        processes claiming the same job exactly one succeeds.
+        """
+        with Session(self.engine) as session:
+            result = session.exec(
+                update(BatchJob)
+                .where(BatchJob.id == job_id, BatchJob.status == "queued")
+                .values(status="running", owner=self.owner)
+            )
+            session.commit()
+            return result.rowcount == 1
+
+    def _next_job(self) -> Optional[str]:
+        with Session(self.engine) as session:
+            query = (
+                select(BatchJob.id)
+                .where(BatchJob.status == "queued")
+                .order_by(BatchJob.created_at)
+            )
+            job_ids = session.exec(query).all()
+        for job_id in job_ids:
+            if self._claim(job_id):
+                return job_id
+        return None
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._call(self._requeue_interrupted)
+                job_id = await self._call(self._next_job)
+            except Exception as exc:
+                logger.exception("Cannot load batch jobs: %s", exc)
+                job_id = None
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.idle_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.process(job_id)
+            except Exception as exc:
+                logger.exception("Batch job %s failed: %s", job_id, exc)
+                self._cancelled.discard(job_id)
+                await self._call(
+                    self._update,
+                    job_id,
+                    status="failed",
+                    error=str(exc),
+                    finished_at=time.time(),
+                    owner=None,
+                )
+
+    def _read_results(self, job_id: str) -> Tuple[Set[str], int, int, int]:
+        """Return ``(done_ids, completed, failed, tokens)`` of earlier runs.
+
+        A partial last line left by an interrupted write is removed.
+        """
+        path = self.output_path(job_id)
+        done: Set[str] = set()
+        completed = failed = tokens = 0
+        if not path.exists():
+            return done, completed, failed, tokens
+        with path.open("rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            done.add(record["custom_id"])
+            if record.get("error"):
+                failed += 1
+            else:
+                completed += 1
+                usage = record["response"]["body"].get("usage") or {}
+                tokens += usage.get("completion_tokens", 0)
+        return done, completed, failed, tokens
+
+    def _pending(self, f: BinaryIO, done: Set[str]) -> Iterator[Tuple[str, dict]]:
+        for index, line in enumerate(f):
+            request = json.loads(line)
+            custom_id = request.get("custom_id") or f"request-{index}"
+            if custom_id not in done:
+                yield custom_id, request
+
+    async def _answer(self, custom_id: str, request: dict) -> Tuple[dict, int]:
+        url = request.get("url", DEFAULT_URL)
+        record: Dict[str, Any] = {"custom_id": custom_id, "response": None}
+        try:
+            body = await self.handle(url, request["body"])
+        except Exception as exc:
+            code = getattr(exc, "status_code", 500)
+            message = getattr(exc, "detail", None) or str(exc) or type(exc).__name__
+            record["error"] = {"status_code": code, "message": message}
+            BATCH_REQUESTS.inc(labels=("error",))
+            return record, 0
+        record["response"] = {"status_code": 200, "body": body}
+        record["error"] = None
+        BATCH_REQUESTS.inc(labels=("ok",))
+        usage = body.get("usage") or {}
+        return record, usage.get("completion_tokens", 0)
+
+    async def _wait_turn(self) -> None:
+        while self.busy is not None and self.busy():
+            await asyncio.sleep(self.poll_interval)
+
+    async def process(self, job_id: str) -> BatchJob:
+        """Run the remaining requests of a job and return its final state.
+
+        Database and file access runs in threads so the event loop keeps
+        serving interactive requests.
+        """
+        done, completed, failed, tokens = await self._call(self._read_results, job_id)
+        job = await self._call(self.get, job_id)
+        now = time.time()
+        await self._call(
+            self._update,
+            job_id,
+            status="running",
+            owner=self.owner,
+            started_at=job.started_at or now,
+            completed=completed,
+            failed=failed,
+            output_tokens=tokens,
+        )
+        elapsed = job.elapsed
+        run_start = time.perf_counter()
+        last_save = run_start
+        # Workers take turns reading the input and writing the output
+        reading = asyncio.Lock()
+        writing = asyncio.Lock()
+
+        async def save(**fields: Any) -> BatchJob:
+            job = await self._call(
+                self._update,
+                job_id,
+                completed=completed,
+                failed=failed,
+                output_tokens=tokens,
+                elapsed=elapsed + time.perf_counter() - run_start,
+                **fields,
+            )
+            if job.status == "cancelling":
+                # Cancelled through another process
+                self._cancelled.add(job_id)
+            return job
+
+        source = await self._call(self.input_path(job_id).open, "rb")
+        pending = self._pending(source, done)
+        out = await self._call(self.output_path(job_id).open, "a", buffering=1)
+        try:
+
+            async def worker() -> None:
+                nonlocal completed, failed, tokens, last_save
+                while job_id not in self._cancelled:
+                    await self._wait_turn()
+                    if job_id in self._cancelled:
+                        return
+                    async with reading:
+                        item = await self._call(next, pending, None)
+                    if item is None:
+                        return
+                    record, used = await self._answer(*item)
+                    line = json.dumps(record, separators=(",", ":")) + "\n"
+                    async with writing:
+                        await self._call(out.write, line)
+                    if record["error"]:
+                        failed += 1
+                    else:
+                        completed += 1
+                        tokens += used
+                    now = time.perf_counter()
+                    if now - last_save >= self.progress_interval:
+                        last_save = now
+                        await save()
+
+            try:
+                await asyncio.gather(*(worker() for _ in range(self.workers)))
+            except asyncio.CancelledError:
+                # Shut down mid-job, hand the job to the next runner
+                if job_id in self._cancelled:
+                    self._cancelled.discard(job_id)
+                    await save(status="cancelled", finished_at=time.time(), owner=None)
+                else:
+                    await save(status="queued", owner=None)
+                raise
+        finally:
+            # Closing waits for a read or write still running in a thread
+            source.close()
+            out.close()
+        if job_id in self._cancelled:
+            self._cancelled.discard(job_id)
+            return await save(status="cancelled", finished_at=time.time(), owner=None)
+        return await save(status="completed", finished_at=time.time(), owner=None)
+
+
+def submit_batch(client: httpx.Client, path: Path) -> Dict[str, Any]:
+    """Upload the JSONL file at ``path`` and return the created job."""
+    with path.open("rb") as f:
+        resp = client.post(
+            "/v1/batches", content=f, headers={"Content-Type": "application/jsonl"}
+        )
+    resp.raise_for_status()
+    return resp.json()
+
+
+def wait_for_batch(
+    client: httpx.Client,
+    job_id: str,
+    *,
+    poll_interval: float = 1.0,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Poll a job until it is completed, cancelled or failed."""
+    while True:
+        resp = client.get(f"/v1/batches/{job_id}")
+        resp.raise_for_status()
+        job = resp.json()
+        if on_progress is not None:
+            on_progress(job)
+        if job["status"] in FINAL_STATUSES:
+            return job
+        time.sleep(poll_interval)
+
+
+def format_progress(job: Dict[str, Any]) -> str:
+    counts = job["request_counts"]
+    stats = job["stats"]
+    done = counts["completed"] + counts["failed"]
+    return (
+        f"{job['id']} {job['status']}: {done}/{counts['total']} requests"
+        f" ({counts['failed']} failed), {stats['requests_per_second']} req/s,"
+        f" {stats['tokens_per_second']} tok/s"
+    )
@@ -0,0 +1,240 @@
+"""Load generator for measuring Moogla deployments."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+
+ENDPOINTS = {
+    "chat": "/v1/chat/completions",
+    "completions": "/v1/completions",
+}
+
+
+@dataclass
+class BenchConfig:
+    """Parameters of a benchmark run."""
+
+    url: str = "http://localhost:11434"
+    endpoint: str = "chat"
+    requests: int = 100
+    concurrency: int = 8
+    rate: Optional[float] = None
+    stream: bool = False
+    prompt: str = "Hello"
+    max_tokens: Optional[int] = None
+    api_key: Optional[str] = None
+    timeout: float = 60.0
+    seed: Optional[int] = None
+
+
+@dataclass
+class RequestResult:
+    """Timing information for one request."""
+
+    ok: bool
+    status: int
+    latency: float
+    ttft: Optional[float] = None
+    itl: List[float] = field(default_factory=list)
+    tokens: int = 0
+    error: Optional[str] = None
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Return the ``pct`` percentile of ``values`` using linear interpolation."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * pct / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+def distribution(values: Sequence[float]) -> Dict[str, float]:
+    return {
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def build_payload(config: BenchConfig) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {"stream": config.stream}
+    if config.endpoint == "chat":
+        payload["messages"] = [{"role": "user", "content": config.prompt}]
+    else:
+        payload["prompt"] = config.prompt
+    if config.max_tokens is not None:
+        payload["max_tokens"] = config.max_tokens
+    return payload
+
+
+async def send_request(
+    client: httpx.AsyncClient, path: str, payload: Dict[str, Any]
+) -> RequestResult:
+    """Issue one request and measure its latency profile."""
+    start = time.perf_counter()
+    try:
+        if not payload.get("stream"):
+            resp = await client.post(path, json=payload)
+            latency = time.perf_counter() - start
+            return RequestResult(
+                ok=resp.status_code == 200,
+                status=resp.status_code,
+                latency=latency,
+                ttft=latency,
+                error=None if resp.status_code == 200 else resp.text[:200],
+            )
+        result = RequestResult(ok=False, status=0, latency=0.0)
+        last = start
+        async with client.stream("POST", path, json=payload) as resp:
+            result.status = resp.status_code
+            if resp.status_code != 200:
+                await resp.aread()
+                result.error = resp.text[:200]
+            else:
+                async for line in resp.aiter_lines():
+                    if not line.strip():
+                        continue
+                    now = time.perf_counter()
+                    try:
+                        chunk = json.loads(line)
+                    except ValueError:
+                        continue
+                    choices = chunk.get("choices")
+                    if not choices or not choices[0].get("delta", {}).get("content"):
+                        continue
+                    if result.ttft is None:
+                        result.ttft = now - start
+                    else:
+                        result.itl.append(now - last)
+                    last = now
+                    result.tokens += 1
+        result.latency = time.perf_counter() - start
+        result.ok = result.status == 200
+        return result
+    except Exception as exc:
+        return RequestResult(
+            ok=False,
+            status=0,
+            latency=time.perf_counter() - start,
+            error=f"{type(exc).__name__}: {exc}",
+        )
+
+
+async def run_benchmark(
+    config: BenchConfig, *, transport: Optional[httpx.AsyncBaseTransport] = None
+) -> Dict[str, Any]:
+    """Drive the server according to ``config`` and return a report.
+
+    Without ``rate`` a closed loop of ``concurrency`` workers sends requests
+    back to back. With ``rate`` requests are started open loop following a
+    Poisson process of that many requests per second.
+    """
+    if config.endpoint not in ENDPOINTS:
+        raise ValueError(f"Unknown endpoint '{config.endpoint}'")
+    path = ENDPOINTS[config.endpoint]
+    payload = build_payload(config)
+    headers = {"X-API-Key": config.api_key} if config.api_key else {}
+    limits = httpx.Limits(
+        max_connections=max(config.concurrency, 1) if config.rate is None else None
+    )
+    results: List[RequestResult] = []
+    async with httpx.AsyncClient(
+        base_url=config.url.rstrip("/"),
+        headers=headers,
+        timeout=config.timeout,
+        limits=limits,
+        transport=transport,
+    ) as client:
+        start = time.perf_counter()
+        if config.rate:
+            rng = random.Random(config.seed)
+            tasks = []
+            for _ in range(config.requests):
+                tasks.append(asyncio.create_task(send_request(client, path, payload)))
+                await asyncio.sleep(rng.expovariate(config.rate))
+            results = list(await asyncio.gather(*tasks))
+        else:
+            remaining = config.requests
+
+            async def worker() -> None:
+                nonlocal remaining
+                while remaining > 0:
+                    remaining -= 1
+                    results.append(await send_request(client, path, payload))
+
+            await asyncio.gather(
+                *(worker() for _ in range(max(1, min(config.concurrency, remaining))))
+            )
+        elapsed = time.perf_counter() - start
+    return summarize(results, elapsed, config)
+
+
+def summarize(
+    results: Sequence[RequestResult],
+    elapsed: float,
+    config: Optional[BenchConfig] = None,
+) -> Dict[str, Any]:
+    """Aggregate request results into a JSON serializable report."""
+    ok = [r for r in results if r.ok]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if not r.ok:
+            key = str(r.status) if r.status else (r.error or "error").split(":")[0]
+            errors[key] = errors.get(key, 0) + 1
+    tokens = sum(r.tokens for r in ok)
+    report: Dict[str, Any] = {
+        "requests": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "error_rate": (len(results) - len(ok)) / len(results) if results else 0.0,
+        "errors": errors,
+        "duration": elapsed,
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+        "tokens_per_second": tokens / elapsed if elapsed else 0.0,
+        "latency": distribution([r.latency for r in ok]),
+        "ttft": distribution([r.ttft for r in ok if r.ttft is not None]),
+        "itl": distribution([d for r in ok for d in r.itl]),
+    }
+    if config is not None:
+        report["config"] = {
+            "endpoint": config.endpoint,
+            "stream": config.stream,
+            "concurrency": config.concurrency,
+            "rate": config.rate,
+            "requests": config.requests,
+        }
+    return report
+
+
+def format_table(report: Dict[str, Any]) -> str:
+    """Render a report as a plain text table with latencies in milliseconds."""
+    lines = [
+        f"requests     {report['requests']} "
+        f"({report['failed']} failed, {report['error_rate']:.1%} error rate)",
+        f"duration     {report['duration']:.2f}s",
+        f"throughput   {report['throughput_rps']:.2f} req/s, "
+        f"{report['tokens_per_second']:.2f} tokens/s",
+        "",
+        f"{'metric':<10}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}",
+    ]
+    for name in ("ttft", "itl", "latency"):
+        dist = report[name]
+        cells = "".join(
+            f"{dist[k] * 1000:>10.1f}" for k in ("mean", "p50", "p90", "p99", "max")
+        )
+        lines.append(f"{name:<10}{cells}")
+    for key, count in sorted(report["errors"].items()):
+        lines.append(f"error {key}: {count}")
+    return "\n".join(lines)
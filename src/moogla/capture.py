@@ -0,0 +1,316 @@
+"""Record completion traffic and replay it against a server.
+
+:class:`CaptureMiddleware` appends one compact JSON line per completion
+request to a capture file. Each record holds the arrival time, endpoint,
+prompt size, sampling parameters, stream flag, status and latency. Prompt
+content is handled according to the capture mode:
+
+``redact``
+    Only sizes are stored (default).
+``hash``
+    A digest of the prompt is stored so repeated prompts stay recognizable.
+``full``
+    The prompt itself is stored.
+
+:func:`replay` re-issues a captured workload at its original pacing, or
+scaled by ``speed``, and compares the latency distributions.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from . import bench
+
+CAPTURE_MODES = ("redact", "hash", "full")
+CAPTURE_PATHS = {
+    "/v1/chat/completions": "chat",
+    "/v1/completions": "completions",
+}
+_PARAMS = ("max_tokens", "temperature", "top_p", "n", "stop")
+_FILLER = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do "
+
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def describe_request(endpoint: str, body: Any, mode: str) -> Dict[str, Any]:
+    """Return the captured fields of a completion request body."""
+    if not isinstance(body, dict):
+        return {"chars": 0}
+    record: Dict[str, Any] = {"stream": bool(body.get("stream"))}
+    for param in _PARAMS:
+        if body.get(param) is not None:
+            record[param] = body[param]
+    if endpoint == "chat":
+        messages = [m for m in body.get("messages") or [] if isinstance(m, dict)]
+        contents = [str(m.get("content", "")) for m in messages]
+        record["msgs"] = len(messages)
+        text = contents[-1] if contents else ""
+        record["chars"] = sum(len(c) for c in contents)
+        if mode == "full":
+            record["messages"] = [
+                {"role": m.get("role"), "content": c}
+                for m, c in zip(messages, contents)
+            ]
+    else:
+        prompt = body.get("prompt", "")
+        batch = isinstance(prompt, list)
+        prompts = [str(p) for p in prompt] if batch else [str(prompt)]
+        text = "".join(prompts)
+        record["chars"] = len(text)
+        if batch:
+            record["prompts"] = len(prompts)
+        if mode == "full":
+            record["prompt"] = prompts if batch else prompts[0]
+    if mode == "hash":
+        record["sha"] = _digest(text)
+    return record
+
+
+class CaptureWriter:
+    """Append capture records to ``path`` one JSON line at a time.
+
+    Records are queued and written by a background thread so requests never
+    wait on the disk. The file is opened with ``O_APPEND`` and every record is
+    written with a single ``write`` call, so several server processes may
+    share one file.
+    """
+
+    def __init__(self, path: Path | str, mode: str = "redact") -> None:
+        if mode not in CAPTURE_MODES:
+            raise ValueError(f"Unknown capture mode '{mode}'")
+        self.path = Path(path)
+        self.mode = mode
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd: Optional[int] = os.open(
+            self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600
+        )
+        self._queue: "queue.SimpleQueue[Optional[bytes]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """Queue ``record`` for the writer thread."""
+        if self._fd is None:
+            return
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        if self._thread is None or self._pid != os.getpid():
+            # Forked workers do not inherit the thread and start their own
+            self._queue = queue.SimpleQueue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="moogla-capture", daemon=True
+            )
+            self._thread.start()
+        self._queue.put(line.encode("utf-8"))
+
+    def _run(self) -> None:
+        while True:
+            data = self._queue.get()
+            if data is None or self._fd is None:
+                return
+            try:
+                os.write(self._fd, data)
+            except OSError:  # pragma: no cover - disk full or similar
+                pass
+
+    def close(self) -> None:
+        """Write the queued records and close the file."""
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class CaptureMiddleware:
+    """ASGI middleware recording completion requests with a :class:`CaptureWriter`.
+
+    The request body is copied as the application reads it, so the
+    middleware does not read it ahead of the application. The copy is
+    parsed once the response has been sent.
+    """
+
+    def __init__(self, app: Any, writer: CaptureWriter) -> None:
+        self.app = app
+        self.writer = writer
+
+    async def __call__(self, scope, receive, send) -> None:
+        endpoint = CAPTURE_PATHS.get(scope.get("path", ""))
+        if scope["type"] != "http" or endpoint is None:
+            await self.app(scope, receive, send)
+            return
+        arrived = time.time()
+        start = time.perf_counter()
+        chunks: List[bytes] = []
+        status = 500
+        first_byte: Optional[float] = None
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunks.append(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message) -> None:
+            nonlocal status, first_byte
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and first_byte is None:
+                first_byte = time.perf_counter() - start
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            try:
+                body = json.loads(b"".join(chunks) or b"null")
+            except ValueError:
+                body = None
+            record: Dict[str, Any] = {
+                "t": round(arrived, 4),
+                "ep": endpoint,
+                "status": status,
+                "latency": round(time.perf_counter() - start, 6),
+            }
+            if first_byte is not None:
+                record["ttfb"] = round(first_byte, 6)
+            record.update(describe_request(endpoint, body, self.writer.mode))
+            self.writer.write(record)
+
+
+def read_capture(path: Path | str) -> Iterator[Dict[str, Any]]:
+    """Yield the records of a capture file, skipping truncated lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get("ep") in ("chat", "completions"):
+                yield record
+
+
+def _filler(seed: str, length: int) -> str:
+    """Return deterministic text of ``length`` characters derived from ``seed``."""
+    if length <= 0:
+        return ""
+    offset = int(_digest(seed), 16) % len(_FILLER)
+    repeats = (offset + length) // len(_FILLER) + 1
+    return (_FILLER * repeats)[offset : offset + length]
+
+
+def build_replay_payload(record: Dict[str, Any], index: int = 0) -> Dict[str, Any]:
+    """Reconstruct a request body from a capture record.
+
+    Redacted prompts are replaced by filler text of the recorded size. Hashed
+    prompts use filler derived from the digest so repeated prompts repeat.
+    """
+    payload: Dict[str, Any] = {"stream": bool(record.get("stream"))}
+    for param in _PARAMS:
+        if record.get(param) is not None:
+            payload[param] = record[param]
+    seed = record.get("sha") or f"request-{index}"
+    if record["ep"] == "chat":
+        if "messages" in record:
+            payload["messages"] = record["messages"]
+        else:
+            text = _filler(seed, record.get("chars", 0))
+            payload["messages"] = [{"role": "user", "content": text}]
+    elif record.get("prompt"):
+        payload["prompt"] = record["prompt"]
+    elif "prompts" in record:
+        count = max(record["prompts"], 1)
+        size = record.get("chars", 0) // count
+        payload["prompt"] = [_filler(f"{seed}-{i}", size) for i in range(count)]
+    else:
+        payload["prompt"] = _filler(seed, record.get("chars", 0))
+    return payload
+
+
+async def replay(
+    records: List[Dict[str, Any]],
+    url: str,
+    *,
+    speed: float = 1.0,
+    api_key: Optional[str] = None,
+    timeout: float = 60.0,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> Dict[str, Any]:
+    """Re-issue ``records`` against ``url`` and compare latencies.
+
+    Requests start open loop at their captured offsets divided by ``speed``.
+    ``speed=0`` sends every request immediately.
+    """
+    if speed < 0:
+        raise ValueError("speed must not be negative")
+    records = sorted(records, key=lambda r: r.get("t", 0.0))
+    origin = records[0].get("t", 0.0) if records else 0.0
+    headers = {"X-API-Key": api_key} if api_key else {}
+    async with httpx.AsyncClient(
+        base_url=url.rstrip("/"),
+        headers=headers,
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=None),
+        transport=transport,
+    ) as client:
+        start = time.perf_counter()
+        tasks = []
+        for i, record in enumerate(records):
+            if speed:
+                delay = (record.get("t", origin) - origin) / speed
+                wait = start + delay - time.perf_counter()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            path = bench.ENDPOINTS[record["ep"]]
+            payload = build_replay_payload(record, i)
+            tasks.append(asyncio.create_task(bench.send_request(client, path, payload)))
+        results = list(await asyncio.gather(*tasks))
+        elapsed = time.perf_counter() - start
+
+    captured = [r for r in records if r.get("status") == 200]
+    span = records[-1].get("t", origin) - origin if records else 0.0
+    return {
+        "captured": {
+            "requests": len(records),
+            "succeeded": len(captured),
+            "duration": span,
+            "latency": bench.distribution([r["latency"] for r in captured]),
+            "ttfb": bench.distribution([r["ttfb"] for r in captured if "ttfb" in r]),
+        },
+        "replayed": bench.summarize(results, elapsed),
+        "speed": speed,
+    }
+
+
+def format_comparison(report: Dict[str, Any]) -> str:
+    """Render captured and replayed latency percentiles side by side in ms."""
+    captured, replayed = report["captured"], report["replayed"]
+    lines = [
+        f"requests     {replayed['requests']} replayed "
+        f"({replayed['failed']} failed) at {report['speed']:g}x speed",
+        f"duration     {captured['duration']:.2f}s captured, "
+        f"{replayed['duration']:.2f}s replayed",
+        "",
+        f"{'latency':<10}{'captured':>12}{'replayed':>12}{'change':>10}",
+    ]
+    for key in ("mean", "p50", "p90", "p99", "max"):
+        old = captured["latency"][key]
+        new = replayed["latency"][key]
+        change = f"{(new - old) / old:+.1%}" if old else "-"
+        lines.append(f"{key:<10}{old * 1000:>12.1f}{new * 1000:>12.1f}{change:>10}")
+    return "\n".join(lines)
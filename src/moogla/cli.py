@@ -1,3 +1,5 @@
+import asyncio
+import json
 import logging
 import os
 from pathlib import Path
@@ -8,7 +10,7 @@ import httpx
 import typer
 from dotenv import load_dotenv
 
-from . import __version__, plugins_config
+from . import __version__, batches, bench, capture, plugins_config
 from .config import Settings
 from .server import start_server
 
@@ -60,10 +62,27 @@ def plugin_add(
     typer.echo(f"Added {name}")
 
 
+@plugin_app.command("apply")
+def plugin_apply(manifest: Path) -> None:
+    """Apply a YAML or JSON manifest of plugin changes in one update.
+
+    The manifest may contain ``clear: true``, a ``remove`` list of plugin
+    names and an ``add`` list of names or ``{name, settings}`` entries.
+    """
+    try:
+        changes = plugins_config.apply_manifest(plugins_config.load_manifest(manifest))
+    except RuntimeError as exc:
+        typer.echo(str(exc), err=True)
+        raise typer.Exit(code=1)
+    typer.echo(f"Applied {changes} change(s)")
+
+
 @plugin_app.command("remove")
 def plugin_remove(name: str) -> None:
     """Remove a plugin from the store."""
-    plugins_config.remove_plugin(name)
+    if not plugins_config.remove_plugin(name):
+        typer.echo(f"Plugin not configured: {name}")
+        raise typer.Exit(code=1)
     typer.echo(f"Removed {name}")
 
 
@@ -211,6 +230,75 @@ def serve(
         envvar="MOOGLA_TOKEN_EXP_MINUTES",
         show_default=False,
     ),
+    workers: int = typer.Option(
+        None,
+        "--workers",
+        "-w",
+        min=1,
+        help="Number of worker processes sharing the loaded model",
+        envvar="MOOGLA_WORKERS",
+        show_default=False,
+    ),
+    max_requests: int = typer.Option(
+        None,
+        "--max-requests",
+        min=1,
+        help="Restart a worker after it has served this many requests",
+        envvar="MOOGLA_MAX_REQUESTS",
+        show_default=False,
+    ),
+    uds: str = typer.Option(
+        None,
+        "--uds",
+        help="Listen on this Unix domain socket instead of host and port",
+        envvar="MOOGLA_UDS",
+        show_default=False,
+    ),
+    fd: int = typer.Option(
+        None,
+        "--fd",
+        help="Serve an already listening socket from this file descriptor",
+        envvar="MOOGLA_FD",
+        show_default=False,
+    ),
+    loop: str = typer.Option(
+        None,
+        "--loop",
+        help="Event loop: auto, asyncio or uvloop",
+        envvar="MOOGLA_LOOP",
+        show_default=False,
+    ),
+    http: str = typer.Option(
+        None,
+        "--http",
+        help="HTTP implementation: auto, h11 or httptools",
+        envvar="MOOGLA_HTTP",
+        show_default=False,
+    ),
+    backlog: int = typer.Option(
+        None,
+        "--backlog",
+        min=1,
+        help="Maximum number of pending connections",
+        envvar="MOOGLA_BACKLOG",
+        show_default=False,
+    ),
+    keepalive_timeout: int = typer.Option(
+        None,
+        "--keepalive-timeout",
+        min=0,
+        help="Seconds to keep idle connections open",
+        envvar="MOOGLA_KEEPALIVE_TIMEOUT",
+        show_default=False,
+    ),
+    limit_concurrency: int = typer.Option(
+        None,
+        "--limit-concurrency",
+        min=1,
+        help="Answer 503 above this many concurrent connections and requests",
+        envvar="MOOGLA_LIMIT_CONCURRENCY",
+        show_default=False,
+    ),
 ):
     """Start the Moogla HTTP server.
 
@@ -220,6 +308,8 @@ def serve(
     port: TCP port to listen on.
     plugin: Optional plugin modules to initialize.
     db_url: Optional database connection string.
+    workers: Number of forked worker processes.
+    uds: Optional Unix domain socket path to listen on.
 
     The completion endpoints accept optional ``max_tokens``, ``temperature``
     and ``top_p`` fields to control generation.
@@ -239,9 +329,49 @@ def serve(
         log_level=log_level,
         cors_origins=cors_origins,
         token_exp_minutes=token_exp_minutes,
+        workers=workers,
+        max_requests=max_requests,
+        uds=uds,
+        fd=fd,
+        loop=loop,
+        http=http,
+        backlog=backlog,
+        keepalive_timeout=keepalive_timeout,
+        limit_concurrency=limit_concurrency,
     )
 
 
+@app.command("synthetic-server")
+def synthetic_server(
+    host: str = typer.Option("127.0.0.1", "--host", help="IP or hostname to bind"),
+    port: int = typer.Option(
+        8001, "--port", help="TCP port to listen on", show_default=True
+    ),
+    model: str = typer.Option(
+        "synthetic",
+        "--model",
+        help="Synthetic model spec, e.g. synthetic:token_ms=10,jitter=0.1",
+        show_default=True,
+    ),
+) -> None:
+    """Run a local OpenAI compatible server backed by the synthetic model.
+
+    Point ``moogla serve --api-base http://HOST:PORT/v1`` at it to load test
+    the remote client path without network access.
+    """
+    import uvicorn
+
+    from .synthetic import SyntheticBackend, create_openai_app, is_synthetic
+
+    if not is_synthetic(model):
+        raise typer.BadParameter("Model must start with 'synthetic'")
+    try:
+        backend = SyntheticBackend.from_spec(model)
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc))
+    uvicorn.run(create_openai_app(backend), host=host, port=port)
+
+
 @app.command()
 def pull(
     model: str,
@@ -369,6 +499,195 @@ def reload_plugins(
         typer.echo("Plugins reloaded")
 
 
+@app.command("bench")
+def bench_command(
+    url: str = typer.Option(
+        "http://localhost:11434",
+        "--url",
+        help="Base URL of the server to benchmark",
+        show_default=True,
+    ),
+    endpoint: str = typer.Option(
+        "chat",
+        "--endpoint",
+        help="Endpoint to drive: chat or completions",
+        show_default=True,
+    ),
+    requests: int = typer.Option(
+        100, "--requests", "-n", help="Total number of requests", show_default=True
+    ),
+    concurrency: int = typer.Option(
+        8, "--concurrency", "-c", help="Requests in flight", show_default=True
+    ),
+    rate: float = typer.Option(
+        None,
+        "--rate",
+        help="Open-loop arrival rate in requests per second",
+        show_default=False,
+    ),
+    stream: bool = typer.Option(
+        False, "--stream/--no-stream", help="Use streaming responses"
+    ),
+    prompt: str = typer.Option(
+        "Hello", "--prompt", help="Prompt text to send", show_default=True
+    ),
+    max_tokens: int = typer.Option(
+        None, "--max-tokens", help="max_tokens sent with each request"
+    ),
+    api_key: str = typer.Option(
+        None,
+        "--api-key",
+        help="API key for server access",
+        envvar="MOOGLA_API_KEY",
+        show_default=False,
+    ),
+    seed: int = typer.Option(None, "--seed", help="Seed for open-loop arrivals"),
+    output: Path = typer.Option(
+        None, "--output", "-o", help="Write the JSON report to this file"
+    ),
+    as_json: bool = typer.Option(False, "--json", help="Print the report as JSON"),
+) -> None:
+    """Benchmark a running server and report latency and throughput.
+
+    Time to first token, inter-token latency and end-to-end latency are
+    reported as mean, p50, p90, p99 and max in milliseconds.
+    """
+    config = bench.BenchConfig(
+        url=url,
+        endpoint=endpoint,
+        requests=requests,
+        concurrency=concurrency,
+        rate=rate,
+        stream=stream,
+        prompt=prompt,
+        max_tokens=max_tokens,
+        api_key=api_key,
+        seed=seed,
+    )
+    try:
+        report = asyncio.run(bench.run_benchmark(config))
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc))
+    if output:
+        output.write_text(json.dumps(report, indent=2))
+    if as_json:
+        typer.echo(json.dumps(report, indent=2))
+    else:
+        typer.echo(bench.format_table(report))
+
+
+@app.command("replay")
+def replay_command(
+    capture_file: Path = typer.Argument(..., help="Capture file to replay"),
+    url: str = typer.Option(
+        "http://localhost:11434",
+        "--url",
+        help="Base URL of the server to replay against",
+        show_default=True,
+    ),
+    speed: float = typer.Option(
+        1.0,
+        "--speed",
+        help="Replay speed multiplier; 0 sends all requests at once",
+        show_default=True,
+    ),
+    limit: int = typer.Option(
+        None, "--limit", "-n", help="Replay only the first N requests"
+    ),
+    api_key: str = typer.Option(
+        None,
+        "--api-key",
+        help="API key for server access",
+        envvar="MOOGLA_API_KEY",
+        show_default=False,
+    ),
+    output: Path = typer.Option(
+        None, "--output", "-o", help="Write the JSON report to this file"
+    ),
+    as_json: bool = typer.Option(False, "--json", help="Print the report as JSON"),
+) -> None:
+    """Replay captured traffic and compare latencies with the capture.
+
+    Capture traffic by starting the server with ``MOOGLA_CAPTURE_FILE`` set.
+    """
+    try:
+        records = list(capture.read_capture(capture_file))
+    except OSError as exc:
+        typer.echo(f"Cannot read capture: {exc}", err=True)
+        raise typer.Exit(code=1)
+    if limit is not None:
+        records = records[:limit]
+    if not records:
+        typer.echo("No requests to replay", err=True)
+        raise typer.Exit(code=1)
+    try:
+        report = asyncio.run(capture.replay(records, url, speed=speed, api_key=api_key))
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc))
+    if output:
+        output.write_text(json.dumps(report, indent=2))
+    if as_json:
+        typer.echo(json.dumps(report, indent=2))
+    else:
+        typer.echo(capture.format_comparison(report))
+
+
+@app.command("batch")
+def batch_command(
+    input_file: Path = typer.Argument(..., help="JSONL file of requests"),
+    url: str = typer.Option(
+        "http://localhost:11434",
+        "--url",
+        help="Base URL of the running server",
+        show_default=True,
+    ),
+    api_key: str = typer.Option(
+        None,
+        "--api-key",
+        help="API key for server access",
+        envvar="MOOGLA_API_KEY",
+        show_default=False,
+    ),
+    wait: bool = typer.Option(
+        True, "--wait/--no-wait", help="Wait for the job to finish"
+    ),
+    output: Path = typer.Option(
+        None, "--output", "-o", help="Write the results to this file"
+    ),
+    poll_interval: float = typer.Option(
+        2.0, "--poll-interval", help="Seconds between progress checks"
+    ),
+) -> None:
+    """Submit a batch job and wait for its results.
+
+    Each line of the input file holds one request with an optional
+    ``custom_id``, the endpoint ``url`` and the request ``body``.
+    """
+    headers = {"X-API-Key": api_key} if api_key else {}
+    with httpx.Client(base_url=url, headers=headers, timeout=60.0) as client:
+        try:
+            job = batches.submit_batch(client, input_file)
+            total = job["request_counts"]["total"]
+            typer.echo(f"Submitted {job['id']} with {total} requests")
+            if not wait:
+                return
+            job = batches.wait_for_batch(
+                client,
+                job["id"],
+                poll_interval=poll_interval,
+                on_progress=lambda job: typer.echo(batches.format_progress(job)),
+            )
+            if output:
+                resp = client.get(f"/v1/batches/{job['id']}/output")
+                resp.raise_for_status()
+                output.write_bytes(resp.content)
+        except (OSError, httpx.HTTPError) as exc:
+            typer.echo(f"Batch failed: {exc}", err=True)
+            raise typer.Exit(code=1)
+    if job["status"] != "completed":
+        raise typer.Exit(code=1)
+
+
 @app.command()
 def remove(
     model: str,
@@ -21,6 +21,9 @@ class Settings(BaseSettings):
     )
     db_url: str = Field("sqlite:///:memory:", validation_alias="MOOGLA_DB_URL")
     plugin_file: Optional[Path] = Field(None, validation_alias="MOOGLA_PLUGIN_FILE")
+    plugin_setup_timeout: Optional[float] = Field(
+        30.0, validation_alias="MOOGLA_PLUGIN_SETUP_TIMEOUT"
+    )
     jwt_secret: str = Field(
         default_factory=lambda: secrets.token_urlsafe(32),
         validation_alias="MOOGLA_JWT_SECRET",
@@ -30,9 +33,72 @@ class Settings(BaseSettings):
         default_factory=lambda: Path.home() / ".cache" / "moogla" / "models",
         validation_alias="MOOGLA_MODEL_DIR",
     )
+    metrics_dir: Optional[Path] = Field(None, validation_alias="MOOGLA_METRICS_DIR")
+    loop_lag_threshold: Optional[float] = Field(
+        0.5, validation_alias="MOOGLA_LOOP_LAG_THRESHOLD"
+    )
+    timing_sample_rate: float = Field(0.0, validation_alias="MOOGLA_TIMING_SAMPLE_RATE")
+    trace_file: Optional[Path] = Field(None, validation_alias="MOOGLA_TRACE_FILE")
+    trace_endpoint: Optional[str] = Field(
+        None, validation_alias="MOOGLA_TRACE_ENDPOINT"
+    )
+    trace_sample_rate: float = Field(1.0, validation_alias="MOOGLA_TRACE_SAMPLE_RATE")
+    capture_file: Optional[Path] = Field(None, validation_alias="MOOGLA_CAPTURE_FILE")
+    capture_mode: str = Field("redact", validation_alias="MOOGLA_CAPTURE_MODE")
     cors_origins: Optional[str] = Field(None, validation_alias="MOOGLA_CORS_ORIGINS")
     log_level: str = Field("INFO", validation_alias="MOOGLA_LOG_LEVEL")
+    log_format: str = Field("text", validation_alias="MOOGLA_LOG_FORMAT")
+    access_log_sample_rate: float = Field(
+        0.0, validation_alias="MOOGLA_ACCESS_LOG_SAMPLE_RATE"
+    )
     host: str = Field("127.0.0.1", validation_alias="MOOGLA_HOST")
     port: int = Field(11434, validation_alias="MOOGLA_PORT")
+    workers: int = Field(1, validation_alias="MOOGLA_WORKERS")
+    batch_max_prompts: int = Field(64, validation_alias="MOOGLA_BATCH_MAX_PROMPTS")
+    batch_concurrency: int = Field(8, validation_alias="MOOGLA_BATCH_CONCURRENCY")
+    batch_dir: Path = Field(
+        default_factory=lambda: Path.home() / ".cache" / "moogla" / "batches",
+        validation_alias="MOOGLA_BATCH_DIR",
+    )
+    batch_workers: int = Field(4, validation_alias="MOOGLA_BATCH_WORKERS")
+    batch_yield_depth: int = Field(1, validation_alias="MOOGLA_BATCH_YIELD_DEPTH")
+    session_max: int = Field(1024, validation_alias="MOOGLA_SESSION_MAX")
+    session_ttl: float = Field(3600.0, validation_alias="MOOGLA_SESSION_TTL")
+    context_window: Optional[int] = Field(
+        None, validation_alias="MOOGLA_CONTEXT_WINDOW"
+    )
+    session_state_cache_mb: int = Field(
+        0, validation_alias="MOOGLA_SESSION_STATE_CACHE_MB"
+    )
+    generation_max: int = Field(256, validation_alias="MOOGLA_GENERATION_MAX")
+    generation_buffer_tokens: int = Field(
+        4096, validation_alias="MOOGLA_GENERATION_BUFFER_TOKENS"
+    )
+    generation_ttl: float = Field(300.0, validation_alias="MOOGLA_GENERATION_TTL")
+    embedding_model: Optional[str] = Field(
+        None, validation_alias="MOOGLA_EMBEDDING_MODEL"
+    )
+    embedding_max_inputs: int = Field(
+        256, validation_alias="MOOGLA_EMBEDDING_MAX_INPUTS"
+    )
+    embedding_batch_size: int = Field(
+        32, validation_alias="MOOGLA_EMBEDDING_BATCH_SIZE"
+    )
+    embedding_batch_wait_ms: float = Field(
+        5.0, validation_alias="MOOGLA_EMBEDDING_BATCH_WAIT_MS"
+    )
+    embedding_cache_size: int = Field(
+        1024, validation_alias="MOOGLA_EMBEDDING_CACHE_SIZE"
+    )
+    ws_max_conversations: int = Field(8, validation_alias="MOOGLA_WS_MAX_CONVERSATIONS")
+    uds: Optional[Path] = Field(None, validation_alias="MOOGLA_UDS")
+    fd: Optional[int] = Field(None, validation_alias="MOOGLA_FD")
+    loop: str = Field("auto", validation_alias="MOOGLA_LOOP")
+    http: str = Field("auto", validation_alias="MOOGLA_HTTP")
+    backlog: int = Field(2048, validation_alias="MOOGLA_BACKLOG")
+    keepalive_timeout: int = Field(75, validation_alias="MOOGLA_KEEPALIVE_TIMEOUT")
+    limit_concurrency: Optional[int] = Field(
+        None, validation_alias="MOOGLA_LIMIT_CONCURRENCY"
+    )
 
     model_config = SettingsConfigDict(env_prefix="")
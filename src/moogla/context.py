@@ -0,0 +1,84 @@
+"""Fit conversation history into the context window of a model.
+
+Token counts are cached by message digest, so a message is tokenized once no
+matter how many turns or sessions send it again. Fitting a conversation then
+only adds up cached counts. System messages are always kept and the oldest
+other turns are dropped first.
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from .cache import LRUCache, text_key
+from .sessions import ROLE_LABELS, Turn
+
+# Fraction of the budget left free when turns are dropped. Trimming past the
+# limit keeps the start of the prompt stable for the next few turns instead
+# of shifting it on every turn, which would defeat prefix caching.
+TRIM_SLACK = 0.25
+
+
+class ContextManager:
+    """Count tokens with a cache and trim turns to a token budget."""
+
+    def __init__(
+        self,
+        count: Callable[[str], int],
+        window: Optional[int] = None,
+        cache_size: int = 4096,
+    ) -> None:
+        self._count = count
+        self.window = window
+        self.cache: LRUCache[int] = LRUCache(cache_size)
+        self._labels: Dict[str, int] = {}
+
+    def count(self, text: str) -> int:
+        """Return the token count of ``text``, tokenizing it only once."""
+        key = text_key(text)
+        tokens = self.cache.get(key)
+        if tokens is None:
+            tokens = self._count(text)
+            self.cache.set(key, tokens)
+        return tokens
+
+    def cost(self, turn: Turn) -> int:
+        """Return the tokens ``turn`` takes in a prompt, role label included."""
+        label = self._labels.get(turn.role)
+        if label is None:
+            text = ROLE_LABELS.get(turn.role, turn.role) + ": "
+            label = self._labels[turn.role] = self._count(text)
+        return turn.tokens + label
+
+    def fit(
+        self, turns: Sequence[Turn], reserve: int = 0, start: int = 0
+    ) -> Tuple[int, int]:
+        """Return ``(start, trimmed)`` for a prompt fitting the window.
+
+        Non-system turns before ``start`` are left out of the prompt and
+        ``trimmed`` is the number of tokens they hold. ``reserve`` tokens are
+        kept free for the reply. A previous ``start`` is only ever moved
+        forward, and the latest turn is always kept.
+        """
+        start = min(start, len(turns))
+        if not self.window:
+            return start, self._trimmed(turns, start)
+        costs = [self.cost(t) for t in turns]
+        fixed = sum(c for t, c in zip(turns[:start], costs) if t.role == "system")
+        budget = self.window - reserve - fixed
+        used = sum(costs[start:])
+        if used > budget:
+            target = budget * (1 - TRIM_SLACK)
+            last = len(turns) - 1
+            while start < last and used > target:
+                used -= costs[start]
+                if turns[start].role == "system":
+                    # Still sent, ahead of the kept turns
+                    budget -= costs[start]
+                    target = budget * (1 - TRIM_SLACK)
+                start += 1
+        return start, self._trimmed(turns, start)
+
+    @staticmethod
+    def _trimmed(turns: Sequence[Turn], start: int) -> int:
+        return sum(t.tokens for t in turns[:start] if t.role != "system")
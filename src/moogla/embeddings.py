@@ -0,0 +1,189 @@
+"""Group concurrent embedding requests into shared backend calls.
+
+Texts from all requests go into one queue. A worker takes up to ``max_batch``
+of them for the same model, waiting at most ``max_wait`` seconds for a batch to
+fill, and embeds them with a single backend call. Vectors are kept as float32
+arrays in an LRU cache keyed by model and input text so repeated inputs skip
+the model.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import contextvars
+import logging
+import sys
+from array import array
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from .cache import LRUCache, text_key
+from .metrics import EMBEDDING_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+EmbedFunc = Callable[[List[str], Optional[str]], Awaitable[List[List[float]]]]
+# Cache key, text and future of a queued text
+Item = Tuple[Tuple[Optional[str], bytes], str, asyncio.Future]
+
+
+def encode_embedding(
+    vector: array, encoding_format: str = "float"
+) -> Union[List[float], str]:
+    """Return ``vector`` as a list of floats or as base64 float32 bytes.
+
+    The base64 form holds little-endian float32 values, as in the OpenAI API.
+    """
+    if encoding_format != "base64":
+        return vector.tolist()
+    if sys.byteorder == "big":
+        vector = array("f", vector)
+        vector.byteswap()
+    return base64.b64encode(vector.tobytes()).decode("ascii")
+
+
+class EmbeddingBatcher:
+    """Embed texts in batches shared between concurrent callers.
+
+    ``embed(texts, model)`` is called with the texts of one batch, which all
+    ask for the same model.
+    """
+
+    def __init__(
+        self,
+        embed: EmbedFunc,
+        max_batch: int = 32,
+        max_wait: float = 0.005,
+        cache_size: int = 1024,
+    ) -> None:
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        self._embed = embed
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.cache: LRUCache[array] = LRUCache(cache_size)
+        self._waiting: Dict[Optional[str], List[Item]] = {}
+        # Futures of texts queued or being embedded, so concurrent requests
+        # for the same text share one computation
+        self._pending: Dict[Tuple[Optional[str], bytes], asyncio.Future] = {}
+        self._ready = asyncio.Event()
+        self._full = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.texts = 0
+
+    async def embed(
+        self, texts: Sequence[str], model: Optional[str] = None
+    ) -> List[array]:
+        """Return a float32 vector per text from ``model``, in order."""
+        loop = asyncio.get_running_loop()
+        vectors: List[Optional[array]] = []
+        futures: Dict[int, asyncio.Future] = {}
+        queued = False
+        for i, text in enumerate(texts):
+            key = (model, text_key(text))
+            vector = self.cache.get(key)
+            vectors.append(vector)
+            if vector is not None:
+                continue
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = loop.create_future()
+                self._waiting.setdefault(model, []).append((key, text, future))
+                queued = True
+            futures[i] = future
+        if queued:
+            self._wake(model)
+        if futures:
+            # Shielded so a caller going away does not cancel work other
+            # callers share
+            results = await asyncio.gather(*map(asyncio.shield, futures.values()))
+            for i, vector in zip(futures, results):
+                vectors[i] = vector
+        return vectors
+
+    def _wake(self, model: Optional[str]) -> None:
+        if self._worker is None or self._worker.done():
+            # Start from an empty context so the worker does not write into
+            # the log record and trace of the first request
+            self._worker = contextvars.Context().run(asyncio.create_task, self._run())
+        self._ready.set()
+        if len(self._waiting[model]) >= self.max_batch:
+            self._full.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._ready.wait()
+            if not self._waiting:
+                self._ready.clear()
+                continue
+            # Models with queued texts take turns
+            model = next(iter(self._waiting))
+            if len(self._waiting[model]) < self.max_batch:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+            waiting = self._waiting.pop(model, [])
+            batch, rest = waiting[: self.max_batch], waiting[self.max_batch :]
+            if rest:
+                self._waiting[model] = rest
+            if not self._waiting:
+                self._ready.clear()
+            if batch:
+                await self._process(model, batch)
+
+    async def _process(self, model: Optional[str], batch: List[Item]) -> None:
+        EMBEDDING_BATCH_SIZE.observe(len(batch))
+        self.batches += 1
+        self.texts += len(batch)
+        try:
+            results = await self._embed([text for _, text, _ in batch], model)
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"Backend returned {len(results)} embeddings "
+                    f"for {len(batch)} inputs"
+                )
+        except Exception as exc:
+            logger.warning("Embedding batch of %d failed: %s", len(batch), exc)
+            for key, _, future in batch:
+                self._pending.pop(key, None)
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (key, _, future), result in zip(batch, results):
+            vector = array("f", result)
+            self.cache.set(key, vector)
+            self._pending.pop(key, None)
+            if not future.done():
+                future.set_result(vector)
+
+    async def close(self) -> None:
+        """Stop the worker and cancel texts still waiting."""
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._waiting.clear()
+        self._ready.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "cache": self.cache.stats(),
+        }
@@ -5,12 +5,19 @@ from __future__ import annotations
 import asyncio
 import logging
 import threading
+import time
 from contextlib import AbstractAsyncContextManager, AbstractContextManager
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 import openai
 
+from .metrics import EXECUTOR_BUSY
+from .stops import StopMatcher, astop_tokens, stop_tokens, truncate
+from .synthetic import SyntheticBackend, is_synthetic
+from .timing import record, timed, timed_stream
+from .tracing import span, trace_headers, traced_stream
+
 logger = logging.getLogger(__name__)
 
 # Default generation parameters
@@ -19,6 +26,66 @@ DEFAULT_TEMPERATURE = 1.0
 DEFAULT_TOP_P = 1.0
 
 
+def _stop_options(stop: Optional[List[str]]) -> dict:
+    """Return the ``stop`` argument for backends that support it natively."""
+    return {"stop": stop} if stop else {}
+
+
+def _sampling_options(temperature: Optional[float], top_p: Optional[float]) -> dict:
+    """Return pipeline arguments sampling with ``temperature`` and ``top_p``.
+
+    Pipelines decode greedily unless asked to sample and would ignore both
+    otherwise. A temperature of zero keeps greedy decoding.
+    """
+    if temperature is None and top_p is None or temperature == 0:
+        return {}
+    options: dict = {"do_sample": True}
+    if temperature is not None:
+        options["temperature"] = temperature
+    if top_p is not None:
+        options["top_p"] = top_p
+    return options
+
+
+def _stop_criteria(tokenizer, stop: List[str]):
+    """Return transformers stopping criteria ending generation at a stop."""
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class StopOnSequences(StoppingCriteria):
+        def __init__(self) -> None:
+            self.matcher = StopMatcher(stop)
+            # Tokens from ``prefix`` to ``read`` were decoded by the previous
+            # step and give the new tokens their context, such as spaces
+            self.prefix: Optional[int] = None
+            self.read = 0
+
+        def __call__(self, input_ids, scores, **kwargs) -> bool:
+            if self.prefix is None:
+                # Called once per new token, so the prompt is all but one
+                self.prefix = self.read = input_ids.shape[-1] - 1
+            ids = input_ids[0, self.prefix :]
+            before = tokenizer.decode(
+                ids[: self.read - self.prefix], skip_special_tokens=True
+            )
+            text = tokenizer.decode(ids, skip_special_tokens=True)
+            # A token may end inside a multi-byte character, wait for the rest
+            if len(text) > len(before) and not text.endswith("\ufffd"):
+                self.matcher.feed(text[len(before) :])
+                self.prefix, self.read = self.read, input_ids.shape[-1]
+            return self.matcher.stopped
+
+    return StoppingCriteriaList([StopOnSequences()])
+
+
+def _truncate_generated(prompt: str, text: str, stop: Optional[List[str]]) -> str:
+    """Cut a pipeline result at a stop sequence after the echoed prompt."""
+    if not stop:
+        return text
+    if text.startswith(prompt):
+        return prompt + truncate(text[len(prompt) :], stop)
+    return truncate(text, stop)
+
+
 class LLMExecutor(AbstractContextManager, AbstractAsyncContextManager):
     """Simple wrapper around the OpenAI client with context manager support."""
 
@@ -31,11 +98,16 @@ class LLMExecutor(AbstractContextManager, AbstractAsyncContextManager):
         self.generator = None
         self.llama = None
         self.async_llama = None
+        self.synthetic: SyntheticBackend | None = None
+        self._embedder = None
+        self._embedder_lock = threading.Lock()
 
         key = api_key
 
         model_path = Path(model)
-        if model_path.exists() or "/" in model:
+        if is_synthetic(model):
+            self.synthetic = SyntheticBackend.from_spec(model)
+        elif model_path.exists() or "/" in model:
             if model_path.suffix in {".gguf", ".ggml", ".bin"}:
                 try:
                     import llama_cpp  # type: ignore
@@ -65,6 +137,52 @@ class LLMExecutor(AbstractContextManager, AbstractAsyncContextManager):
             self.client = openai.OpenAI(api_key=key, base_url=api_base)
             self.async_client = openai.AsyncOpenAI(api_key=key, base_url=api_base)
 
+    def count_tokens(self, text: str) -> int:
+        """Return the number of model tokens in ``text``.
+
+        Backends without a local tokenizer count whitespace separated words.
+        """
+        if self.llama is not None:
+            return len(self.llama.tokenize(text.encode("utf-8"), add_bos=False))
+        if self.generator is not None:
+            return len(self.generator.tokenizer.encode(text, add_special_tokens=False))
+        return len(text.split())
+
+    def context_window(self) -> Optional[int]:
+        """Return the context length of the model if the backend reports it."""
+        if self.llama is not None:
+            return self.llama.n_ctx()
+        if self.generator is not None:
+            config = getattr(self.generator.model, "config", None)
+            for name in ("max_position_embeddings", "n_positions"):
+                value = getattr(config, name, None)
+                if isinstance(value, int):
+                    return value
+        return None
+
+    def enable_state_cache(self, capacity_bytes: int) -> bool:
+        """Keep evaluated prompt states of a local llama model in memory.
+
+        A later prompt extending a cached one, such as the next turn of a
+        session, then only evaluates its new tokens. Returns ``False`` when the
+        backend does not support it.
+        """
+        if self.llama is None:
+            return False
+        import llama_cpp  # type: ignore
+
+        cache_cls = getattr(llama_cpp, "LlamaRAMCache", None)
+        if cache_cls is None:
+            return False
+        self.llama.set_cache(cache_cls(capacity_bytes=capacity_bytes))
+        return True
+
+    @staticmethod
+    def _request_options() -> dict:
+        """Return per-request client options such as trace headers."""
+        headers = trace_headers()
+        return {"extra_headers": headers} if headers else {}
+
     def complete(
         self,
         prompt: str,
@@ -72,31 +190,162 @@ class LLMExecutor(AbstractContextManager, AbstractAsyncContextManager):
         max_tokens: int | None = None,
         temperature: float | None = None,
         top_p: float | None = None,
+        stop: Optional[List[str]] = None,
     ) -> str:
-        """Return a completion for the given prompt."""
+        """Return a completion for the given prompt.
+
+        Generation ends before the first of the ``stop`` sequences.
+        """
         if max_tokens is None:
             max_tokens = DEFAULT_MAX_TOKENS
         if temperature is None:
             temperature = DEFAULT_TEMPERATURE
         if top_p is None:
             top_p = DEFAULT_TOP_P
-        if self.client:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p,
+        with EXECUTOR_BUSY.track():
+            if self.synthetic:
+                if not stop:
+                    return self.synthetic.complete(prompt, max_tokens)
+                tokens = self.synthetic.stream(prompt, max_tokens)
+                return "".join(stop_tokens(tokens, stop))
+            if self.client:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    **_stop_options(stop),
+                    **self._request_options(),
+                )
+                return response.choices[0].message.content
+            if self.generator:
+                options = {}
+                if stop:
+                    options["stopping_criteria"] = _stop_criteria(
+                        self.generator.tokenizer, stop
+                    )
+                result = self.generator(prompt, max_new_tokens=max_tokens, **options)
+                return _truncate_generated(prompt, result[0]["generated_text"], stop)
+            if self.llama:
+                result = self.llama(
+                    prompt, max_tokens=max_tokens, **_stop_options(stop)
+                )
+                return result["choices"][0]["text"]
+            raise RuntimeError("No LLM backend configured")
+
+    def batch(
+        self,
+        prompts: List[str],
+        *,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+        stop: Optional[List[str]] = None,
+    ) -> List[str]:
+        """Return one completion per prompt, in order.
+
+        Hugging Face pipelines generate the whole batch in one call, sampling
+        when ``temperature`` or ``top_p`` is given, and cut the results at
+        ``stop`` afterwards. Other backends complete the prompts one after
+        another.
+        """
+        if not self.generator:
+            options = {"temperature": temperature, "top_p": top_p, "stop": stop}
+            return [
+                self.complete(prompt, max_tokens=max_tokens, **options)
+                for prompt in prompts
+            ]
+        if max_tokens is None:
+            max_tokens = DEFAULT_MAX_TOKENS
+        tokenizer = self.generator.tokenizer
+        if tokenizer.pad_token_id is None:
+            # Batches are padded, which needs a pad token
+            tokenizer.pad_token_id = self.generator.model.config.eos_token_id
+        with EXECUTOR_BUSY.track():
+            results = self.generator(
+                prompts,
+                max_new_tokens=max_tokens,
+                batch_size=len(prompts),
+                **_sampling_options(temperature, top_p),
             )
-            return response.choices[0].message.content
-        if self.generator:
-            result = self.generator(prompt, max_new_tokens=max_tokens)
-            return result[0]["generated_text"]
-        if self.llama:
-            result = self.llama(prompt, max_tokens=max_tokens)
-            return result["choices"][0]["text"]
+        return [
+            _truncate_generated(prompt, result[0]["generated_text"], stop)
+            for prompt, result in zip(prompts, results)
+        ]
+
+    def embed(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """Return one embedding vector per text, in order.
+
+        Local models embed all ``texts`` in a single forward pass. Remote
+        providers are asked for ``model``, defaulting to the completion model.
+        """
+        with EXECUTOR_BUSY.track():
+            if self.synthetic:
+                return self.synthetic.embed(texts)
+            if self.client:
+                response = self.client.embeddings.create(
+                    model=model or self.model,
+                    input=texts,
+                    **self._request_options(),
+                )
+                return [item.embedding for item in response.data]
+            if self.generator:
+                return self._transformers_embed(texts)
+            if self.llama or self.async_llama:
+                response = self._llama_embedder().create_embedding(texts)
+                return [item["embedding"] for item in response["data"]]
         raise RuntimeError("No LLM backend configured")
 
+    def embedding_model(
+        self, model: Optional[str] = None, default: Optional[str] = None
+    ) -> str:
+        """Return the model that embeds texts for a request asking for ``model``.
+
+        Remote providers are asked for ``model``, then ``default``, then the
+        completion model. Local backends only embed with the loaded model and
+        raise :class:`ValueError` when another one is requested.
+        """
+        if self.client:
+            return model or default or self.model
+        if model and model != self.model:
+            raise ValueError(
+                f"Model '{model}' is not available, embeddings use '{self.model}'"
+            )
+        return self.model
+
+    def _transformers_embed(self, texts: List[str]) -> List[List[float]]:
+        """Mean-pool the last hidden states of the pipeline model."""
+        import torch  # type: ignore
+
+        tokenizer = self.generator.tokenizer
+        model = self.generator.model
+        if tokenizer.pad_token_id is None:
+            tokenizer.pad_token_id = model.config.eos_token_id
+        inputs = tokenizer(
+            texts, return_tensors="pt", padding=True, truncation=True
+        ).to(model.device)
+        with torch.no_grad():
+            outputs = model(**inputs, output_hidden_states=True)
+        hidden = outputs.hidden_states[-1]
+        # Padding positions are left out of the mean
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return pooled.float().tolist()
+
+    def _llama_embedder(self):
+        """Return the GGUF model loaded in embedding mode.
+
+        llama.cpp only produces embeddings from a model created with
+        ``embedding=True``, so a second instance is loaded on first use.
+        """
+        with self._embedder_lock:
+            if self._embedder is None:
+                import llama_cpp  # type: ignore
+
+                self._embedder = llama_cpp.Llama(model_path=self.model, embedding=True)
+            return self._embedder
+
     def stream(
         self,
         prompt: str,
@@ -104,112 +353,197 @@ class LLMExecutor(AbstractContextManager, AbstractAsyncContextManager):
         max_tokens: int | None = None,
         temperature: float | None = None,
         top_p: float | None = None,
+        stop: Optional[List[str]] = None,
+    ):
+        """Yield completion tokens for the given prompt.
+
+        The stream ends before the first of the ``stop`` sequences, even when
+        one is split across tokens.
+        """
+        tokens = self._stream(
+            prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            stop=stop,
+        )
+        return stop_tokens(tokens, stop) if stop else tokens
+
+    def _stream(
+        self,
+        prompt: str,
+        *,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+        stop: Optional[List[str]] = None,
     ):
-        """Yield completion tokens for the given prompt."""
         if max_tokens is None:
             max_tokens = DEFAULT_MAX_TOKENS
         if temperature is None:
             temperature = DEFAULT_TEMPERATURE
         if top_p is None:
             top_p = DEFAULT_TOP_P
-        if self.client:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p,
-                stream=True,
-            )
-            for chunk in response:
-                delta = chunk.choices[0].delta.content
-                if delta:
-                    yield delta
-            return
-
-        if self.generator:
-            try:
-                from transformers import TextIteratorStreamer
+        with EXECUTOR_BUSY.track():
+            if self.synthetic:
+                yield from self.synthetic.stream(prompt, max_tokens)
+                return
 
-                streamer = TextIteratorStreamer(
-                    self.generator.tokenizer, skip_prompt=True, skip_special_tokens=True
+            if self.client:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    stream=True,
+                    **_stop_options(stop),
+                    **self._request_options(),
                 )
-                inputs = self.generator.tokenizer(prompt, return_tensors="pt")
-                thread = threading.Thread(
-                    target=self.generator.model.generate,
-                    kwargs={
-                        **inputs,
-                        "max_new_tokens": max_tokens,
-                        "streamer": streamer,
-                    },
-                )
-                thread.start()
-                for text in streamer:
-                    yield text
-                thread.join()
-            except Exception:
-                result = self.generator(prompt, max_new_tokens=max_tokens)
-                yield result[0]["generated_text"]
-            return
+                for chunk in response:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+                return
 
-        if self.llama:
-            result = self.llama(
-                prompt, max_tokens=max_tokens, stream=True
-            )  # type: ignore[arg-type]
-            for chunk in result:
-                text = chunk.get("choices", [{}])[0].get("text")
-                if text:
-                    yield text
-            return
+            if self.generator:
+                try:
+                    from transformers import TextIteratorStreamer
 
-        raise RuntimeError("No LLM backend configured")
+                    streamer = TextIteratorStreamer(
+                        self.generator.tokenizer,
+                        skip_prompt=True,
+                        skip_special_tokens=True,
+                    )
+                    inputs = self.generator.tokenizer(prompt, return_tensors="pt")
+                    options = {"max_new_tokens": max_tokens, "streamer": streamer}
+                    if stop:
+                        options["stopping_criteria"] = _stop_criteria(
+                            self.generator.tokenizer, stop
+                        )
+                    thread = threading.Thread(
+                        target=self.generator.model.generate,
+                        kwargs={**inputs, **options},
+                    )
+                    thread.start()
+                    for text in streamer:
+                        yield text
+                    thread.join()
+                except Exception:
+                    result = self.generator(prompt, max_new_tokens=max_tokens)
+                    yield result[0]["generated_text"]
+                return
+
+            if self.llama:
+                result = self.llama(
+                    prompt, max_tokens=max_tokens, stream=True, **_stop_options(stop)
+                )  # type: ignore[arg-type]
+                for chunk in result:
+                    text = chunk.get("choices", [{}])[0].get("text")
+                    if text:
+                        yield text
+                return
+
+            raise RuntimeError("No LLM backend configured")
+
+    async def _run_in_thread(self, func, *args, **kwargs):
+        """Run a blocking backend call in a worker thread.
+
+        The wait for a free thread is recorded as the ``queue`` phase and the
+        call itself as ``generate``.
+        """
+        submitted = time.perf_counter()
+
+        def run():
+            record("queue", time.perf_counter() - submitted)
+            with timed("generate"):
+                return func(*args, **kwargs)
 
-    async def astream(
+        return await asyncio.to_thread(run)
+
+    def astream(
+        self,
+        prompt: str,
+        *,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+        stop: Optional[List[str]] = None,
+    ):
+        """Asynchronously yield completion tokens for the prompt.
+
+        Generation ends as soon as one of the ``stop`` sequences appears.
+        """
+        stream = self._astream(
+            prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            stop=stop,
+        )
+        if stop:
+            stream = astop_tokens(stream, stop)
+        return timed_stream(traced_stream(stream, "llm.stream", model=self.model))
+
+    async def _astream(
         self,
         prompt: str,
         *,
         max_tokens: int | None = None,
         temperature: float | None = None,
         top_p: float | None = None,
+        stop: Optional[List[str]] = None,
     ):
-        """Asynchronously yield completion tokens for the prompt."""
         if max_tokens is None:
             max_tokens = DEFAULT_MAX_TOKENS
         if temperature is None:
             temperature = DEFAULT_TEMPERATURE
         if top_p is None:
             top_p = DEFAULT_TOP_P
+        if self.synthetic:
+            with EXECUTOR_BUSY.track():
+                async for token in self.synthetic.astream(prompt, max_tokens):
+                    yield token
+            return
+
         if self.async_client:
-            response = await self.async_client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p,
-                stream=True,
-            )
-            async for chunk in response:
-                delta = chunk.choices[0].delta.content
-                if delta:
-                    yield delta
+            with EXECUTOR_BUSY.track():
+                response = await self.async_client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    stream=True,
+                    **_stop_options(stop),
+                    **self._request_options(),
+                )
+                async for chunk in response:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
             return
 
         if self.async_llama:
-            result = await self.async_llama(prompt, max_tokens=max_tokens, stream=True)
-            async for chunk in result:
-                text = chunk.get("choices", [{}])[0].get("text")
-                if text:
-                    yield text
+            with EXECUTOR_BUSY.track():
+                result = await self.async_llama(
+                    prompt, max_tokens=max_tokens, stream=True, **_stop_options(stop)
+                )
+                async for chunk in result:
+                    text = chunk.get("choices", [{}])[0].get("text")
+                    if text:
+                        yield text
             return
 
         if self.llama or self.generator or self.client:
-            tokens = await asyncio.to_thread(
+            tokens = await self._run_in_thread(
                 lambda: list(
                     self.stream(
                         prompt,
                         max_tokens=max_tokens,
                         temperature=temperature,
                         top_p=top_p,
+                        stop=stop,
                     )
                 )
             )
@@ -226,37 +560,118 @@ class LLMExecutor(AbstractContextManager, AbstractAsyncContextManager):
         max_tokens: int | None = None,
         temperature: float | None = None,
         top_p: float | None = None,
+        stop: Optional[List[str]] = None,
     ) -> str:
         """Asynchronously return a completion for the given prompt."""
+        with span("llm.complete", model=self.model):
+            return await self._acomplete(
+                prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                stop=stop,
+            )
+
+    async def abatch(
+        self,
+        prompts: List[str],
+        *,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+        stop: Optional[List[str]] = None,
+        concurrency: int = 8,
+    ) -> List[str]:
+        """Asynchronously return one completion per prompt, in order.
+
+        Blocking local backends handle the batch in a single worker thread
+        call, see :meth:`batch`. Remote and asynchronous backends receive the
+        prompts concurrently with at most ``concurrency`` requests in flight.
+        """
+        options = {
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "stop": stop,
+        }
+        with span("llm.batch", model=self.model, size=len(prompts)):
+            if self.llama or self.generator:
+                return await self._run_in_thread(self.batch, prompts, **options)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def complete(prompt: str) -> str:
+                async with semaphore:
+                    return await self._acomplete(prompt, **options)
+
+            return list(await asyncio.gather(*(complete(p) for p in prompts)))
+
+    async def aembed(
+        self, texts: List[str], model: Optional[str] = None
+    ) -> List[List[float]]:
+        """Asynchronously return one embedding vector per text, see :meth:`embed`."""
+        with span("llm.embed", model=self.model, size=len(texts)):
+            if self.async_client:
+                with EXECUTOR_BUSY.track(), timed("generate"):
+                    response = await self.async_client.embeddings.create(
+                        model=model or self.model,
+                        input=texts,
+                        **self._request_options(),
+                    )
+                return [item.embedding for item in response.data]
+            return await self._run_in_thread(self.embed, texts, model)
+
+    async def _acomplete(
+        self,
+        prompt: str,
+        *,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+        stop: Optional[List[str]] = None,
+    ) -> str:
         if max_tokens is None:
             max_tokens = DEFAULT_MAX_TOKENS
         if temperature is None:
             temperature = DEFAULT_TEMPERATURE
         if top_p is None:
             top_p = DEFAULT_TOP_P
+        if self.synthetic:
+            with EXECUTOR_BUSY.track(), timed("generate"):
+                if not stop:
+                    return await self.synthetic.acomplete(prompt, max_tokens)
+                tokens = self.synthetic.astream(prompt, max_tokens)
+                return "".join([t async for t in astop_tokens(tokens, stop)])
+
         if self.async_client:
-            response = await self.async_client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p,
-            )
+            with EXECUTOR_BUSY.track(), timed("generate"):
+                response = await self.async_client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    **_stop_options(stop),
+                    **self._request_options(),
+                )
             return response.choices[0].message.content
 
         if self.async_llama:
-            result = await self.async_llama(prompt, max_tokens=max_tokens)
+            with EXECUTOR_BUSY.track(), timed("generate"):
+                result = await self.async_llama(
+                    prompt, max_tokens=max_tokens, **_stop_options(stop)
+                )
             return result["choices"][0]["text"]
 
         # Some backends expose only synchronous APIs so local inference can
         # block the event loop. Run them in a thread.
         if self.llama or self.generator or self.client:
-            return await asyncio.to_thread(
+            return await self._run_in_thread(
                 self.complete,
                 prompt,
                 max_tokens=max_tokens,
                 temperature=temperature,
                 top_p=top_p,
+                stop=stop,
             )
 
         raise RuntimeError("No LLM backend configured")
@@ -0,0 +1,204 @@
+"""Generations running detached from the request that started them.
+
+A background generation keeps running when the client disconnects. Its
+tokens go into a bounded replay buffer so a client can reconnect and continue
+reading from the last token it received. Finished generations are kept for
+``ttl`` seconds and then dropped.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import secrets
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TokensDropped(Exception):
+    """Raised when tokens a reader asks for have left the replay buffer."""
+
+    def __init__(self, first: int) -> None:
+        super().__init__(f"Tokens before {first} are no longer buffered")
+        self.first = first
+
+
+class Generation:
+    """Tokens of one generation with the most recent ones kept for replay."""
+
+    def __init__(self, generation_id: str, buffer_tokens: int) -> None:
+        self.id = generation_id
+        self.status = "running"
+        self.error: Optional[str] = None
+        # Number of tokens generated so far, including dropped ones
+        self.total = 0
+        self.finished_at: Optional[float] = None
+        self._buffer: deque = deque(maxlen=buffer_tokens)
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status != "running"
+
+    @property
+    def first(self) -> int:
+        """Index of the oldest token still in the buffer."""
+        return self.total - len(self._buffer)
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def push(self, token: str) -> None:
+        self._buffer.append(token)
+        self.total += 1
+        self._notify()
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def tokens(self, start: int = 0) -> List[str]:
+        """Return the tokens from index ``start`` on."""
+        if start < self.first:
+            raise TokensDropped(self.first)
+        return list(self._buffer)[start - self.first :]
+
+    async def follow(self, start: int = 0) -> AsyncIterator[Tuple[int, str]]:
+        """Yield ``(index, token)`` from ``start`` until the generation ends."""
+        position = start
+        while True:
+            changed = self._changed
+            for token in self.tokens(position):
+                yield position, token
+                position += 1
+            if self.done and position >= self.total:
+                return
+            if position >= self.total:
+                await changed.wait()
+
+    def cancel(self) -> None:
+        if self._task is not None and not self.done:
+            self._task.cancel()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "object": "generation",
+            "status": self.status,
+            "tokens": self.total,
+            "first_buffered": self.first,
+            "error": self.error,
+        }
+
+
+class GenerationStore:
+    """Run generations in the background and keep them for ``ttl`` seconds.
+
+    At most ``max_generations`` are held. The oldest finished generation is
+    dropped to make room; :class:`RuntimeError` is raised when all of them
+    are still running.
+    """
+
+    def __init__(
+        self,
+        max_generations: int = 256,
+        buffer_tokens: int = 4096,
+        ttl: float = 300.0,
+    ) -> None:
+        self.max_generations = max_generations
+        self.buffer_tokens = buffer_tokens
+        self.ttl = ttl
+        self._generations: "OrderedDict[str, Generation]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._generations)
+
+    def running(self) -> int:
+        return sum(not g.done for g in self._generations.values())
+
+    def _expired(self, generation: Generation, now: float) -> bool:
+        return generation.done and now - generation.finished_at > self.ttl
+
+    def purge(self) -> None:
+        """Remove finished generations older than ``ttl``."""
+        now = time.monotonic()
+        for generation in list(self._generations.values()):
+            if self._expired(generation, now):
+                del self._generations[generation.id]
+                self.expirations += 1
+
+    def _make_room(self) -> None:
+        self.purge()
+        while len(self._generations) >= self.max_generations:
+            finished = next((g for g in self._generations.values() if g.done), None)
+            if finished is None:
+                raise RuntimeError("Too many background generations")
+            del self._generations[finished.id]
+            self.evictions += 1
+
+    def start(self, tokens: AsyncIterator[str]) -> Generation:
+        """Consume the ``tokens`` stream in a background task."""
+        self._make_room()
+        generation = Generation(secrets.token_urlsafe(16), self.buffer_tokens)
+
+        async def run() -> None:
+            try:
+                async for token in tokens:
+                    generation.push(token)
+            except asyncio.CancelledError:
+                generation.finish("cancelled")
+                raise
+            except Exception as exc:
+                logger.exception("Background generation failed: %s", exc)
+                generation.finish("failed", str(exc))
+            else:
+                generation.finish("completed")
+
+        # Start from an empty context so the task does not write into the
+        # log record and trace of the request that started it
+        generation._task = contextvars.Context().run(asyncio.create_task, run())
+        self._generations[generation.id] = generation
+        return generation
+
+    def get(self, generation_id: str) -> Optional[Generation]:
+        generation = self._generations.get(generation_id)
+        if generation is None:
+            return None
+        if self._expired(generation, time.monotonic()):
+            del self._generations[generation_id]
+            self.expirations += 1
+            return None
+        return generation
+
+    def delete(self, generation_id: str) -> bool:
+        generation = self._generations.pop(generation_id, None)
+        if generation is None:
+            return False
+        generation.cancel()
+        return True
+
+    async def close(self) -> None:
+        """Cancel running generations."""
+        tasks = [g._task for g in self._generations.values() if not g.done]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._generations),
+            "running": self.running(),
+            "max_size": self.max_generations,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,318 @@
+"""Run selected plugins in supervised worker processes.
+
+A plugin is isolated by setting ``isolate: true`` in its settings. The module
+is then imported in a child process instead of the server interpreter and its
+hooks are invoked over a :class:`multiprocessing.Pipe`. The worker is started
+in a thread on the first hook call, usually ``setup``, so loading the plugin
+does not block the event loop. Calls made while a
+batch is in flight are queued and sent together as a single message, so the
+IPC cost is amortized under load. Workers are restarted after
+``isolate_max_calls`` hook calls, when their resident memory exceeds
+``isolate_max_rss_mb`` or when they crash.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import types
+import weakref
+from importlib import import_module
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Optional, Tuple
+
+from .plugins import Plugin
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a worker to import its plugin
+STARTUP_TIMEOUT = 30.0
+
+_TRUE_VALUES = {"1", "true", "yes", "on"}
+
+# Wire format: a batch is a list of ``(hook, argument)`` tuples and the reply
+# is ``(results, rss_bytes)`` where each result is ``(ok, value_or_error)``.
+Call = Tuple[str, Any]
+Result = Tuple[bool, Any]
+
+
+def _as_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in _TRUE_VALUES
+
+
+def is_isolated(settings: Dict[str, Any]) -> bool:
+    """Return ``True`` if plugin settings request process isolation."""
+    return _as_bool(settings.get("isolate", False))
+
+
+def _rss_bytes() -> int:
+    """Return the resident set size of the current process."""
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):  # pragma: no cover - non Linux
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _worker_main(conn: Connection, name: str, settings: Dict[str, Any]) -> None:
+    """Entry point of the worker process serving hook batches."""
+    try:
+        plugin = Plugin(import_module(name), name=name, settings=settings)
+    except Exception as exc:
+        conn.send(("error", f"{type(exc).__name__}: {exc}"))
+        return
+    hooks = [
+        hook
+        for hook, present in (
+            ("pre", plugin.preprocess_async or plugin.preprocess),
+            ("post", plugin.postprocess_async or plugin.postprocess),
+            ("setup", plugin.setup or plugin.setup_async),
+            ("teardown", plugin.teardown_async or plugin.teardown),
+        )
+        if present
+    ]
+    conn.send(("ready", {"order": plugin.order, "hooks": hooks}))
+
+    loop = asyncio.new_event_loop()
+    runners = {
+        "pre": plugin.run_preprocess,
+        "post": plugin.run_postprocess,
+    }
+    try:
+        while True:
+            try:
+                batch = conn.recv()
+            except EOFError:
+                break
+            if batch is None:
+                break
+            results: List[Result] = []
+            for hook, arg in batch:
+                try:
+                    if hook == "setup":
+                        plugin.settings = arg
+                        value = loop.run_until_complete(plugin.run_setup())
+                    elif hook == "teardown":
+                        value = loop.run_until_complete(plugin.run_teardown())
+                    else:
+                        value = loop.run_until_complete(runners[hook](arg))
+                    results.append((True, value))
+                except Exception as exc:
+                    results.append((False, f"{type(exc).__name__}: {exc}"))
+            conn.send((results, _rss_bytes()))
+    finally:
+        loop.close()
+        conn.close()
+
+
+_instances: "weakref.WeakSet[IsolatedPlugin]" = weakref.WeakSet()
+
+
+def _detach_workers() -> None:
+    """Forget workers of the parent process in a forked child.
+
+    The child starts its own worker on the next hook call instead of sharing
+    the parent's pipe.
+    """
+    for plugin in list(_instances):
+        plugin._conn = plugin._process = None
+        plugin._pending = []
+        plugin._drain_task = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_detach_workers)
+
+
+class IsolatedPlugin(Plugin):
+    """Plugin proxy whose hooks execute in a child process."""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        settings: Optional[Dict[str, Any]] = None,
+        max_calls: Optional[int] = None,
+        max_rss_mb: Optional[float] = None,
+    ) -> None:
+        settings = settings or {}
+        super().__init__(
+            types.SimpleNamespace(__name__=name), name=name, settings=settings
+        )
+        self.max_calls = max_calls or int(settings.get("isolate_max_calls", 0))
+        rss = max_rss_mb or float(settings.get("isolate_max_rss_mb", 0))
+        self.max_rss_bytes = int(rss * 1024 * 1024)
+        self.calls = 0
+        self.restarts = 0
+        self._ctx = multiprocessing.get_context("spawn")
+        self._process: Optional[multiprocessing.process.BaseProcess] = None
+        self._conn: Optional[Connection] = None
+        self._started = False
+        self._start_lock = asyncio.Lock()
+        self._setup_done = False
+        self._pending: List[Tuple[Call, asyncio.Future]] = []
+        self._drain_task: Optional[asyncio.Task] = None
+        # Known once the worker has imported the plugin
+        self.hooks: List[str] = []
+        _instances.add(self)
+
+    # Process management ------------------------------------------------------
+    def _spawn(self) -> None:
+        parent, child = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child, self.name, self.settings),
+            name=f"moogla-plugin:{self.name}",
+            daemon=True,
+        )
+        process.start()
+        child.close()
+        if not parent.poll(STARTUP_TIMEOUT):
+            process.kill()
+            raise ImportError(f"Timed out starting worker for plugin '{self.name}'")
+        try:
+            status, info = parent.recv()
+        except EOFError as exc:
+            raise ImportError(f"Worker for plugin '{self.name}' exited") from exc
+        if status != "ready":
+            process.join()
+            raise ImportError(f"Cannot import plugin '{self.name}': {info}")
+        self._process = process
+        self._conn = parent
+        self.order = info["order"]
+        self.hooks = info["hooks"]
+        self.calls = 0
+        self._started = True
+        logger.info("Started worker %s for plugin '%s'", process.pid, self.name)
+
+    def _stop(self) -> None:
+        conn, process = self._conn, self._process
+        self._conn = self._process = None
+        if conn is not None:
+            try:
+                conn.send(None)
+            except (OSError, ValueError):
+                pass
+            conn.close()
+        if process is not None:
+            process.join(timeout=5)
+            if process.is_alive():  # pragma: no cover - stuck worker
+                process.kill()
+                process.join()
+
+    def _send(self, batch: List[Call]) -> Tuple[List[Result], int]:
+        conn = self._conn
+        assert conn is not None
+        try:
+            conn.send(batch)
+            return conn.recv()
+        except (EOFError, OSError) as exc:
+            self._stop()
+            raise RuntimeError(f"Worker for plugin '{self.name}' crashed") from exc
+
+    def _restart(self, reason: str) -> None:
+        logger.info("Recycling worker for plugin '%s': %s", self.name, reason)
+        self._stop()
+        self.restarts += 1
+        self._spawn()
+        if self._setup_done and "setup" in self.hooks:
+            results, _ = self._send([("setup", self.settings)])
+            ok, error = results[0]
+            if not ok:
+                logger.error("Failed to setup plugin '%s': %s", self.name, error)
+
+    def _exchange(self, batch: List[Call]) -> List[Result]:
+        """Send one batch to the worker and wait for the results."""
+        if self._conn is None:
+            self._restart("worker not running")
+        results, rss = self._send(batch)
+        self.calls += len(batch)
+        if self.max_calls and self.calls >= self.max_calls:
+            self._restart(f"{self.calls} calls")
+        elif self.max_rss_bytes and rss > self.max_rss_bytes:
+            self._restart(f"rss {rss // (1024 * 1024)} MB")
+        return results
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self._process is not None else None
+
+    async def start(self) -> None:
+        """Start the worker in a thread unless it was started before.
+
+        Raises :class:`ImportError` when the plugin cannot be imported.
+        """
+        if self._started:
+            return
+        async with self._start_lock:
+            if not self._started:
+                await asyncio.to_thread(self._spawn)
+
+    # Batched dispatch --------------------------------------------------------
+    async def _call(self, hook: str, arg: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append(((hook, arg), fut))
+        if self._drain_task is None:
+            self._drain_task = loop.create_task(self._drain())
+        return await fut
+
+    async def _drain(self) -> None:
+        try:
+            while self._pending:
+                batch, self._pending = self._pending, []
+                try:
+                    results = await asyncio.to_thread(
+                        self._exchange, [call for call, _ in batch]
+                    )
+                except Exception as exc:
+                    for _, fut in batch:
+                        if not fut.done():
+                            fut.set_exception(exc)
+                    continue
+                for (_, fut), (ok, value) in zip(batch, results):
+                    if fut.done():
+                        continue
+                    if ok:
+                        fut.set_result(value)
+                    else:
+                        fut.set_exception(RuntimeError(value))
+        finally:
+            self._drain_task = None
+
+    async def run_preprocess(self, text: str) -> str:
+        await self.start()
+        if "pre" not in self.hooks:
+            return text
+        return await self._call("pre", text)
+
+    async def run_postprocess(self, text: str) -> str:
+        await self.start()
+        if "post" not in self.hooks:
+            return text
+        return await self._call("post", text)
+
+    async def run_setup(self) -> None:
+        await self.start()
+        if "setup" in self.hooks:
+            await self._call("setup", self.settings)
+        self._setup_done = True
+
+    async def run_teardown(self) -> None:
+        try:
+            if "teardown" in self.hooks and self._conn is not None:
+                await self._call("teardown", None)
+        finally:
+            await asyncio.to_thread(self._stop)
+
+    def cache_stats(self) -> Dict[str, Any] | None:
+        return None
+
+    def clear_cache(self) -> None:
+        pass
@@ -0,0 +1,223 @@
+"""Logging setup and structured access logs.
+
+:func:`configure_logging` routes all records through a
+:class:`~logging.handlers.QueueHandler`. Handler I/O and formatting then
+happen on a :class:`~logging.handlers.QueueListener` thread instead of the
+event loop. :class:`AccessLogMiddleware` writes one record per request to
+the ``moogla.access`` logger with fields collected along the request path via
+:func:`annotate`.
+"""
+
+from __future__ import annotations
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+ACCESS_LOGGER = "moogla.access"
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+LOG_FORMATS = ("text", "json")
+
+access_logger = logging.getLogger(ACCESS_LOGGER)
+
+_fields: ContextVar[Optional[Dict[str, Any]]] = ContextVar(
+    "moogla_access_fields", default=None
+)
+# Whether the access record of the current request was sampled
+_sampled: ContextVar[bool] = ContextVar("moogla_access_sampled", default=False)
+_listener: Optional[QueueListener] = None
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as single line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        access = getattr(record, "access", None)
+        if access is not None:
+            data.update(access)
+        else:
+            data["message"] = record.getMessage()
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text formatter that renders access records as JSON."""
+
+    def __init__(self) -> None:
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        access = getattr(record, "access", None)
+        if access is not None:
+            record = copy.copy(record)
+            record.msg, record.args = json.dumps(access, default=str), None
+        return super().format(record)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Queue records without formatting them on the calling thread.
+
+    Messages are merged with their arguments eagerly because arguments may
+    change later, but tracebacks and access records, which are not modified
+    after logging, are formatted by the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.args and not hasattr(record, "access"):
+            record.msg, record.args = record.getMessage(), None
+        return record
+
+
+def configure_logging(level: str, fmt: str = "text") -> None:
+    """Configure application logging with a consistent format.
+
+    When no handlers are installed yet, records are written to stderr by a
+    background thread fed through a queue.
+    """
+    global _listener
+    if fmt not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format '{fmt}'")
+    root = logging.getLogger()
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        root.addHandler(_DeferredQueueHandler(records))
+        _listener = QueueListener(records, handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+    root.setLevel(level)
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_listener() -> None:
+    """Restart the listener thread in a forked child process."""
+    global _listener
+    if _listener is None:
+        return
+    # Records queued before the fork are written by the parent
+    while True:
+        try:
+            _listener.queue.get_nowait()
+        except queue.Empty:
+            break
+    # The parent's listener thread does not exist in the child
+    _listener = QueueListener(
+        _listener.queue,
+        *_listener.handlers,
+        respect_handler_level=_listener.respect_handler_level,
+    )
+    _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listener)
+
+
+def annotate(**fields: Any) -> None:
+    """Add fields to the access record of the current request."""
+    current = _fields.get()
+    if current is not None:
+        current.update(fields)
+
+
+def annotating() -> bool:
+    """Return ``True`` if the access record of the current request is sampled.
+
+    Fields that are costly to compute, such as token counts, should only be
+    added then. Unsampled requests only keep the cheap fields in case they
+    fail and are logged anyway.
+    """
+    return _sampled.get()
+
+
+def record_cache_lookup(hit: bool) -> None:
+    """Note a plugin cache lookup; the request counts as a hit if any lookup hit."""
+    current = _fields.get()
+    if current is not None:
+        current["cache_hit"] = current.get("cache_hit", False) or hit
+
+
+def _request_id(scope) -> str:
+    for key, value in scope.get("headers", ()):
+        if key == b"x-request-id":
+            candidate = value.decode("latin-1")
+            if 0 < len(candidate) <= 128 and candidate.isprintable():
+                return candidate
+            break
+    return uuid.uuid4().hex
+
+
+class AccessLogMiddleware:
+    """ASGI middleware emitting a structured access record per request.
+
+    A fraction ``sample_rate`` of requests is sampled when they start and
+    logged with all their fields. Responses with a status of 500 or above are
+    always logged, for unsampled requests without the fields checked with
+    :func:`annotating`.
+    """
+
+    def __init__(self, app: Any, sample_rate: float = 1.0) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        request_id = _request_id(scope)
+        fields: Dict[str, Any] = {
+            "request_id": request_id,
+            "method": scope["method"],
+            "path": scope["path"],
+        }
+        status = 500
+        sampled = random.random() < self.sample_rate
+        token = _fields.set(fields)
+        sampled_token = _sampled.set(sampled)
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _fields.reset(token)
+            _sampled.reset(sampled_token)
+            if sampled or status >= 500:
+                route = scope.get("route")
+                fields["route"] = getattr(route, "path", None)
+                fields["status"] = status
+                fields["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+                access_logger.info("access", extra={"access": fields})
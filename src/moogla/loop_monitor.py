@@ -0,0 +1,112 @@
+"""Detect code that blocks the asyncio event loop.
+
+:class:`LoopMonitor` runs a task that sleeps for a short interval and records
+how late it wakes up as ``moogla_event_loop_lag_seconds``. A watchdog thread
+watches the heartbeat of that task. When the loop has not run for longer than
+the threshold, the watchdog captures the stack of the event loop thread,
+which shows the blocking call while it is still running, and logs it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from .metrics import LOOP_BLOCKED, LOOP_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """Sample event loop lag and dump the stack of blocking code.
+
+    Parameters
+    ----------
+    threshold: Stall duration in seconds that triggers a stack dump.
+    interval: Seconds between lag samples.
+    log_interval: Minimum seconds between two logged stack dumps. Stalls in
+        between are still counted.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.5,
+        *,
+        interval: float = 0.1,
+        log_interval: float = 60.0,
+    ) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.log_interval = log_interval
+        self.stalls = 0
+        self.last_stack: Optional[str] = None
+        self._beat = time.monotonic()
+        self._reported_beat: Optional[float] = None
+        self._last_log = float("-inf")
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def _sample(self) -> None:
+        while True:
+            start = time.perf_counter()
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            LOOP_LAG_SECONDS.observe(
+                max(time.perf_counter() - start - self.interval, 0.0)
+            )
+
+    def _watch(self) -> None:
+        poll = max(min(self.threshold, self.interval) / 2, 0.005)
+        while not self._stop.wait(poll):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled > self.threshold and beat != self._reported_beat:
+                self._reported_beat = beat
+                self._report(stalled)
+
+    def _report(self, stalled: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        self.stalls += 1
+        LOOP_BLOCKED.inc()
+        self.last_stack = "".join(traceback.format_stack(frame))
+        now = time.monotonic()
+        if now - self._last_log >= self.log_interval:
+            self._last_log = now
+            logger.warning(
+                "Event loop blocked for more than %.0f ms in:\n%s",
+                stalled * 1000,
+                self.last_stack,
+            )
+
+    def start(self) -> None:
+        """Start sampling on the running loop and launch the watchdog thread."""
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+        self._thread = threading.Thread(
+            target=self._watch, name="moogla-loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
@@ -0,0 +1,452 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+Backend calls update metrics from worker threads, so every metric holds a
+``threading.Lock`` that each update and snapshot takes. The lock is rarely
+contended and cheap enough to take once per generated token.
+
+When several server processes share a metrics directory each one
+periodically writes a JSON snapshot of its values there and ``/metrics``
+merges all snapshots.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[str, ...]
+
+# Latency buckets in seconds, spanning sub-millisecond hooks to long generations
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+RATE_BUCKETS = (1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0)
+SIZE_BUCKETS = (1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0, 128.0, 256.0)
+
+
+class Metric:
+    """Base class storing one value per label combination."""
+
+    type = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, Any] = {}
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.values.clear()
+
+    def dump(self) -> Dict[str, Any]:
+        with self._lock:
+            values = [
+                [list(k), list(v) if isinstance(v, list) else v]
+                for k, v in self.values.items()
+            ]
+        return {
+            "type": self.type,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "values": values,
+        }
+
+
+class Counter(Metric):
+    """Monotonically increasing value."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, labels: Labels = ()) -> None:
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def get(self, labels: Labels = ()) -> float:
+        return self.values.get(labels, 0.0)
+
+
+class Gauge(Metric):
+    """Value that can go up and down."""
+
+    type = "gauge"
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        with self._lock:
+            self.values[labels] = value
+
+    def inc(self, amount: float = 1.0, labels: Labels = ()) -> None:
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, labels: Labels = ()) -> None:
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0.0) - amount
+
+    def get(self, labels: Labels = ()) -> float:
+        return self.values.get(labels, 0.0)
+
+    @contextmanager
+    def track(self, labels: Labels = ()) -> Iterator[None]:
+        """Increment the gauge for the duration of the block."""
+        self.inc(1.0, labels)
+        try:
+            yield
+        finally:
+            self.dec(1.0, labels)
+
+
+class Histogram(Metric):
+    """Distribution of observations in fixed buckets.
+
+    Each label combination stores ``[bucket counts..., +Inf count, sum]``.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self.values.get(labels)
+            if data is None:
+                data = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            data[index] += 1
+            data[-1] += value
+
+    def count(self, labels: Labels = ()) -> int:
+        data = self.values.get(labels)
+        return sum(data[:-1]) if data else 0
+
+    def dump(self) -> Dict[str, Any]:
+        result = super().dump()
+        result["buckets"] = list(self.buckets)
+        return result
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: M) -> M:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames=(),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "metrics": {name: m.dump() for name, m in self.metrics.items()},
+        }
+
+    # Multi-process support ---------------------------------------------------
+    def write_snapshot(self, directory: Path) -> None:
+        """Atomically write this process' values to ``directory``."""
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{os.getpid()}.json"
+        tmp = path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def render(self, directory: Optional[Path] = None) -> str:
+        """Return all metrics in the Prometheus text exposition format.
+
+        When ``directory`` is given, snapshots written by other processes are
+        merged in. Gauges of processes that are no longer running are
+        skipped while counters and histograms keep their totals.
+        """
+        snapshots = [self.snapshot()]
+        if directory is not None and directory.is_dir():
+            own = os.getpid()
+            for path in directory.glob("*.json"):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        snap = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if snap.get("pid") != own:
+                    snapshots.append(snap)
+        return _render(_merge(snapshots))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # pragma: no cover - other user's process
+        return True
+    return True
+
+
+def _merge(snapshots: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    merged: Dict[str, Dict[str, Any]] = {}
+    for index, snap in enumerate(snapshots):
+        alive = index == 0 or _pid_alive(int(snap.get("pid", 0)))
+        for name, metric in snap.get("metrics", {}).items():
+            if metric["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "values": {}})
+            values = target["values"]
+            for labels, value in metric["values"]:
+                key = tuple(labels)
+                if metric["type"] == "histogram":
+                    current = values.get(key)
+                    if current is None or len(current) != len(value):
+                        values[key] = list(value)
+                    else:
+                        values[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    values[key] = values.get(key, 0.0) + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _render(metrics: Dict[str, Dict[str, Any]]) -> str:
+    lines: List[str] = []
+    for name in sorted(metrics):
+        metric = metrics[name]
+        kind = metric["type"]
+        names = metric["labelnames"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(metric["values"].items()):
+            label_str = _format_labels(names, labels)
+            if kind == "histogram":
+                cumulative = 0
+                bounds = list(metric["buckets"]) + [float("inf")]
+                for bound, count in zip(bounds, value[:-1]):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    bucket_labels = _format_labels(names, labels, le)
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{label_str} {_format_value(value[-1])}")
+                lines.append(f"{name}_count{label_str} {cumulative}")
+            else:
+                lines.append(f"{name}{label_str} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter(
+    "moogla_requests_total", "HTTP requests by route and status", ("route", "status")
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "moogla_request_duration_seconds", "HTTP request duration", ("route",)
+)
+RATE_LIMITED = REGISTRY.counter(
+    "moogla_rate_limit_rejections_total", "Requests rejected by the rate limiter"
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "moogla_queue_depth", "Completion requests accepted and not yet finished"
+)
+CONTEXT_TRIMMED_TOKENS = REGISTRY.counter(
+    "moogla_context_trimmed_tokens_total",
+    "History tokens left out of prompts to fit the context window",
+)
+SESSIONS = REGISTRY.gauge("moogla_sessions", "Chat sessions held in memory")
+BACKGROUND_GENERATIONS = REGISTRY.gauge(
+    "moogla_background_generations", "Background generations still running"
+)
+WEBSOCKET_CONNECTIONS = REGISTRY.gauge(
+    "moogla_websocket_connections", "Open chat WebSocket connections"
+)
+BATCH_REQUESTS = REGISTRY.counter(
+    "moogla_batch_requests_total", "Batch job requests by outcome", ("outcome",)
+)
+BATCH_IN_FLIGHT = REGISTRY.gauge(
+    "moogla_batch_in_flight", "Batch job requests currently being answered"
+)
+EMBEDDING_BATCH_SIZE = REGISTRY.histogram(
+    "moogla_embedding_batch_size",
+    "Texts embedded per backend call",
+    buckets=SIZE_BUCKETS,
+)
+EMBEDDING_CACHE_HITS = REGISTRY.gauge(
+    "moogla_embedding_cache_hits", "Embedding inputs answered from the cache"
+)
+EMBEDDING_CACHE_MISSES = REGISTRY.gauge(
+    "moogla_embedding_cache_misses", "Embedding inputs not found in the cache"
+)
+EXECUTOR_BUSY = REGISTRY.gauge(
+    "moogla_executor_busy", "LLM backend calls currently in progress"
+)
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "moogla_time_to_first_token_seconds", "Delay before the first streamed token"
+)
+INTER_TOKEN_SECONDS = REGISTRY.histogram(
+    "moogla_inter_token_latency_seconds", "Delay between streamed tokens"
+)
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "moogla_tokens_per_second", "Streaming generation speed", buckets=RATE_BUCKETS
+)
+GENERATED_TOKENS = REGISTRY.counter(
+    "moogla_generated_tokens_total", "Tokens streamed to clients"
+)
+PLUGIN_HOOK_SECONDS = REGISTRY.histogram(
+    "moogla_plugin_hook_duration_seconds",
+    "Plugin hook execution time",
+    ("plugin", "hook"),
+)
+PLUGIN_CACHE_HITS = REGISTRY.gauge(
+    "moogla_plugin_cache_hits", "Memoized plugin hook hits", ("plugin",)
+)
+PLUGIN_CACHE_MISSES = REGISTRY.gauge(
+    "moogla_plugin_cache_misses", "Memoized plugin hook misses", ("plugin",)
+)
+
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "moogla_event_loop_lag_seconds", "Event loop scheduling delay"
+)
+LOOP_BLOCKED = REGISTRY.counter(
+    "moogla_event_loop_blocked_total", "Event loop stalls above the lag threshold"
+)
+
+
+class StreamTimer:
+    """Record time to first token, inter-token latency and throughput."""
+
+    __slots__ = ("start", "first", "last", "tokens")
+
+    def __init__(self, start: Optional[float] = None) -> None:
+        self.start = start if start is not None else time.perf_counter()
+        self.first = self.last = 0.0
+        self.tokens = 0
+
+    def token(self) -> None:
+        now = time.perf_counter()
+        if self.tokens:
+            INTER_TOKEN_SECONDS.observe(now - self.last)
+        else:
+            self.first = now
+            TIME_TO_FIRST_TOKEN.observe(now - self.start)
+        self.last = now
+        self.tokens += 1
+
+    @property
+    def ttft(self) -> float:
+        return self.first - self.start if self.tokens else 0.0
+
+    def finish(self) -> None:
+        if not self.tokens:
+            return
+        GENERATED_TOKENS.inc(self.tokens)
+        elapsed = self.last - self.start
+        if elapsed > 0:
+            TOKENS_PER_SECOND.observe(self.tokens / elapsed)
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests and their durations per route."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "<unmatched>"
+            REQUESTS.inc(1.0, (path, str(status)))
+            REQUEST_SECONDS.observe(time.perf_counter() - start, (path,))
+            if status == 429:
+                RATE_LIMITED.inc()
+
+
+async def snapshot_writer(directory: Path, interval: float = 5.0, refresh=None) -> None:
+    """Periodically write this process' metrics into ``directory``."""
+    while True:
+        try:
+            if refresh is not None:
+                refresh()
+            REGISTRY.write_snapshot(directory)
+        except OSError as exc:  # pragma: no cover - filesystem errors
+            logger.warning("Failed to write metrics snapshot: %s", exc)
+        await asyncio.sleep(interval)
@@ -2,14 +2,41 @@ import asyncio
 import inspect
 import logging
 import sys
+import time
+import warnings
 from importlib import import_module, invalidate_caches, reload
-from typing import (Awaitable, Callable, List, Optional, Protocol, cast,
-                    runtime_checkable)
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Protocol,
+    Set,
+    TypeVar,
+    cast,
+    runtime_checkable,
+)
 
 from . import plugins_config
+from .cache import LRUCache, text_key
+from .logs import record_cache_lookup
 
 logger = logging.getLogger(__name__)
 
+# Default number of memoized hook results kept per cacheable plugin
+DEFAULT_CACHE_SIZE = 1024
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def pure(func: F) -> F:
+    """Mark a plugin hook as deterministic so its results can be memoized."""
+    setattr(func, "__moogla_pure__", True)
+    return func
+
 
 @runtime_checkable
 class PluginModule(Protocol):
@@ -24,13 +51,22 @@ class PluginModule(Protocol):
     setup: Callable[[dict], None] | None
     setup_async: Callable[[dict], Awaitable[None]] | None
     order: int
+    cacheable: bool
 
 
 class Plugin:
     """Simple wrapper around a plugin module."""
 
-    def __init__(self, module: PluginModule) -> None:
+    def __init__(
+        self,
+        module: PluginModule,
+        *,
+        name: Optional[str] = None,
+        settings: Optional[Dict[str, Any]] = None,
+    ) -> None:
         self.module = module
+        self.name: str = name or getattr(module, "__name__", repr(module))
+        self.settings: Dict[str, Any] = settings or {}
         self.preprocess: Callable[[str], str] | None = getattr(
             module, "preprocess", None
         )
@@ -47,23 +83,73 @@ class Plugin:
         self.teardown_async: Callable[[], Awaitable[None]] | None = getattr(
             module, "teardown_async", None
         )
+        self.setup: Callable[[dict], None] | None = getattr(module, "setup", None)
+        self.setup_async: Callable[[dict], Awaitable[None]] | None = getattr(
+            module, "setup_async", None
+        )
         self.order: int = getattr(module, "order", 0)
+        self.cacheable: bool = getattr(module, "cacheable", False) is True
+        self.cache: LRUCache[str] | None = None
+        hooks = (
+            self.preprocess_async or self.preprocess,
+            self.postprocess_async or self.postprocess,
+        )
+        if any(self._is_pure(func) for func in hooks):
+            size = int(self.settings.get("cache_size", DEFAULT_CACHE_SIZE))
+            self.cache = LRUCache(size)
+
+    def _is_pure(self, func: Callable[..., Any] | None) -> bool:
+        if func is None:
+            return False
+        return self.cacheable or getattr(func, "__moogla_pure__", False) is True
+
+    async def _run_hook(
+        self, stage: str, func: Callable[..., Any] | None, text: str
+    ) -> str:
+        if not func:
+            return text
+        key: Hashable | None = None
+        if self.cache is not None and self._is_pure(func):
+            key = (stage, text_key(text))
+            cached = self.cache.get(key)
+            record_cache_lookup(cached is not None)
+            if cached is not None:
+                return cached
+        if inspect.iscoroutinefunction(func):
+            result = await func(text)
+        else:
+            result = func(text)
+        if key is not None:
+            self.cache.set(key, result)  # type: ignore[union-attr]
+        return result
 
     async def run_preprocess(self, text: str) -> str:
-        func = self.preprocess_async or self.preprocess
-        if func:
-            if inspect.iscoroutinefunction(func):
-                return await func(text)
-            return func(text)
-        return text
+        return await self._run_hook(
+            "pre", self.preprocess_async or self.preprocess, text
+        )
 
     async def run_postprocess(self, text: str) -> str:
-        func = self.postprocess_async or self.postprocess
-        if func:
-            if inspect.iscoroutinefunction(func):
-                return await func(text)
-            return func(text)
-        return text
+        return await self._run_hook(
+            "post", self.postprocess_async or self.postprocess, text
+        )
+
+    def cache_stats(self) -> Dict[str, Any] | None:
+        """Return memoization statistics or ``None`` if caching is disabled."""
+        return self.cache.stats() if self.cache is not None else None
+
+    def clear_cache(self) -> None:
+        if self.cache is not None:
+            self.cache.clear()
+
+    async def run_setup(self) -> None:
+        """Invoke ``setup`` and then ``setup_async`` with the plugin settings."""
+        if self.setup:
+            self.setup(self.settings)
+        if self.setup_async:
+            if inspect.iscoroutinefunction(self.setup_async):
+                await self.setup_async(self.settings)
+            else:
+                self.setup_async(self.settings)
 
     async def run_teardown(self) -> None:
         """Invoke teardown hooks if defined."""
@@ -75,14 +161,72 @@ class Plugin:
                 func()
 
 
+async def setup_plugins(
+    plugins: List[Plugin], *, timeout: Optional[float] = None
+) -> None:
+    """Run plugin setup hooks concurrently and wait for all of them.
+
+    Synchronous ``setup`` functions run as soon as each plugin is scheduled
+    while ``setup_async`` coroutines overlap, so total startup time is bound by
+    the slowest plugin rather than the sum. Each plugin is given ``timeout``
+    seconds. The first failure is re-raised after all plugins have finished.
+
+    ``plugins`` is sorted again afterwards since isolated plugins only learn
+    their ``order`` once their worker has started.
+    """
+
+    async def _setup(plugin: Plugin) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(plugin.run_setup(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(
+                "Setup of plugin '%s' timed out after %.1fs", plugin.name, timeout
+            )
+            raise
+        except Exception as exc:
+            logger.error("Failed to setup plugin '%s': %s", plugin.name, exc)
+            raise
+        logger.info(
+            "Initialized plugin '%s' in %.1f ms",
+            plugin.name,
+            (time.perf_counter() - start) * 1000,
+        )
+
+    results = await asyncio.gather(
+        *(_setup(p) for p in plugins), return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    plugins.sort(key=lambda p: p.order)
+
+
 def load_plugins(
-    names: Optional[List[str]], *, reload_modules: bool = False
+    names: Optional[List[str]],
+    *,
+    reload_modules: bool = False,
+    setup: bool = True,
 ) -> List[Plugin]:
-    """Import and initialize plugins from module names or configured store."""
+    """Import plugins from module names or the configured store.
+
+    When ``setup`` is true the plugin setup hooks are run before returning.
+    Inside a running event loop this is deprecated: ``setup`` functions still
+    run right away but ``setup_async`` coroutines are only scheduled. Async
+    callers should pass ``setup=False`` and await :func:`setup_plugins`.
+    """
     if not names:
         names = plugins_config.get_plugins()
     plugins: List[Plugin] = []
     for name in names or []:
+        settings = plugins_config.get_plugin_settings(name)
+        if settings.get("isolate"):
+            from .isolation import IsolatedPlugin, is_isolated
+
+            if is_isolated(settings):
+                plugins.append(IsolatedPlugin(name, settings=settings))
+                logger.info("Loaded plugin '%s' in an isolated worker", name)
+                continue
         try:
             if reload_modules:
                 invalidate_caches()
@@ -96,34 +240,45 @@ def load_plugins(
             logger.exception("Failed to import plugin '%s'", name)
             raise ImportError(f"Cannot import plugin '{name}'") from exc
 
-        settings = plugins_config.get_plugin_settings(name)
-        setup_func = getattr(module, "setup", None)
-        if setup_func:
-            try:
-                setup_func(settings)
-            except Exception as exc:  # pragma: no cover - pass through
-                logger.error("Failed to setup plugin '%s': %s", name, exc)
-                raise
-
-        setup_async = getattr(module, "setup_async", None)
-        if setup_async:
-            try:
-                if inspect.iscoroutinefunction(setup_async):
-                    try:
-                        loop = asyncio.get_running_loop()
-                    except RuntimeError:
-                        asyncio.run(setup_async(settings))
-                    else:
-                        loop.create_task(setup_async(settings))
-                else:
-                    setup_async(settings)
-            except Exception as exc:  # pragma: no cover - pass through
-                logger.error("Failed to setup plugin '%s': %s", name, exc)
-                raise
-
-        plugin = Plugin(module)
-        plugins.append(plugin)
+        plugins.append(Plugin(module, name=name, settings=settings))
         logger.info("Loaded plugin '%s'", name)
 
     plugins.sort(key=lambda p: p.order)
+
+    if setup and plugins:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(setup_plugins(plugins))
+        else:
+            warnings.warn(
+                "load_plugins(setup=True) inside a running event loop is "
+                "deprecated; pass setup=False and await setup_plugins()",
+                DeprecationWarning,
+                stacklevel=2,
+            )
+            for plugin in plugins:
+                _schedule_setup(loop, plugin)
     return plugins
+
+
+# Setup coroutines scheduled by load_plugins, referenced until they finish
+_setup_tasks: Set["asyncio.Task[None]"] = set()
+
+
+def _schedule_setup(loop: asyncio.AbstractEventLoop, plugin: Plugin) -> None:
+    """Run ``setup`` now and schedule ``setup_async`` on ``loop``."""
+    if type(plugin) is not Plugin:
+        # Subclasses such as isolated plugins only provide run_setup
+        task = loop.create_task(plugin.run_setup())
+    else:
+        if plugin.setup:
+            plugin.setup(plugin.settings)
+        if not plugin.setup_async:
+            return
+        if not inspect.iscoroutinefunction(plugin.setup_async):
+            plugin.setup_async(plugin.settings)
+            return
+        task = loop.create_task(plugin.setup_async(plugin.settings))
+    _setup_tasks.add(task)
+    task.add_done_callback(_setup_tasks.discard)
@@ -2,14 +2,21 @@
 
 from __future__ import annotations
 
+import copy
 import json
 import os
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 import yaml
 from pydantic import BaseModel, ConfigDict, ValidationError
 
+try:  # pragma: no cover - platform specific
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
 
 class PluginConfigModel(BaseModel):
     """Schema for plugin configuration files."""
@@ -20,16 +27,102 @@ class PluginConfigModel(BaseModel):
     model_config = ConfigDict(extra="forbid")
 
 
+class PluginEntry(BaseModel):
+    """A plugin to add in a manifest, optionally with settings."""
+
+    name: str
+    settings: Dict[str, Any] = {}
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class PluginManifestModel(BaseModel):
+    """Schema for ``moogla plugin apply`` manifests.
+
+    Operations are applied in the order ``clear``, ``remove``, ``add``.
+    """
+
+    clear: bool = False
+    remove: List[str] = []
+    add: List[Union[str, PluginEntry]] = []
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class PluginTransaction:
+    """Mutations applied to an in-memory copy of the plugin configuration."""
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.data = data
+        self.changes = 0
+
+    def add_plugin(self, name: str, **settings: Any) -> None:
+        plugins = self.data.setdefault("plugins", [])
+        if name not in plugins:
+            plugins.append(name)
+        if settings:
+            self.data.setdefault("settings", {}).setdefault(name, {}).update(settings)
+        self.changes += 1
+
+    def remove_plugin(self, name: str) -> bool:
+        """Remove ``name`` and its settings, returning whether it was configured."""
+        plugins = self.data.get("plugins")
+        settings = self.data.get("settings")
+        listed = isinstance(plugins, list) and name in plugins
+        if not listed and not (isinstance(settings, dict) and name in settings):
+            return False
+        if listed:
+            plugins.remove(name)
+        if isinstance(settings, dict):
+            settings.pop(name, None)
+        self.changes += 1
+        return True
+
+    def clear_plugins(self) -> None:
+        self.data.clear()
+        self.changes += 1
+
+    def apply_manifest(self, manifest: Dict[str, Any]) -> None:
+        """Apply all operations described by a manifest mapping."""
+        try:
+            spec = PluginManifestModel.model_validate(manifest)
+        except ValidationError as e:
+            raise RuntimeError(f"Invalid plugin manifest: {e}") from e
+        if spec.clear:
+            self.clear_plugins()
+        for name in spec.remove:
+            self.remove_plugin(name)
+        for entry in spec.add:
+            if isinstance(entry, str):
+                self.add_plugin(entry)
+            else:
+                self.add_plugin(entry.name, **entry.settings)
+
+
+# (path, inode, mtime_ns, size) identifying an unchanged configuration file
+_SnapshotKey = Tuple[str, int, int, int]
+
+
 class PluginStore:
-    """Persist and retrieve plugin configuration from disk."""
+    """Persist and retrieve plugin configuration from disk.
+
+    The parsed file is kept in memory and reused for as long as the file's
+    path, inode, modification time and size stay the same.
+    """
 
     DEFAULT_FILE = Path.home() / ".cache" / "moogla" / "plugins.yaml"
 
     def __init__(self, path: Optional[Path] = None) -> None:
         self.path = path or self.DEFAULT_FILE
+        self._snapshot: Optional[Tuple[_SnapshotKey, Dict[str, Any]]] = None
 
     def set_path(self, path: Optional[str]) -> None:
         self.path = Path(path) if path else self.DEFAULT_FILE
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Forget the cached configuration snapshot."""
+        self._snapshot = None
 
     def get_path(self) -> Path:
         """Return the configured plugin file path."""
@@ -41,10 +134,19 @@ class PluginStore:
             return Path(env)
         return self.path
 
-    def load(self) -> Dict[str, Any]:
+    def _load_cached(self) -> Dict[str, Any]:
+        """Return the parsed configuration, shared with the cache."""
         path = self._resolve_path()
-        if not path.exists():
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            self._snapshot = None
             return {}
+        except OSError as e:  # pragma: no cover - file errors
+            raise RuntimeError(f"Failed to load plugin config: {e}") from e
+        key = (str(path), st.st_ino, st.st_mtime_ns, st.st_size)
+        if self._snapshot is not None and self._snapshot[0] == key:
+            return self._snapshot[1]
         try:
             with open(path, "r", encoding="utf-8") as f:
                 if path.suffix in {".yaml", ".yml"}:
@@ -53,8 +155,7 @@ class PluginStore:
                     raw = json.load(f)
             if isinstance(raw, list):
                 raw = {"plugins": raw}
-            data = PluginConfigModel.model_validate(raw)
-            return data.model_dump()
+            data = PluginConfigModel.model_validate(raw).model_dump()
         except (
             OSError,
             json.JSONDecodeError,
@@ -62,8 +163,46 @@ class PluginStore:
             ValidationError,
         ) as e:  # pragma: no cover - file errors
             raise RuntimeError(f"Failed to load plugin config: {e}") from e
+        self._snapshot = (key, data)
+        return data
+
+    def load(self) -> Dict[str, Any]:
+        return copy.deepcopy(self._load_cached())
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """Hold an exclusive advisory lock on the configuration file.
+
+        A sibling ``.lock`` file is used because :meth:`save` replaces the
+        configuration file itself.
+        """
+        path = self._resolve_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = path.with_suffix(path.suffix + ".lock")
+        with open(lock_path, "a", encoding="utf-8") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def transaction(self) -> Iterator[PluginTransaction]:
+        """Apply several mutations under the file lock with a single write.
+
+        The configuration is read once after acquiring the lock and saved
+        atomically when the block exits without an exception.
+        """
+        with self.lock():
+            txn = PluginTransaction(self.load())
+            yield txn
+            if txn.changes:
+                self.save(txn.data)
 
     def save(self, data: Dict[str, Any]) -> None:
+        self.invalidate()
         path = self._resolve_path()
         path.parent.mkdir(parents=True, exist_ok=True)
         tmp = path.with_suffix(path.suffix + ".tmp")
@@ -75,60 +214,52 @@ class PluginStore:
                     json.dump(data, f, indent=2, sort_keys=True)
             os.replace(tmp, path)
         except OSError as e:  # pragma: no cover - filesystem errors
+            self.invalidate()
             if tmp.exists():
                 tmp.unlink(missing_ok=True)
             raise RuntimeError(f"Failed to save plugin config: {e}") from e
 
     def get_plugins(self) -> List[str]:
-        data = self.load()
+        data = self._load_cached()
         plugins = data.get("plugins")
         if isinstance(plugins, list):
-            return plugins
-        if isinstance(data, list):
-            return data
+            return list(plugins)
         return []
 
     def add_plugin(self, name: str, **settings: Any) -> None:
-        data = self.load()
-        plugins = data.get("plugins")
-        if plugins is None:
-            if isinstance(data, list):
-                plugins = data
-            else:
-                plugins = []
-            data["plugins"] = plugins
-        if name not in plugins:
-            plugins.append(name)
-        if settings:
-            data.setdefault("settings", {}).setdefault(name, {}).update(settings)
-        self.save(data)
+        with self.transaction() as txn:
+            txn.add_plugin(name, **settings)
 
-    def remove_plugin(self, name: str) -> None:
-        data = self.load()
-        plugins = data.get("plugins")
-        if isinstance(plugins, list) and name in plugins:
-            plugins.remove(name)
-        if isinstance(data.get("settings"), dict):
-            data["settings"].pop(name, None)
-        self.save(data)
+    def remove_plugin(self, name: str) -> bool:
+        with self.transaction() as txn:
+            return txn.remove_plugin(name)
 
     def clear_plugins(self) -> None:
-        self.save({})
+        with self.transaction() as txn:
+            txn.clear_plugins()
+
+    def apply_manifest(self, manifest: Dict[str, Any]) -> int:
+        """Apply a manifest in one transaction and return the change count."""
+        with self.transaction() as txn:
+            txn.apply_manifest(manifest)
+        return txn.changes
 
     def get_plugin_settings(self, name: str) -> Dict[str, Any]:
-        data = self.load()
+        data = self._load_cached()
         settings = data.get("settings")
         if isinstance(settings, dict):
             value = settings.get(name)
             if isinstance(value, dict):
-                return value
+                return copy.deepcopy(value)
         return {}
 
     def get_all_plugin_settings(self) -> Dict[str, Dict[str, Any]]:
-        data = self.load()
+        data = self._load_cached()
         settings = data.get("settings")
         if isinstance(settings, dict):
-            return {k: v for k, v in settings.items() if isinstance(v, dict)}
+            return {
+                k: copy.deepcopy(v) for k, v in settings.items() if isinstance(v, dict)
+            }
         return {}
 
 
@@ -148,14 +279,33 @@ def add_plugin(name: str, **settings: Any) -> None:
     _default.add_plugin(name, **settings)
 
 
-def remove_plugin(name: str) -> None:
-    _default.remove_plugin(name)
+def remove_plugin(name: str) -> bool:
+    return _default.remove_plugin(name)
 
 
 def clear_plugins() -> None:
     _default.clear_plugins()
 
 
+def apply_manifest(manifest: Dict[str, Any]) -> int:
+    return _default.apply_manifest(manifest)
+
+
+def load_manifest(path: Path) -> Dict[str, Any]:
+    """Read a YAML or JSON plugin manifest from ``path``."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if path.suffix in {".yaml", ".yml"}:
+                raw = yaml.safe_load(f) or {}
+            else:
+                raw = json.load(f)
+    except (OSError, json.JSONDecodeError, yaml.YAMLError) as e:
+        raise RuntimeError(f"Failed to load plugin manifest: {e}") from e
+    if not isinstance(raw, dict):
+        raise RuntimeError("Invalid plugin manifest: expected a mapping")
+    return raw
+
+
 def get_plugin_settings(name: str) -> Dict[str, Any]:
     return _default.get_plugin_settings(name)
 
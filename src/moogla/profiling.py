@@ -0,0 +1,157 @@
+"""Sampling profiler and memory snapshots for a running server.
+
+:func:`sample_stacks` periodically reads the Python stack of every thread
+from a background thread and aggregates them into collapsed stacks, the
+input format of ``flamegraph.pl`` and speedscope. In ``cpu`` mode a sample is
+only kept when the thread consumed CPU time since the previous sample.
+
+:class:`MemoryTracker` wraps :mod:`tracemalloc` to report the largest
+allocation sites and how they changed between two snapshots.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+PROFILE_MODES = ("wall", "cpu")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+
+
+def _thread_cpu_time(ident: int) -> Optional[float]:
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):  # pragma: no cover - non POSIX
+        return None
+
+
+def sample_stacks(
+    duration: float, interval: float = 0.005, mode: str = "wall"
+) -> Counter:
+    """Sample all thread stacks for ``duration`` seconds.
+
+    Returns a :class:`collections.Counter` mapping collapsed stacks, root
+    frame first and separated by ``;``, to the number of samples.
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{mode}'")
+    own = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    cpu_times: Dict[int, Optional[float]] = {}
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if mode == "cpu":
+                now = _thread_cpu_time(ident)
+                previous = cpu_times.get(ident)
+                cpu_times[ident] = now
+                if now is not None and (previous is None or now <= previous):
+                    continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if ident not in names:
+                names.update((t.ident, t.name) for t in threading.enumerate())
+            labels.append(names.get(ident, f"thread-{ident}"))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def format_collapsed(stacks: Counter) -> str:
+    """Render sampled stacks as ``frame;frame;frame count`` lines."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class MemoryTracker:
+    """Take :mod:`tracemalloc` snapshots and compare them."""
+
+    KEY_TYPES = ("lineno", "filename", "traceback")
+
+    def __init__(self) -> None:
+        self.previous: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self.previous = None
+
+    def _take(self) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+        )
+
+    @staticmethod
+    def _location(stat: Any, key_type: str) -> Any:
+        if key_type == "traceback":
+            return [f"{f.filename}:{f.lineno}" for f in stat.traceback]
+        frame = stat.traceback[0]
+        return frame.filename if key_type == "filename" else f"{frame}"
+
+    def snapshot(self, limit: int = 20, key_type: str = "lineno") -> Dict[str, Any]:
+        """Return the largest allocation sites and keep the snapshot for diffs."""
+        with self._lock:
+            snap = self._take()
+            self.previous = snap
+        stats = snap.statistics(key_type)
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                {
+                    "location": self._location(s, key_type),
+                    "size": s.size,
+                    "count": s.count,
+                }
+                for s in stats[:limit]
+            ],
+        }
+
+    def diff(self, limit: int = 20, key_type: str = "lineno") -> Dict[str, Any]:
+        """Compare a new snapshot with the previous one and keep the new one."""
+        with self._lock:
+            snap = self._take()
+            previous, self.previous = self.previous, snap
+        if previous is None:
+            raise RuntimeError("No previous snapshot to compare against")
+        stats: List[tracemalloc.StatisticDiff] = snap.compare_to(previous, key_type)
+        return {
+            "size_diff": sum(s.size_diff for s in stats),
+            "top": [
+                {
+                    "location": self._location(s, key_type),
+                    "size": s.size,
+                    "size_diff": s.size_diff,
+                    "count": s.count,
+                    "count_diff": s.count_diff,
+                }
+                for s in stats[:limit]
+            ],
+        }
@@ -1,43 +1,119 @@
+import asyncio
+import importlib.util
 import json
 import logging
 import os
+import time
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from enum import Enum
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional, Union
 
 import uvicorn
-from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi import (
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
+from fastapi_limiter.depends import RateLimiter, WebSocketRateLimiter
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy.pool import StaticPool
 from sqlmodel import Session, SQLModel, create_engine, select
 
 from . import plugins_config
 from .auth import User
+from .batches import BatchJob, BatchRunner, describe_job
+from .capture import CaptureMiddleware, CaptureWriter
 from .config import Settings
-from .executor import LLMExecutor
-from .plugins import load_plugins
+from .context import ContextManager
+from .embeddings import EmbeddingBatcher, encode_embedding
+from .executor import DEFAULT_MAX_TOKENS, LLMExecutor
+from .generations import Generation, GenerationStore, TokensDropped
+from .logs import AccessLogMiddleware, annotate, annotating, configure_logging
+from .loop_monitor import LoopMonitor
+from .metrics import (
+    BACKGROUND_GENERATIONS,
+    BATCH_IN_FLIGHT,
+    CONTEXT_TRIMMED_TOKENS,
+    EMBEDDING_CACHE_HITS,
+    EMBEDDING_CACHE_MISSES,
+    PLUGIN_CACHE_HITS,
+    PLUGIN_CACHE_MISSES,
+    PLUGIN_HOOK_SECONDS,
+    QUEUE_DEPTH,
+    RATE_LIMITED,
+    REGISTRY,
+    SESSIONS,
+    WEBSOCKET_CONNECTIONS,
+    MetricsMiddleware,
+    StreamTimer,
+    snapshot_writer,
+)
+from .plugins import Plugin, load_plugins, setup_plugins
+from .profiling import MemoryTracker, format_collapsed, sample_stacks
+from .sessions import Session as ChatSession
+from .sessions import SessionStore
+from .stops import stop_list
+from .timing import TimingMiddleware, current_timer, timed
+from .tracing import JSONLExporter, OTLPExporter, Tracer, TracingMiddleware, span
 
 logger = logging.getLogger(__name__)
 
+_CHUNK_PREFIX = '{"choices": [{"delta": {"content": '
+_CHUNK_SUFFIX = "}}]}\n"
 
-def configure_logging(level: str) -> None:
-    """Configure application logging with a consistent format."""
-    root = logging.getLogger()
-    if not root.handlers:
-        logging.basicConfig(
-            level=level,
-            format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-        )
-    else:
-        root.setLevel(level)
+
+def encode_stream_chunk(token: str) -> str:
+    """Return the newline delimited JSON frame for one streamed token.
+
+    Equivalent to ``json.dumps`` of the full chunk but only the token itself
+    is serialized.
+    """
+    return _CHUNK_PREFIX + json.dumps(token) + _CHUNK_SUFFIX
+
+
+def stop_option(stop: Optional[List[str]]) -> Dict[str, Any]:
+    """Return executor keyword arguments for the requested stop sequences.
+
+    The argument is left out when there are none so executor calls without
+    stop sequences stay unchanged.
+    """
+    return {"stop": stop} if stop else {}
+
+
+def encode_socket_frame(prefix: str, token: str) -> str:
+    """Return the WebSocket frame for one token of a conversation.
+
+    ``prefix`` is the opening of the frame from :func:`socket_frame_prefix`.
+    """
+    return prefix + json.dumps(token) + "}"
+
+
+def socket_frame_prefix(conversation: str) -> str:
+    return '{"id":' + json.dumps(conversation) + ',"t":'
+
+
+# Seconds a WebSocket client has to send its ``auth`` frame
+WS_AUTH_TIMEOUT = 10.0
 
 
 def create_app(
@@ -65,7 +141,7 @@ def create_app(
     """
     settings = settings or Settings()
     log_level = log_level or settings.log_level
-    configure_logging(log_level)
+    configure_logging(log_level, settings.log_format)
 
     model = model or settings.model
     model_dir = settings.model_dir
@@ -84,6 +160,28 @@ def create_app(
         else settings.token_exp_minutes
     )
     cors_origins = cors_origins or settings.cors_origins
+    metrics_dir = settings.metrics_dir
+    timing_sample_rate = settings.timing_sample_rate
+    access_log_sample_rate = settings.access_log_sample_rate
+    loop_lag_threshold = settings.loop_lag_threshold
+    ws_max_conversations = settings.ws_max_conversations
+    batch_max_prompts = settings.batch_max_prompts
+    batch_concurrency = settings.batch_concurrency
+    batch_yield_depth = settings.batch_yield_depth
+    embedding_model = settings.embedding_model
+    embedding_max_inputs = settings.embedding_max_inputs
+    tracer = None
+    if settings.trace_endpoint:
+        tracer = Tracer(
+            OTLPExporter(settings.trace_endpoint), settings.trace_sample_rate
+        )
+    elif settings.trace_file:
+        tracer = Tracer(JSONLExporter(settings.trace_file), settings.trace_sample_rate)
+    capture = (
+        CaptureWriter(settings.capture_file, settings.capture_mode)
+        if settings.capture_file
+        else None
+    )
     algorithm = "HS256"
 
     if jwt_secret is None and "MOOGLA_JWT_SECRET" not in os.environ:
@@ -99,43 +197,117 @@ def create_app(
 
     plugins_config.set_plugin_file(str(plugin_file) if plugin_file else None)
 
-    plugins = load_plugins(plugin_names)
+    plugins = load_plugins(plugin_names, setup=False)
+    plugin_setup_timeout = settings.plugin_setup_timeout
+    plugins_ready = False
+    plugins_lock: Optional[asyncio.Lock] = None
+
+    async def ensure_plugins_ready() -> None:
+        """Run plugin setup once and block callers until it has finished."""
+        nonlocal plugins_ready, plugins_lock
+        if plugins_ready:
+            return
+        if plugins_lock is None:
+            plugins_lock = asyncio.Lock()
+        async with plugins_lock:
+            if not plugins_ready:
+                await setup_plugins(plugins, timeout=plugin_setup_timeout)
+                plugins_ready = True
+
+    async def teardown_plugins() -> None:
+        for plugin in reversed(plugins):
+            await plugin.run_teardown()
+
+    async def teardown_plugin_list(plugin_list: List[Plugin]) -> None:
+        """Tear down plugins that are no longer used, logging failures."""
+        for plugin in reversed(plugin_list):
+            try:
+                await plugin.run_teardown()
+            except Exception as exc:
+                logger.error("Failed to teardown plugin '%s': %s", plugin.name, exc)
 
     executor = LLMExecutor(model=model, api_key=api_key, api_base=api_base)
+    # The window is looked up from the model on first use when not configured
+    context = ContextManager(
+        lambda text: executor.count_tokens(text), settings.context_window
+    )
+    sessions = SessionStore(
+        settings.session_max, settings.session_ttl, count=context.count
+    )
+    generations = GenerationStore(
+        settings.generation_max,
+        settings.generation_buffer_tokens,
+        settings.generation_ttl,
+    )
+    embeddings = EmbeddingBatcher(
+        lambda texts, model: executor.aembed(texts, model=model),
+        max_batch=settings.embedding_batch_size,
+        max_wait=settings.embedding_batch_wait_ms / 1000,
+        cache_size=settings.embedding_cache_size,
+    )
+    if settings.session_state_cache_mb:
+        executor.enable_state_cache(settings.session_state_cache_mb * 1024 * 1024)
 
-    engine = create_engine(db_url or "sqlite:///:memory:")
+    if db_url == "sqlite:///:memory:":
+        # Share one connection so every thread sees the same database
+        engine = create_engine(
+            db_url, connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+    else:
+        engine = create_engine(db_url)
     SQLModel.metadata.create_all(engine)
     pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
     dependencies = []
 
+    def authenticate(x_api_key: Optional[str], authorization: Optional[str]) -> str:
+        """Return the tenant for the credentials or raise a 401 error."""
+        if x_api_key == server_api_key:
+            return "api-key"
+        if authorization and authorization.startswith("Bearer "):
+            token = authorization.split(" ", 1)[1]
+            try:
+                payload = jwt.decode(token, secret_key, algorithms=[algorithm])
+                user_id = int(payload.get("sub"))
+            except JWTError:
+                raise HTTPException(status_code=401, detail="Invalid API Key")
+            with Session(engine) as session:
+                if not session.get(User, user_id):
+                    raise HTTPException(status_code=401, detail="Invalid API Key")
+            return f"user:{user_id}"
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
     if server_api_key:
 
         async def verify_auth(
             x_api_key: Optional[str] = Header(None, alias="X-API-Key"),
             authorization: Optional[str] = Header(None, alias="Authorization"),
         ) -> None:
-            if x_api_key == server_api_key:
-                return
-            if authorization and authorization.startswith("Bearer "):
-                token = authorization.split(" ", 1)[1]
-                try:
-                    payload = jwt.decode(token, secret_key, algorithms=[algorithm])
-                    user_id = int(payload.get("sub"))
-                except JWTError:
-                    raise HTTPException(status_code=401, detail="Invalid API Key")
-                with Session(engine) as session:
-                    if not session.get(User, user_id):
-                        raise HTTPException(status_code=401, detail="Invalid API Key")
-                return
-            raise HTTPException(status_code=401, detail="Invalid API Key")
+            with timed("auth"), span("auth"):
+                annotate(tenant=authenticate(x_api_key, authorization))
 
         auth_dependency = Depends(verify_auth)
     else:
         auth_dependency = None
 
+    socket_limiter = None
     if rate_limit:
-        dependencies.append(Depends(RateLimiter(times=rate_limit, seconds=60)))
+        limiter = RateLimiter(times=rate_limit, seconds=60)
+
+        async def socket_rate_limited(websocket: WebSocket, pexpire: int) -> int:
+            RATE_LIMITED.inc()
+            return pexpire
+
+        # Each WebSocket message starting a generation counts as one request
+        socket_limiter = WebSocketRateLimiter(
+            times=rate_limit, seconds=60, callback=socket_rate_limited
+        )
+
+        async def check_rate_limit(request: Request, response: Response) -> None:
+            with timed("ratelimit"), span("ratelimit"):
+                await limiter(request, response)
+
+        dependencies.append(Depends(check_rate_limit))
 
     @asynccontextmanager
     async def lifespan(_: FastAPI):
@@ -154,13 +326,43 @@ def create_app(
                 stack.push_async_callback(redis_conn.close)
 
             stack.push_async_callback(executor.aclose)
+            stack.push_async_callback(generations.close)
+            stack.push_async_callback(embeddings.close)
             stack.callback(engine.dispose)
-            for plugin in plugins:
-                stack.push_async_callback(plugin.run_teardown)
+            stack.push_async_callback(teardown_plugins)
+            if capture is not None:
+                stack.callback(capture.close)
+            if tracer is not None:
+                stack.callback(tracer.shutdown)
+
+            if metrics_dir:
+                writer = asyncio.create_task(
+                    snapshot_writer(metrics_dir, refresh=refresh_cache_metrics)
+                )
+                stack.callback(REGISTRY.write_snapshot, metrics_dir)
+                stack.callback(writer.cancel)
 
+            if loop_lag_threshold:
+                monitor = LoopMonitor(loop_lag_threshold)
+                monitor.start()
+                stack.push_async_callback(monitor.stop)
+                app.state.loop_monitor = monitor
+
+            await ensure_plugins_ready()
+            batch_runner.start()
+            stack.push_async_callback(batch_runner.stop)
             yield
 
     app = FastAPI(title="Moogla API", dependencies=dependencies, lifespan=lifespan)
+    app.add_middleware(MetricsMiddleware)
+    if timing_sample_rate:
+        app.add_middleware(TimingMiddleware, sample_rate=timing_sample_rate)
+    if capture is not None:
+        app.add_middleware(CaptureMiddleware, writer=capture)
+    if tracer is not None:
+        app.add_middleware(TracingMiddleware, tracer=tracer)
+    if access_log_sample_rate:
+        app.add_middleware(AccessLogMiddleware, sample_rate=access_log_sample_rate)
     if cors_origins:
         origins = [o.strip() for o in cors_origins.split(",") if o.strip()]
         app.add_middleware(
@@ -192,6 +394,28 @@ def create_app(
         """Return a simple heartbeat response for monitoring."""
         return {"status": "ok"}
 
+    def refresh_cache_metrics() -> None:
+        PLUGIN_CACHE_HITS.clear()
+        PLUGIN_CACHE_MISSES.clear()
+        for plugin in plugins:
+            stats = plugin.cache_stats()
+            if stats is not None:
+                PLUGIN_CACHE_HITS.set(stats["hits"], (plugin.name,))
+                PLUGIN_CACHE_MISSES.set(stats["misses"], (plugin.name,))
+        SESSIONS.set(len(sessions))
+        BACKGROUND_GENERATIONS.set(generations.running())
+        EMBEDDING_CACHE_HITS.set(embeddings.cache.hits)
+        EMBEDDING_CACHE_MISSES.set(embeddings.cache.misses)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics():
+        """Return server metrics in the Prometheus text format."""
+        refresh_cache_metrics()
+        return PlainTextResponse(
+            REGISTRY.render(metrics_dir),
+            media_type="text/plain; version=0.0.4",
+        )
+
     @app.get("/version")
     def version_info():
         """Return the running package version."""
@@ -271,63 +495,288 @@ def create_app(
 
     class ChatRequest(BaseModel):
         messages: List[Message]
+        session_id: Optional[str] = None
         stream: bool = False
+        background: bool = False
         max_tokens: Optional[int] = None
         temperature: Optional[float] = None
         top_p: Optional[float] = None
+        stop: Optional[Union[str, List[str]]] = None
 
     class CompletionRequest(BaseModel):
-        prompt: str
+        prompt: Union[str, List[str]]
+        n: int = Field(1, ge=1)
         stream: bool = False
+        background: bool = False
         max_tokens: Optional[int] = None
         temperature: Optional[float] = None
         top_p: Optional[float] = None
+        stop: Optional[Union[str, List[str]]] = None
 
-    async def apply_plugins(
+    class EmbeddingRequest(BaseModel):
+        input: Union[str, List[str]]
+        model: Optional[str] = None
+        encoding_format: Literal["float", "base64"] = "float"
+
+    async def run_hooks(hook: str, text: str) -> str:
+        """Pass text through the ``preprocess`` or ``postprocess`` hooks."""
+        with timed(hook):
+            for plugin in plugins:
+                start = time.perf_counter()
+                try:
+                    with span(f"plugin.{hook}", plugin=plugin.name):
+                        if hook == "preprocess":
+                            text = await plugin.run_preprocess(text)
+                        else:
+                            text = await plugin.run_postprocess(text)
+                except Exception as exc:
+                    logger.exception("%s plugin failed: %s", hook.capitalize(), exc)
+                    raise HTTPException(status_code=500, detail="Plugin error") from exc
+                finally:
+                    PLUGIN_HOOK_SECONDS.observe(
+                        time.perf_counter() - start, (plugin.name, hook)
+                    )
+        return text
+
+    async def generate_reply(
         text: str,
         *,
         max_tokens: int | None = None,
         temperature: float | None = None,
         top_p: float | None = None,
+        stop: Optional[List[str]] = None,
+        preprocess: bool = True,
+        background: bool = False,
     ) -> str:
+        """Run the preprocess hooks and return the model output for ``text``.
+
+        ``background`` requests come from batch jobs and are not counted as
+        interactive load.
+        """
+        with (BATCH_IN_FLIGHT if background else QUEUE_DEPTH).track():
+            if preprocess:
+                text = await run_hooks("preprocess", text)
+            response = await executor.acomplete(
+                text,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                **stop_option(stop),
+            )
+            annotate_tokens([text], [response])
+            return response
+
+    async def apply_plugins(text: str, **options: Any) -> str:
         """Run text through plugin hooks and return the mock LLM output."""
-        for plugin in plugins:
+        return await run_hooks("postprocess", await generate_reply(text, **options))
+
+    def annotate_tokens(prompts: List[str], replies: List[str]) -> None:
+        """Add model token counts to the access record, if there is one."""
+        if annotating():
+            annotate(
+                tokens_in=sum(context.count(text) for text in prompts),
+                tokens_out=sum(executor.count_tokens(reply) for reply in replies),
+            )
+
+    async def complete_batch(
+        prompts: List[str],
+        n: int,
+        *,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+        stop: Optional[List[str]] = None,
+        background: bool = False,
+    ) -> List[str]:
+        """Return ``n`` completions for each prompt, grouped by prompt."""
+        if not prompts or len(prompts) * n > batch_max_prompts:
+            raise HTTPException(
+                status_code=400,
+                detail=f"A batch must hold 1 to {batch_max_prompts} completions",
+            )
+        with (BATCH_IN_FLIGHT if background else QUEUE_DEPTH).track():
+            texts = await asyncio.gather(
+                *(run_hooks("preprocess", prompt) for prompt in prompts)
+            )
+            expanded = [text for text in texts for _ in range(n)]
+            replies = await executor.abatch(
+                expanded,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                concurrency=batch_concurrency,
+                **stop_option(stop),
+            )
+            annotate_tokens(expanded, replies)
+            return list(
+                await asyncio.gather(
+                    *(run_hooks("postprocess", reply) for reply in replies)
+                )
+            )
+
+    async def generate_tokens(
+        text: str,
+        *,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+        stop: Optional[List[str]] = None,
+        preprocess: bool = True,
+    ):
+        """Run the preprocess hooks and yield the tokens of a completion."""
+        timer = StreamTimer()
+        with QUEUE_DEPTH.track():
+            if preprocess:
+                text = await run_hooks("preprocess", text)
+            stream = executor.astream(
+                text,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                **stop_option(stop),
+            )
             try:
-                text = await plugin.run_preprocess(text)
-            except Exception as exc:
-                logger.exception("Preprocess plugin failed: %s", exc)
-                raise HTTPException(status_code=500, detail="Plugin error") from exc
-        response = await executor.acomplete(
+                async for token in stream:
+                    timer.token()
+                    yield token
+            finally:
+                await stream.aclose()
+        timer.finish()
+        if annotating():
+            annotate(
+                tokens_in=context.count(text),
+                tokens_out=timer.tokens,
+                ttft_ms=round(timer.ttft * 1000, 3) if timer.tokens else None,
+            )
+
+    async def stream_tokens(
+        text: str,
+        *,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+        stop: Optional[List[str]] = None,
+    ):
+        """Yield newline delimited JSON chunks for a streamed completion."""
+        async for token in generate_tokens(
             text,
             max_tokens=max_tokens,
             temperature=temperature,
             top_p=top_p,
-        )
-        for plugin in plugins:
-            try:
-                response = await plugin.run_postprocess(response)
-            except Exception as exc:
-                logger.exception("Postprocess plugin failed: %s", exc)
-                raise HTTPException(status_code=500, detail="Plugin error") from exc
-        return response
+            stop=stop,
+        ):
+            yield encode_stream_chunk(token)
+        request_timer = current_timer()
+        if request_timer is not None:
+            yield json.dumps({"timings": request_timer.as_dict()}) + "\n"
 
     route_args = {"dependencies": [auth_dependency]} if auth_dependency else {}
+    llm_route_args = {
+        "dependencies": route_args.get("dependencies", [])
+        + [Depends(ensure_plugins_ready)]
+    }
 
     @app.post("/reload-plugins", **route_args)
     async def reload_plugins_endpoint():
-        """Reload plugins from the current configuration."""
-        nonlocal plugins
+        """Reload plugins from the current configuration.
+
+        The new plugins are set up before they replace the old ones, which
+        stay active if loading or setup fails.
+        """
+        nonlocal plugins, plugins_ready
+        try:
+            new_plugins = load_plugins(plugin_names, reload_modules=True, setup=False)
+        except ImportError as exc:
+            raise HTTPException(status_code=500, detail=str(exc)) from exc
+        try:
+            await setup_plugins(new_plugins, timeout=plugin_setup_timeout)
+        except Exception as exc:
+            await teardown_plugin_list(new_plugins)
+            detail = str(exc) or type(exc).__name__
+            raise HTTPException(
+                status_code=500, detail=f"Plugin setup failed: {detail}"
+            ) from exc
+        old_plugins, plugins = plugins, new_plugins
+        plugins_ready = True
+        for plugin in old_plugins:
+            plugin.clear_cache()
+        await teardown_plugin_list(old_plugins)
+        return {"loaded": [p.name for p in plugins]}
+
+    @app.get("/plugin-cache", **route_args)
+    def plugin_cache_stats():
+        """Return memoization statistics for cacheable plugins."""
+        stats = {}
         for plugin in plugins:
+            plugin_stats = plugin.cache_stats()
+            if plugin_stats is not None:
+                stats[plugin.name] = plugin_stats
+        return {"plugins": stats}
+
+    if server_api_key:
+
+        async def verify_admin(
+            x_api_key: Optional[str] = Header(None, alias="X-API-Key"),
+        ) -> None:
+            if x_api_key != server_api_key:
+                raise HTTPException(status_code=401, detail="Invalid API Key")
+
+        admin_args = {"dependencies": [Depends(verify_admin)]}
+        memory = MemoryTracker()
+        profiling = False
+
+        @app.get("/admin/profile", response_class=PlainTextResponse, **admin_args)
+        async def profile(
+            seconds: float = Query(5.0, gt=0, le=60),
+            interval: float = Query(0.005, ge=0.001, le=1),
+            mode: str = "wall",
+        ):
+            """Sample all thread stacks and return them as collapsed stacks."""
+            nonlocal profiling
+            if profiling:
+                raise HTTPException(status_code=409, detail="Profiler already running")
+            profiling = True
             try:
-                await plugin.run_teardown()
-            except Exception as exc:  # pragma: no cover - pass through
-                logger.error(
-                    "Failed to teardown plugin '%s': %s",
-                    plugin.module.__name__,
-                    exc,
-                )
-        plugins = load_plugins(plugin_names, reload_modules=True)
-        return {"loaded": [p.module.__name__ for p in plugins]}
+                stacks = await asyncio.to_thread(sample_stacks, seconds, interval, mode)
+            except ValueError as exc:
+                raise HTTPException(status_code=400, detail=str(exc)) from exc
+            finally:
+                profiling = False
+            return PlainTextResponse(format_collapsed(stacks))
+
+        @app.post("/admin/memory/start", **admin_args)
+        def memory_start(frames: int = Query(1, ge=1, le=100)):
+            """Start tracing allocations with ``tracemalloc``."""
+            memory.start(frames)
+            return {"tracing": memory.tracing}
+
+        @app.post("/admin/memory/stop", **admin_args)
+        def memory_stop():
+            """Stop tracing allocations and drop stored snapshots."""
+            memory.stop()
+            return {"tracing": memory.tracing}
+
+        async def memory_report(method, limit: int, key_type: str):
+            try:
+                return await asyncio.to_thread(method, limit, key_type)
+            except ValueError as exc:
+                raise HTTPException(status_code=400, detail=str(exc)) from exc
+            except RuntimeError as exc:
+                raise HTTPException(status_code=409, detail=str(exc)) from exc
+
+        @app.get("/admin/memory/snapshot", **admin_args)
+        async def memory_snapshot(
+            limit: int = Query(20, ge=1, le=1000), key_type: str = "lineno"
+        ):
+            """Return the largest allocation sites of a new snapshot."""
+            return await memory_report(memory.snapshot, limit, key_type)
+
+        @app.get("/admin/memory/diff", **admin_args)
+        async def memory_diff(
+            limit: int = Query(20, ge=1, le=1000), key_type: str = "lineno"
+        ):
+            """Return allocation growth since the previous snapshot."""
+            return await memory_report(memory.diff, limit, key_type)
 
     class PasswordChange(BaseModel):
         username: str
@@ -355,84 +804,652 @@ def create_app(
             session.commit()
         return {"status": "ok"}
 
-    @app.post("/v1/chat/completions", **route_args)
-    async def chat_completions(req: ChatRequest):
-        """Handle Chat API calls and return a reversed assistant reply."""
-        if not req.messages:
-            return {"choices": []}
-        content = req.messages[-1].content
-        if req.stream:
+    class SessionRequest(BaseModel):
+        system: Optional[str] = None
 
-            async def event_stream():
-                text = content
-                for plugin in plugins:
-                    try:
-                        text = await plugin.run_preprocess(text)
-                    except Exception as exc:
-                        logger.exception("Preprocess plugin failed: %s", exc)
-                        raise HTTPException(
-                            status_code=500, detail="Plugin error"
-                        ) from exc
-
-                async for token in executor.astream(
+    def find_session(session_id: str) -> ChatSession:
+        session = sessions.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return session
+
+    @asynccontextmanager
+    async def session_turn(session: ChatSession, messages: List[Message]):
+        """Append new messages to ``session`` for one exchange.
+
+        User messages pass through the preprocess hooks once when they are
+        added. The turns are removed again if the exchange fails.
+        """
+        async with session.lock:
+            length = len(session)
+            try:
+                for message in messages:
+                    content = message.content
+                    if message.role == Role.USER:
+                        content = await run_hooks("preprocess", content)
+                    session.add(message.role.value, content)
+                yield session
+            except BaseException:
+                session.rollback(length)
+                raise
+
+    def session_prompt(session: ChatSession, max_tokens: Optional[int]):
+        """Return the prompt of ``session`` trimmed to the context window.
+
+        Also returns the number of history tokens left out.
+        """
+        if context.window is None:
+            context.window = executor.context_window() or 0
+        start, trimmed = context.fit(
+            session.turns, max_tokens or DEFAULT_MAX_TOKENS, session.context_start
+        )
+        session.context_start = start
+        if trimmed:
+            CONTEXT_TRIMMED_TOKENS.inc(trimmed)
+        annotate(tokens_trimmed=trimmed)
+        return session.prompt(start), trimmed
+
+    async def session_reply(session: ChatSession, req: ChatRequest):
+        async with session_turn(session, req.messages):
+            prompt, trimmed = session_prompt(session, req.max_tokens)
+            prompt_tokens = session.tokens - trimmed
+            response = await generate_reply(
+                prompt,
+                max_tokens=req.max_tokens,
+                temperature=req.temperature,
+                top_p=req.top_p,
+                stop=stop_list(req.stop),
+                preprocess=False,
+            )
+            # Like the streamed path, keep the model's own words in the
+            # history so the next prompt extends the previous one.
+            turn = session.add("assistant", response)
+            reply = await run_hooks("postprocess", response)
+        return {
+            "session_id": session.id,
+            "choices": [{"message": {"role": "assistant", "content": reply}}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": turn.tokens,
+                "total_tokens": prompt_tokens + turn.tokens,
+                "trimmed_tokens": trimmed,
+            },
+        }
+
+    async def session_tokens(session: ChatSession, req: ChatRequest):
+        """Yield the tokens of the next assistant turn of ``session``."""
+        async with session_turn(session, req.messages):
+            parts = []
+            prompt, _ = session_prompt(session, req.max_tokens)
+            async for token in generate_tokens(
+                prompt,
+                max_tokens=req.max_tokens,
+                temperature=req.temperature,
+                top_p=req.top_p,
+                stop=stop_list(req.stop),
+                preprocess=False,
+            ):
+                parts.append(token)
+                yield token
+            session.add("assistant", "".join(parts))
+
+    async def stream_session(session: ChatSession, req: ChatRequest):
+        async for token in session_tokens(session, req):
+            yield encode_stream_chunk(token)
+        request_timer = current_timer()
+        if request_timer is not None:
+            yield json.dumps({"timings": request_timer.as_dict()}) + "\n"
+
+    @app.post("/v1/sessions", status_code=201, **route_args)
+    def create_session(req: Optional[SessionRequest] = None):
+        """Start a conversation whose history is kept by the server."""
+        session = sessions.create(req.system if req else None)
+        return {"id": session.id, "ttl": sessions.ttl}
+
+    @app.get("/v1/sessions/{session_id}", **route_args)
+    def get_session(session_id: str):
+        """Return the messages of a session with their token counts."""
+        return find_session(session_id).as_dict()
+
+    @app.delete("/v1/sessions/{session_id}", status_code=204, **route_args)
+    def delete_session(session_id: str):
+        if not sessions.delete(session_id):
+            raise HTTPException(status_code=404, detail="Session not found")
+
+    async def generation_events(generation: Generation, start: int = 0):
+        """Yield server-sent events for the tokens of ``generation``.
+
+        Each token event carries its index as the event id, so a reconnecting
+        client can send it back as ``Last-Event-ID``.
+        """
+        try:
+            async for index, token in generation.follow(start):
+                yield f"id: {index}\ndata: {encode_stream_chunk(token)}\n"
+        except TokensDropped as exc:
+            yield f"event: error\ndata: {json.dumps({'error': str(exc)})}\n\n"
+            return
+        summary = json.dumps(generation.as_dict())
+        yield f"event: {generation.status}\ndata: {summary}\n\n"
+
+    def start_generation(text: str, req: Union[ChatRequest, CompletionRequest]):
+        """Run a completion detached from the request.
+
+        Streaming requests get the events of the new generation right away.
+        Otherwise the generation id is returned with a 202 status.
+        """
+        try:
+            generation = generations.start(
+                generate_tokens(
                     text,
                     max_tokens=req.max_tokens,
                     temperature=req.temperature,
                     top_p=req.top_p,
-                ):
-                    yield json.dumps(
-                        {"choices": [{"delta": {"content": token}}]}
-                    ) + "\n"
+                    stop=stop_list(req.stop),
+                )
+            )
+        except RuntimeError as exc:
+            raise HTTPException(status_code=503, detail=str(exc)) from exc
+        if req.stream:
+            return StreamingResponse(
+                generation_events(generation),
+                media_type="text/event-stream",
+                headers={"X-Generation-Id": generation.id},
+            )
+        return JSONResponse(generation.as_dict(), status_code=202)
+
+    def find_generation(generation_id: str) -> Generation:
+        generation = generations.get(generation_id)
+        if generation is None:
+            raise HTTPException(status_code=404, detail="Generation not found")
+        return generation
+
+    @app.get("/v1/generations/{generation_id}", **route_args)
+    def get_generation(generation_id: str):
+        """Return the status of a background generation.
 
-            return StreamingResponse(event_stream(), media_type="text/event-stream")
+        ``text`` holds the output so far while all of it is still buffered.
+        """
+        generation = find_generation(generation_id)
+        text = "".join(generation.tokens(0)) if generation.first == 0 else None
+        return {**generation.as_dict(), "text": text}
+
+    @app.get("/v1/generations/{generation_id}/events", **route_args)
+    async def generation_stream(
+        generation_id: str,
+        last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    ):
+        """Stream the tokens of a generation from after ``Last-Event-ID``."""
+        generation = find_generation(generation_id)
+        try:
+            start = int(last_event_id) + 1 if last_event_id else 0
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+        if start < generation.first:
+            raise HTTPException(
+                status_code=410, detail=str(TokensDropped(generation.first))
+            )
+        return StreamingResponse(
+            generation_events(generation, start), media_type="text/event-stream"
+        )
+
+    @app.delete("/v1/generations/{generation_id}", status_code=204, **route_args)
+    def cancel_generation(generation_id: str):
+        if not generations.delete(generation_id):
+            raise HTTPException(status_code=404, detail="Generation not found")
+
+    @app.post("/v1/chat/completions", **llm_route_args)
+    async def chat_completions(req: ChatRequest):
+        """Handle Chat API calls and return a reversed assistant reply.
+
+        With ``session_id`` the messages are appended to that session and the
+        model sees the whole conversation.
+        """
+        if req.session_id is not None:
+            if req.background:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Sessions cannot run in the background",
+                )
+            session = find_session(req.session_id)
+            if req.stream:
+                return StreamingResponse(
+                    stream_session(session, req), media_type="text/event-stream"
+                )
+            return await session_reply(session, req)
+        if not req.messages:
+            return {"choices": []}
+        content = req.messages[-1].content
+        if req.background:
+            return start_generation(content, req)
+        if req.stream:
+
+            event_stream = stream_tokens(
+                content,
+                max_tokens=req.max_tokens,
+                temperature=req.temperature,
+                top_p=req.top_p,
+                stop=stop_list(req.stop),
+            )
+            return StreamingResponse(event_stream, media_type="text/event-stream")
 
         reply = await apply_plugins(
             content,
             max_tokens=req.max_tokens,
             temperature=req.temperature,
             top_p=req.top_p,
+            stop=stop_list(req.stop),
         )
         return {"choices": [{"message": {"role": "assistant", "content": reply}}]}
 
-    @app.post("/v1/completions", **route_args)
+    @app.post("/v1/completions", **llm_route_args)
     async def completions(req: CompletionRequest):
-        """Return a completion for the given prompt using the mock backend."""
-        if req.stream:
+        """Return a completion for the given prompt using the mock backend.
 
-            async def event_stream():
-                text = req.prompt
-                for plugin in plugins:
-                    try:
-                        text = await plugin.run_preprocess(text)
-                    except Exception as exc:
-                        logger.exception("Preprocess plugin failed: %s", exc)
-                        raise HTTPException(
-                            status_code=500, detail="Plugin error"
-                        ) from exc
-
-                async for token in executor.astream(
-                    text,
-                    max_tokens=req.max_tokens,
-                    temperature=req.temperature,
-                    top_p=req.top_p,
-                ):
-                    yield json.dumps(
-                        {"choices": [{"delta": {"content": token}}]}
-                    ) + "\n"
+        ``prompt`` may be a list and ``n`` may ask for several completions per
+        prompt. Choices are then returned in order with an ``index``.
+        """
+        if isinstance(req.prompt, list) or req.n > 1:
+            if req.stream or req.background:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Streaming supports a single prompt with n=1",
+                )
+            prompts = req.prompt if isinstance(req.prompt, list) else [req.prompt]
+            replies = await complete_batch(
+                prompts,
+                req.n,
+                max_tokens=req.max_tokens,
+                temperature=req.temperature,
+                top_p=req.top_p,
+                stop=stop_list(req.stop),
+            )
+            return {
+                "choices": [
+                    {"index": i, "text": reply} for i, reply in enumerate(replies)
+                ]
+            }
+        if req.background:
+            return start_generation(req.prompt, req)
+        if req.stream:
 
-            return StreamingResponse(event_stream(), media_type="text/event-stream")
+            event_stream = stream_tokens(
+                req.prompt,
+                max_tokens=req.max_tokens,
+                temperature=req.temperature,
+                top_p=req.top_p,
+                stop=stop_list(req.stop),
+            )
+            return StreamingResponse(event_stream, media_type="text/event-stream")
 
         reply = await apply_plugins(
             req.prompt,
             max_tokens=req.max_tokens,
             temperature=req.temperature,
             top_p=req.top_p,
+            stop=stop_list(req.stop),
         )
         return {"choices": [{"text": reply}]}
 
+    @app.post("/v1/embeddings", **llm_route_args)
+    async def create_embeddings(req: EmbeddingRequest):
+        """Return an embedding per input.
+
+        Inputs of concurrent requests are embedded together and repeated
+        inputs are answered from a cache.
+        """
+        texts = [req.input] if isinstance(req.input, str) else req.input
+        if not texts or len(texts) > embedding_max_inputs:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Embeddings take 1 to {embedding_max_inputs} inputs",
+            )
+        if not all(texts):
+            raise HTTPException(status_code=400, detail="Inputs must not be empty")
+        try:
+            used_model = executor.embedding_model(req.model, default=embedding_model)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        with QUEUE_DEPTH.track():
+            vectors = await embeddings.embed(texts, used_model)
+        prompt_tokens = sum(context.count(text) for text in texts)
+        return {
+            "object": "list",
+            "data": [
+                {
+                    "object": "embedding",
+                    "index": i,
+                    "embedding": encode_embedding(vector, req.encoding_format),
+                }
+                for i, vector in enumerate(vectors)
+            ],
+            "model": used_model,
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    def token_usage(prompts: List[str], replies: List[str]) -> Dict[str, int]:
+        """Return the usage of a batch request counted with the model tokenizer."""
+        prompt_tokens = sum(context.count(text) for text in prompts)
+        completion_tokens = sum(executor.count_tokens(reply) for reply in replies)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    async def batch_request(url: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer one request of a batch job like the endpoint at ``url``."""
+        model = ChatRequest if url == "/v1/chat/completions" else CompletionRequest
+        try:
+            req = model.model_validate(body)
+        except ValidationError as exc:
+            detail = "; ".join(
+                f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors()
+            )
+            raise HTTPException(status_code=400, detail=detail) from exc
+        if req.stream or req.background or getattr(req, "session_id", None):
+            raise HTTPException(
+                status_code=400,
+                detail="Batch requests cannot stream, run detached or use sessions",
+            )
+        options = {
+            "max_tokens": req.max_tokens,
+            "temperature": req.temperature,
+            "top_p": req.top_p,
+            "stop": stop_list(req.stop),
+            "background": True,
+        }
+        if isinstance(req, ChatRequest):
+            if not req.messages:
+                return {"choices": [], "usage": token_usage([], [])}
+            content = req.messages[-1].content
+            reply = await apply_plugins(content, **options)
+            return {
+                "choices": [{"message": {"role": "assistant", "content": reply}}],
+                "usage": token_usage([content], [reply]),
+            }
+        if isinstance(req.prompt, list) or req.n > 1:
+            prompts = req.prompt if isinstance(req.prompt, list) else [req.prompt]
+            replies = await complete_batch(prompts, req.n, **options)
+            choices = [{"index": i, "text": reply} for i, reply in enumerate(replies)]
+            prompts = [prompt for prompt in prompts for _ in range(req.n)]
+        else:
+            prompts = [req.prompt]
+            replies = [await apply_plugins(req.prompt, **options)]
+            choices = [{"text": replies[0]}]
+        return {"choices": choices, "usage": token_usage(prompts, replies)}
+
+    def interactive_busy() -> bool:
+        return bool(batch_yield_depth) and QUEUE_DEPTH.get() >= batch_yield_depth
+
+    batch_runner = BatchRunner(
+        engine,
+        settings.batch_dir,
+        batch_request,
+        endpoints=("/v1/chat/completions", "/v1/completions"),
+        workers=settings.batch_workers,
+        busy=interactive_busy,
+    )
+    app.state.batch_runner = batch_runner
+
+    def find_batch(job_id: str) -> BatchJob:
+        job = batch_runner.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        return job
+
+    @app.post("/v1/batches", status_code=201, **route_args)
+    async def create_batch(request: Request):
+        """Queue a job for the JSONL file of requests sent as the body."""
+        try:
+            job = await batch_runner.submit(request.stream())
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        return describe_job(job)
+
+    @app.get("/v1/batches", **route_args)
+    async def list_batches(limit: int = Query(20, ge=1, le=1000)):
+        """Return the most recent batch jobs."""
+        jobs = batch_runner.jobs(limit)
+        return {"object": "list", "data": [describe_job(job) for job in jobs]}
+
+    @app.get("/v1/batches/{job_id}", **route_args)
+    async def get_batch(job_id: str):
+        """Return the status, progress and throughput of a batch job."""
+        return describe_job(find_batch(job_id))
+
+    @app.post("/v1/batches/{job_id}/cancel", **route_args)
+    async def cancel_batch(job_id: str):
+        find_batch(job_id)
+        return describe_job(batch_runner.cancel(job_id))
+
+    @app.post("/v1/batches/{job_id}/resume", **route_args)
+    async def resume_batch(job_id: str):
+        """Queue the remaining requests of a cancelled or failed job."""
+        find_batch(job_id)
+        try:
+            return describe_job(batch_runner.resume(job_id))
+        except RuntimeError as exc:
+            raise HTTPException(status_code=409, detail=str(exc)) from exc
+
+    @app.get("/v1/batches/{job_id}/output", **route_args)
+    async def batch_output(job_id: str):
+        """Return the results written so far as JSONL."""
+        find_batch(job_id)
+        path = batch_runner.output_path(job_id)
+        if not path.exists():
+            raise HTTPException(status_code=404, detail="No results yet")
+        return FileResponse(path, media_type="application/jsonl", filename=path.name)
+
+    class SocketFrame(BaseModel):
+        type: str
+        id: str = "0"
+        content: str = ""
+        max_tokens: Optional[int] = None
+        temperature: Optional[float] = None
+        top_p: Optional[float] = None
+        stop: Optional[Union[str, List[str]]] = None
+        session: Optional[str] = None
+        api_key: Optional[str] = None
+        token: Optional[str] = None
+
+    async def authenticate_frame(websocket: WebSocket) -> bool:
+        """Check the credentials of the first frame of an accepted socket."""
+        try:
+            text = await asyncio.wait_for(websocket.receive_text(), WS_AUTH_TIMEOUT)
+            frame = SocketFrame.model_validate_json(text)
+            if frame.type != "auth":
+                return False
+            authenticate(
+                frame.api_key, f"Bearer {frame.token}" if frame.token else None
+            )
+        except (asyncio.TimeoutError, ValidationError, HTTPException):
+            return False
+        return True
+
+    async def chat_socket(websocket: WebSocket) -> None:
+        """Serve chat conversations multiplexed over one WebSocket.
+
+        Credentials are checked once per connection, from the headers or,
+        for browsers which cannot set headers, from a first ``auth`` frame.
+        They are never read from the URL, which ends up in access logs. Each
+        ``message`` frame carries only the new user turn and streams the reply
+        back as ``{"id", "t"}`` token frames followed by a ``done`` frame.
+        """
+        x_api_key = websocket.headers.get("x-api-key")
+        authorization = websocket.headers.get("authorization")
+        in_headers = bool(x_api_key or authorization)
+        if server_api_key and in_headers:
+            try:
+                authenticate(x_api_key, authorization)
+            except HTTPException:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+        await ensure_plugins_ready()
+        await websocket.accept()
+        if server_api_key and not in_headers:
+            try:
+                if not await authenticate_frame(websocket):
+                    await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                    return
+            except WebSocketDisconnect:
+                return
+
+        send_lock = asyncio.Lock()
+        generations: Dict[str, asyncio.Task] = {}
+        closed = False
+
+        async def send(text: str) -> None:
+            async with send_lock:
+                await websocket.send_text(text)
+
+        async def reply(conversation: str, **fields: Any) -> None:
+            frame = {"id": conversation, **fields}
+            await send(json.dumps(frame, separators=(",", ":")))
+
+        async def generate(frame: SocketFrame, session: Optional[ChatSession]) -> None:
+            prefix = socket_frame_prefix(frame.id)
+            tokens = 0
+            options = {
+                "max_tokens": frame.max_tokens,
+                "temperature": frame.temperature,
+                "top_p": frame.top_p,
+                "stop": stop_list(frame.stop),
+            }
+            if session is None:
+                stream = generate_tokens(frame.content, **options)
+            else:
+                message = Message(role=Role.USER, content=frame.content)
+                req = ChatRequest(messages=[message], **options)
+                stream = session_tokens(session, req)
+            try:
+                try:
+                    async for token in stream:
+                        tokens += 1
+                        await send(encode_socket_frame(prefix, token))
+                finally:
+                    await stream.aclose()
+                await reply(frame.id, done=True, tokens=tokens)
+            except asyncio.CancelledError:
+                if not closed:
+                    # Cancelled by a cancel frame, the client is still there
+                    await reply(frame.id, cancelled=True, tokens=tokens)
+                raise
+            except HTTPException as exc:
+                await reply(frame.id, error=exc.detail)
+            except Exception as exc:
+                logger.exception("WebSocket generation failed: %s", exc)
+                await reply(frame.id, error="Generation failed")
+            finally:
+                generations.pop(frame.id, None)
+
+        async def start(frame: SocketFrame) -> None:
+            if frame.id in generations:
+                await reply(frame.id, error="Conversation is busy")
+                return
+            if len(generations) >= ws_max_conversations:
+                await reply(frame.id, error="Too many active conversations")
+                return
+            session = None
+            if frame.session is not None:
+                session = sessions.get(frame.session)
+                if session is None:
+                    await reply(frame.id, error="Session not found")
+                    return
+            if socket_limiter is not None:
+                if await socket_limiter(websocket):
+                    await reply(frame.id, error="Too Many Requests")
+                    return
+            generations[frame.id] = asyncio.create_task(generate(frame, session))
+
+        with WEBSOCKET_CONNECTIONS.track():
+            try:
+                while True:
+                    try:
+                        frame = SocketFrame.model_validate_json(
+                            await websocket.receive_text()
+                        )
+                    except ValidationError:
+                        await send('{"error":"Invalid frame"}')
+                        continue
+                    if frame.type == "message":
+                        await start(frame)
+                    elif frame.type == "cancel":
+                        task = generations.get(frame.id)
+                        if task is not None:
+                            task.cancel()
+                    elif frame.type == "auth":
+                        pass  # Already authenticated or no key required
+                    else:
+                        error = f"Unknown frame type '{frame.type}'"
+                        await reply(frame.id, error=error)
+            except WebSocketDisconnect:
+                pass
+            finally:
+                closed = True
+                tasks = list(generations.values())
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Added without the app dependencies, which only apply to HTTP requests
+    app.router.add_websocket_route("/v1/chat/ws", chat_socket)
+
     return app
 
 
+def listen_fds() -> Optional[int]:
+    """Return the first socket passed by systemd socket activation, if any."""
+    if os.environ.get("LISTEN_PID") != str(os.getpid()):
+        return None
+    if int(os.environ.get("LISTEN_FDS", "0")) < 1:
+        return None
+    return 3  # SD_LISTEN_FDS_START
+
+
+def serving_options(settings: Settings, **overrides) -> Dict[str, Any]:
+    """Return ``uvicorn.run`` options for the serving profile.
+
+    ``auto`` for the loop or HTTP implementation selects uvloop and httptools
+    when they are installed. Options in ``overrides`` that are not ``None``
+    take precedence over ``settings``.
+    """
+    values = {
+        key: getattr(settings, key)
+        for key in (
+            "uds",
+            "fd",
+            "loop",
+            "http",
+            "backlog",
+            "keepalive_timeout",
+            "limit_concurrency",
+        )
+    }
+    values.update({k: v for k, v in overrides.items() if v is not None})
+    loop, http = values["loop"], values["http"]
+    if loop not in ("auto", "asyncio", "uvloop"):
+        raise ValueError(f"Unknown event loop '{loop}'")
+    if http not in ("auto", "h11", "httptools"):
+        raise ValueError(f"Unknown HTTP implementation '{http}'")
+    if loop == "auto":
+        loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    if http == "auto":
+        http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    options: Dict[str, Any] = {
+        "loop": loop,
+        "http": http,
+        "backlog": values["backlog"],
+        "timeout_keep_alive": values["keepalive_timeout"],
+        "limit_concurrency": values["limit_concurrency"],
+    }
+    fd = values["fd"] if values["fd"] is not None else listen_fds()
+    if fd is not None:
+        options["fd"] = fd
+    elif values["uds"]:
+        options["uds"] = str(values["uds"])
+    return options
+
+
 def start_server(
     host: str = "127.0.0.1",
     port: int = 11434,
@@ -449,8 +1466,50 @@ def start_server(
     token_exp_minutes: Optional[int] = None,
     cors_origins: Optional[str] = None,
     log_level: Optional[str] = None,
+    workers: Optional[int] = None,
+    max_requests: Optional[int] = None,
+    uds: Optional[str] = None,
+    fd: Optional[int] = None,
+    loop: Optional[str] = None,
+    http: Optional[str] = None,
+    backlog: Optional[int] = None,
+    keepalive_timeout: Optional[int] = None,
+    limit_concurrency: Optional[int] = None,
 ) -> None:
-    """Run the HTTP server."""
+    """Run the HTTP server.
+
+    With ``workers`` above one the application is created once and served by
+    forked worker processes, see :mod:`moogla.supervisor`. Serving options
+    that are not given are read from :class:`Settings`.
+    """
+    settings = Settings()
+    if workers is None:
+        workers = settings.workers
+    if workers > 1 and (db_url or settings.db_url) == "sqlite:///:memory:":
+        logger.warning(
+            "Each worker keeps its own in-memory database; "
+            "set MOOGLA_DB_URL to share users and batch jobs between workers."
+        )
+    options = serving_options(
+        settings,
+        uds=uds,
+        fd=fd,
+        loop=loop,
+        http=http,
+        backlog=backlog,
+        keepalive_timeout=keepalive_timeout,
+        limit_concurrency=limit_concurrency,
+    )
+    logger.info(
+        "Serving with the %s event loop and the %s HTTP parser",
+        options["loop"],
+        options["http"],
+    )
+    metrics_dir = None
+    if workers > 1:
+        from .supervisor import prepare_metrics_dir
+
+        metrics_dir = prepare_metrics_dir()
     app = create_app(
         plugin_names=plugin_names,
         model=model,
@@ -466,4 +1525,19 @@ def start_server(
         cors_origins=cors_origins,
         log_level=log_level,
     )
-    uvicorn.run(app, host=host, port=port)
+    if workers > 1:
+        from .supervisor import serve_workers
+
+        serve_workers(
+            app,
+            host,
+            port,
+            workers,
+            max_requests=max_requests,
+            metrics_dir=metrics_dir,
+            **options,
+        )
+    else:
+        if max_requests:
+            options["limit_max_requests"] = max_requests
+        uvicorn.run(app, host=host, port=port, **options)
@@ -0,0 +1,185 @@
+"""Server-side chat sessions holding conversation history.
+
+Clients create a session once and then send only new messages. Each turn
+stores its token count when it is added, so the size of a conversation is
+known without tokenizing the history again. Sessions are evicted least
+recently used first once ``max_sessions`` is reached and expire after ``ttl``
+seconds without use.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+ROLE_LABELS = {"system": "System", "user": "User", "assistant": "Assistant"}
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+class Turn:
+    """One message of a session."""
+
+    __slots__ = ("role", "content", "tokens")
+
+    def __init__(self, role: str, content: str, tokens: int) -> None:
+        self.role = role
+        self.content = content
+        self.tokens = tokens
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"role": self.role, "content": self.content, "tokens": self.tokens}
+
+
+def render_turn(role: str, content: str) -> str:
+    return f"{ROLE_LABELS.get(role, role.capitalize())}: {content}\n"
+
+
+class Session:
+    """Conversation history with a prompt rendered incrementally.
+
+    New turns only append to the rendered prompt, so consecutive prompts of a
+    session share a growing prefix that local backends can keep evaluated.
+    """
+
+    def __init__(self, session_id: str, count: Callable[[str], int]) -> None:
+        self.id = session_id
+        self.turns: List[Turn] = []
+        self.tokens = 0
+        # First turn inside the context window, see ContextManager.fit
+        self.context_start = 0
+        self.last_used = time.monotonic()
+        self._count = count
+        self._text = ""
+        self._offsets: List[int] = []
+        self._lock: Optional[asyncio.Lock] = None
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        """Lock serializing the turns of this session."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def add(self, role: str, content: str) -> Turn:
+        turn = Turn(role, content, self._count(content))
+        self.turns.append(turn)
+        self.tokens += turn.tokens
+        self._offsets.append(len(self._text))
+        self._text += render_turn(role, content)
+        return turn
+
+    def rollback(self, length: int) -> None:
+        """Drop the turns added after the session had ``length`` turns."""
+        if length >= len(self.turns):
+            return
+        del self.turns[length:]
+        self.tokens = sum(t.tokens for t in self.turns)
+        self.context_start = min(self.context_start, length)
+        self._text = self._text[: self._offsets[length]]
+        del self._offsets[length:]
+
+    def prompt(self, start: int = 0) -> str:
+        """Return the prompt asking the model for the next assistant turn.
+
+        Turns before ``start`` are left out except for system messages.
+        """
+        text = self._text
+        if start:
+            kept = [
+                render_turn(t.role, t.content)
+                for t in self.turns[:start]
+                if t.role == "system"
+            ]
+            end = self._offsets[start] if start < len(self.turns) else len(text)
+            text = "".join(kept) + text[end:]
+        return text + ROLE_LABELS["assistant"] + ":"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "messages": [t.as_dict() for t in self.turns],
+            "tokens": self.tokens,
+        }
+
+
+class SessionStore:
+    """Bounded mapping of session ids to sessions with idle expiry."""
+
+    def __init__(
+        self,
+        max_sessions: int = 1024,
+        ttl: float = 3600.0,
+        count: Callable[[str], int] = count_words,
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.count = count
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expired(self, session: Session, now: float) -> bool:
+        return bool(self.ttl) and now - session.last_used > self.ttl
+
+    def purge(self) -> None:
+        """Remove expired sessions.
+
+        Sessions are kept in order of last use, so only the expired ones at
+        the front are visited.
+        """
+        now = time.monotonic()
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if not self._expired(session, now):
+                break
+            self._sessions.popitem(last=False)
+            self.expirations += 1
+
+    def create(self, system: Optional[str] = None) -> Session:
+        """Start a session, optionally with a system message."""
+        self.purge()
+        session = Session(secrets.token_urlsafe(16), self.count)
+        if system:
+            session.add("system", system)
+        self._sessions[session.id] = session
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """Return the session and mark it used, or ``None`` if unknown."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        now = time.monotonic()
+        if self._expired(session, now):
+            del self._sessions[session_id]
+            self.expirations += 1
+            return None
+        session.last_used = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._sessions),
+            "max_size": self.max_sessions,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
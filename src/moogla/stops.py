@@ -0,0 +1,161 @@
+"""Find stop sequences in generated text as it is streamed.
+
+:class:`StopMatcher` runs an Aho-Corasick automaton over the generated
+characters, so every stop sequence is checked in a single pass no matter how
+many there are. Its state also tells how much of the text seen so far could
+still be the start of a stop sequence. That tail is held back until it is
+either ruled out or completes a stop, which handles stop sequences split
+across tokens.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import (
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
+
+Stop = Union[str, Sequence[str], None]
+
+
+def stop_list(stop: Stop) -> Optional[List[str]]:
+    """Normalize a ``stop`` request field to a list, or ``None`` if empty."""
+    if stop is None:
+        return None
+    stops = [stop] if isinstance(stop, str) else list(stop)
+    stops = [s for s in stops if s]
+    return stops or None
+
+
+class StopMatcher:
+    """Streaming multi-pattern matcher for stop sequences."""
+
+    def __init__(self, stops: Iterable[str]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Length of the matched prefix at each state
+        self._depth: List[int] = [0]
+        # Length of the longest stop sequence ending at each state
+        self._match: List[int] = [0]
+        for stop in stops:
+            self._add(stop)
+        self._link()
+        self._state = 0
+        self._held = ""
+        self.stopped = False
+
+    def _add(self, stop: str) -> None:
+        state = 0
+        for ch in stop:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._depth.append(self._depth[state] + 1)
+                self._match.append(0)
+            state = nxt
+        self._match[state] = max(self._match[state], len(stop))
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._match[nxt] = max(self._match[nxt], self._match[self._fail[nxt]])
+                queue.append(nxt)
+
+    def _step(self, state: int, ch: str) -> int:
+        goto = self._goto
+        while state and ch not in goto[state]:
+            state = self._fail[state]
+        return goto[state].get(ch, 0)
+
+    def feed(self, text: str) -> str:
+        """Return the part of ``text`` that can be emitted.
+
+        Text that may begin a stop sequence is held back for the next call.
+        Once a stop sequence is found :attr:`stopped` is set and only the text
+        before it is returned.
+        """
+        if self.stopped:
+            return ""
+        pending = self._held + text
+        offset = len(self._held)
+        state = self._state
+        for i, ch in enumerate(text):
+            state = self._step(state, ch)
+            if self._match[state]:
+                self.stopped = True
+                self._held = ""
+                return pending[: offset + i + 1 - self._match[state]]
+        self._state = state
+        split = len(pending) - self._depth[state]
+        self._held = pending[split:]
+        return pending[:split]
+
+    def flush(self) -> str:
+        """Return the text held back once the generation has ended."""
+        held, self._held = self._held, ""
+        return held
+
+
+def truncate(text: str, stops: Optional[Sequence[str]]) -> str:
+    """Return ``text`` up to the first stop sequence."""
+    if not stops:
+        return text
+    matcher = StopMatcher(stops)
+    return matcher.feed(text) + matcher.flush()
+
+
+def stop_tokens(tokens: Iterable[str], stops: Sequence[str]) -> Iterator[str]:
+    """Yield ``tokens`` until a stop sequence appears and close the source."""
+    matcher = StopMatcher(stops)
+    source = iter(tokens)
+    try:
+        for token in source:
+            text = matcher.feed(token)
+            if text:
+                yield text
+            if matcher.stopped:
+                return
+        held = matcher.flush()
+        if held:
+            yield held
+    finally:
+        close = getattr(source, "close", None)
+        if close is not None:
+            close()
+
+
+async def astop_tokens(
+    tokens: AsyncIterator[str], stops: Sequence[str]
+) -> AsyncIterator[str]:
+    """Asynchronous version of :func:`stop_tokens`."""
+    matcher = StopMatcher(stops)
+    try:
+        async for token in tokens:
+            text = matcher.feed(token)
+            if text:
+                yield text
+            if matcher.stopped:
+                return
+        held = matcher.flush()
+        if held:
+            yield held
+    finally:
+        aclose = getattr(tokens, "aclose", None)
+        if aclose is not None:
+            await aclose()
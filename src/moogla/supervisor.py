@@ -0,0 +1,299 @@
+"""Pre-fork supervisor running several server workers on one socket.
+
+The application, including the model weights of local backends, is created
+once in the supervisor and then inherited by forked workers, so the memory
+holding the weights is shared copy-on-write instead of being loaded once per
+worker. All workers accept connections from a single listening socket.
+
+The supervisor restarts workers that exit. On ``SIGHUP`` it replaces the
+workers one at a time, starting each replacement and waiting until it
+accepts connections before stopping the old worker. ``SIGTERM`` and
+``SIGINT`` shut every worker down gracefully.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import select
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from sqlalchemy.pool import StaticPool
+
+logger = logging.getLogger(__name__)
+
+# Seconds a new worker may take to run the application startup
+READY_TIMEOUT = 60.0
+
+
+def prepare_metrics_dir() -> Optional[str]:
+    """Point ``MOOGLA_METRICS_DIR`` at a fresh directory if it is unset.
+
+    Workers write metric snapshots there so ``/metrics`` reports the sum over
+    all workers. Returns the created directory so it can be removed later.
+    """
+    if os.environ.get("MOOGLA_METRICS_DIR"):
+        return None
+    path = tempfile.mkdtemp(prefix="moogla-metrics-")
+    os.environ["MOOGLA_METRICS_DIR"] = path
+    return path
+
+
+def bind_socket(
+    host: str,
+    port: int,
+    *,
+    uds: Optional[str] = None,
+    fd: Optional[int] = None,
+    backlog: int = 2048,
+) -> socket.socket:
+    """Return a listening socket shared by the workers.
+
+    ``fd`` adopts an already listening socket such as one passed by systemd
+    and ``uds`` binds a Unix domain socket instead of ``host`` and ``port``.
+    """
+    if fd is not None:
+        sock = socket.socket(fileno=fd)
+    elif uds:
+        if os.path.exists(uds):
+            os.unlink(uds)  # Stale socket left by a previous run
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(uds)
+        os.chmod(uds, 0o666)
+    else:
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class _WorkerServer(uvicorn.Server):
+    """Uvicorn server that reports readiness to the supervisor."""
+
+    def __init__(self, config: uvicorn.Config, ready_fd: int) -> None:
+        super().__init__(config)
+        self.ready_fd = ready_fd
+
+    async def startup(self, sockets=None) -> None:
+        await super().startup(sockets=sockets)
+        try:
+            if self.started:
+                os.write(self.ready_fd, b"1")
+        except OSError:
+            pass  # The supervisor is not waiting for this worker
+        finally:
+            os.close(self.ready_fd)
+
+
+class Supervisor:
+    """Fork and supervise ``workers`` processes serving ``app``."""
+
+    def __init__(
+        self,
+        app: Any,
+        sock: socket.socket,
+        workers: int,
+        *,
+        max_requests: Optional[int] = None,
+        graceful_timeout: float = 30.0,
+        config_options: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.config_options = config_options or {}
+        self.children: List[int] = []
+        self.started: Dict[int, float] = {}
+        self.stopping = False
+        self.rotate = False
+
+    # Worker side -------------------------------------------------------------
+    def _run_worker(self, ready_fd: int) -> None:
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+        engine = getattr(self.app.state, "engine", None)
+        if engine is not None and not isinstance(engine.pool, StaticPool):
+            # Connections opened by the supervisor must not be shared. A
+            # static pool holds the only connection to an in-memory database,
+            # so each worker keeps its own copy instead.
+            engine.dispose(close=False)
+        config = uvicorn.Config(
+            self.app,
+            limit_max_requests=self.max_requests,
+            timeout_graceful_shutdown=self.graceful_timeout,
+            **self.config_options,
+        )
+        _WorkerServer(config, ready_fd).run(sockets=[self.sock])
+
+    # Supervisor side ---------------------------------------------------------
+    def spawn(self, wait_ready: bool = False) -> bool:
+        """Fork a worker, optionally waiting until it accepts connections."""
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 0
+            try:
+                self._run_worker(write_fd)
+            except SystemExit as exc:
+                code = exc.code if isinstance(exc.code, int) else 1
+            except BaseException:
+                logger.exception("Worker %s crashed", os.getpid())
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        os.close(write_fd)
+        self.children.append(pid)
+        self.started[pid] = time.monotonic()
+        logger.info("Started worker %s", pid)
+        if wait_ready:
+            return self._wait_ready(pid, read_fd)
+        os.close(read_fd)
+        return True
+
+    def _wait_ready(self, pid: int, read_fd: int) -> bool:
+        try:
+            ready, _, _ = select.select([read_fd], [], [], READY_TIMEOUT)
+            ok = bool(ready) and os.read(read_fd, 1) == b"1"
+        finally:
+            os.close(read_fd)
+        if not ok:
+            logger.error("Worker %s failed to start", pid)
+        return ok
+
+    def _signal(self, pid: int, sig: int) -> None:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self) -> List[int]:
+        # Only wait for workers: other children, such as isolated plugin
+        # processes, are reaped by their owners
+        exited = []
+        for pid in list(self.children):
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done, status = pid, 0
+            if done == 0:
+                continue
+            self.children.remove(pid)
+            exited.append(pid)
+            if time.monotonic() - self.started.pop(pid, 0.0) < 1.0:
+                # Avoid a tight restart loop when startup keeps failing
+                time.sleep(1.0)
+            logger.info(
+                "Worker %s exited with status %s",
+                pid,
+                os.waitstatus_to_exitcode(status),
+            )
+        return exited
+
+    def _stop_worker(self, pid: int) -> None:
+        self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while pid in self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        if pid in self.children:
+            self._signal(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self.children.remove(pid)
+            self.started.pop(pid, None)
+
+    def _rotate(self) -> None:
+        logger.info("Rotating %d workers", len(self.children))
+        for old in list(self.children):
+            if self.stopping:
+                return
+            if not self.spawn(wait_ready=True):
+                logger.error("Stopping rotation, worker %s kept", old)
+                return
+            self._stop_worker(old)
+
+    def _handle_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def _handle_rotate(self, signum, frame) -> None:
+        self.rotate = True
+
+    def run(self) -> None:
+        """Start the workers and supervise them until asked to stop."""
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_rotate)
+        try:
+            while not self.stopping:
+                self._reap()
+                if self.rotate:
+                    self.rotate = False
+                    self._rotate()
+                # Also replaces workers that exited while a rotation was
+                # stopping another one
+                while len(self.children) < self.workers and not self.stopping:
+                    self.spawn()
+                time.sleep(0.1)
+        finally:
+            logger.info("Stopping %d workers", len(self.children))
+            for pid in list(self.children):
+                self._signal(pid, signal.SIGTERM)
+            deadline = time.monotonic() + self.graceful_timeout + 5
+            while self.children and time.monotonic() < deadline:
+                self._reap()
+                time.sleep(0.05)
+            for pid in list(self.children):
+                self._signal(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                self.children.remove(pid)
+            self.sock.close()
+
+
+def serve_workers(
+    app: Any,
+    host: str,
+    port: int,
+    workers: int,
+    *,
+    max_requests: Optional[int] = None,
+    metrics_dir: Optional[str] = None,
+    **config_options: Any,
+) -> None:
+    """Serve ``app`` from ``workers`` forked processes sharing one socket."""
+    if not hasattr(os, "fork"):
+        raise RuntimeError("Multiple workers require a platform with fork()")
+    uds = config_options.pop("uds", None)
+    fd = config_options.pop("fd", None)
+    sock = bind_socket(
+        host, port, uds=uds, fd=fd, backlog=config_options.pop("backlog", 2048)
+    )
+    if fd is not None:
+        address = f"fd {fd}"
+    else:
+        address = uds or f"{host}:{port}"
+    logger.info("Listening on %s with %d workers", address, workers)
+    try:
+        Supervisor(
+            app,
+            sock,
+            workers,
+            max_requests=max_requests,
+            config_options=config_options,
+        ).run()
+    finally:
+        if uds and os.path.exists(uds):
+            os.unlink(uds)
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
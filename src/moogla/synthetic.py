@@ -0,0 +1,255 @@
+"""Deterministic synthetic LLM backend for benchmarks and capacity tests.
+
+Select it with a model string such as
+``synthetic:prompt_ms=40,token_ms=8,jitter=0.2,fail=0.01,seed=7``. The
+generated text depends only on the prompt, the seed and ``max_tokens`` while
+delays and failures follow a sequence seeded by ``seed``, so runs are
+reproducible without a model or network access.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+from array import array
+from dataclasses import dataclass, fields
+from typing import AsyncIterator, Iterator, List, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from .embeddings import encode_embedding
+from .stops import astop_tokens, stop_list, truncate
+
+PREFIX = "synthetic"
+
+_VOCAB = (
+    "the of and to in is was for on that with as by at from it an be this are "
+    "have or not but which one all were when we there can been has more if no "
+    "out so what time up other about into than them only new some could these "
+    "two may first then do any like my now over such our man me even most made"
+).split()
+
+
+class SyntheticFailure(RuntimeError):
+    """Raised when the synthetic backend simulates a failed request."""
+
+
+def is_synthetic(model: str) -> bool:
+    return model == PREFIX or model.startswith(PREFIX + ":")
+
+
+@dataclass
+class SyntheticBackend:
+    """Generate deterministic tokens with configurable timing."""
+
+    prompt_ms: float = 0.0
+    token_ms: float = 0.0
+    jitter: float = 0.0
+    fail: float = 0.0
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        # Timing and failures follow one seeded sequence across requests so a
+        # failure rate applies to repeated prompts as well.
+        self._timing = random.Random(self.seed)
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "SyntheticBackend":
+        """Parse ``synthetic:key=value,...`` into a backend."""
+        _, _, options = spec.partition(":")
+        known = {f.name for f in fields(cls)}
+        values = {}
+        for item in filter(None, (o.strip() for o in options.split(","))):
+            key, sep, value = item.partition("=")
+            if not sep or key not in known:
+                raise ValueError(f"Invalid synthetic model option '{item}'")
+            values[key] = int(value) if key == "seed" else float(value)
+        return cls(**values)
+
+    # Deterministic generation ------------------------------------------------
+    def _rng(self, prompt: str) -> random.Random:
+        digest = hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest()
+        return random.Random(int.from_bytes(digest, "big") ^ self.seed)
+
+    def tokens(self, prompt: str, max_tokens: int) -> List[str]:
+        """Return the tokens generated for ``prompt``."""
+        rng = self._rng(prompt)
+        return [" " + rng.choice(_VOCAB) for _ in range(max_tokens)]
+
+    def embed(self, texts: List[str], dimensions: int = 16) -> List[List[float]]:
+        """Return a deterministic unit vector per text."""
+        vectors = []
+        for text in texts:
+            rng = self._rng(text)
+            vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+            norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+            vectors.append([v / norm for v in vector])
+        return vectors
+
+    def _delay(self, rng: random.Random, ms: float) -> float:
+        if ms <= 0:
+            return 0.0
+        if self.jitter:
+            ms *= 1 + rng.uniform(-self.jitter, self.jitter)
+        return max(ms, 0.0) / 1000
+
+    def _check_failure(self, rng: random.Random) -> None:
+        if self.fail and rng.random() < self.fail:
+            raise SyntheticFailure("Synthetic backend failure")
+
+    # Sync API ------------------------------------------------------------------
+    def stream(self, prompt: str, max_tokens: int) -> Iterator[str]:
+        rng = self._timing
+        time.sleep(self._delay(rng, self.prompt_ms))
+        self._check_failure(rng)
+        for token in self.tokens(prompt, max_tokens):
+            time.sleep(self._delay(rng, self.token_ms))
+            yield token
+
+    def complete(self, prompt: str, max_tokens: int) -> str:
+        return "".join(self.stream(prompt, max_tokens))
+
+    # Async API -----------------------------------------------------------------
+    async def astream(self, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        rng = self._timing
+        await asyncio.sleep(self._delay(rng, self.prompt_ms))
+        self._check_failure(rng)
+        for token in self.tokens(prompt, max_tokens):
+            await asyncio.sleep(self._delay(rng, self.token_ms))
+            yield token
+
+    async def acomplete(self, prompt: str, max_tokens: int) -> str:
+        return "".join([t async for t in self.astream(prompt, max_tokens)])
+
+
+def create_openai_app(backend: Optional[SyntheticBackend] = None) -> FastAPI:
+    """Return an OpenAI compatible app serving synthetic completions.
+
+    The app implements ``/v1/chat/completions`` and ``/v1/completions`` with
+    server-sent event streaming and ``/v1/embeddings`` with
+    :meth:`SyntheticBackend.embed` so ``LLMExecutor`` can be pointed at it via
+    ``api_base`` to exercise the remote client path without network access.
+    Like a real server it ends the generated text before the first ``stop``
+    sequence.
+    """
+    from .executor import DEFAULT_MAX_TOKENS
+
+    backend = backend or SyntheticBackend()
+    app = FastAPI(title="Moogla synthetic OpenAI stand-in")
+
+    def _prompt(body: dict) -> str:
+        if "messages" in body:
+            messages = body.get("messages") or [{}]
+            return str(messages[-1].get("content", ""))
+        prompt = body.get("prompt", "")
+        return prompt if isinstance(prompt, str) else "".join(prompt)
+
+    async def _handle(request: Request, chat: bool):
+        body = await request.json()
+        prompt = _prompt(body)
+        max_tokens = body.get("max_tokens") or DEFAULT_MAX_TOKENS
+        stops = stop_list(body.get("stop"))
+        model = body.get("model", PREFIX)
+        ident = f"cmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        kind = "chat.completion" if chat else "text_completion"
+
+        if body.get("stream"):
+
+            async def events():
+                tokens = backend.astream(prompt, max_tokens)
+                if stops:
+                    tokens = astop_tokens(tokens, stops)
+                try:
+                    async for token in tokens:
+                        if chat:
+                            choice = {"index": 0, "delta": {"content": token}}
+                        else:
+                            choice = {"index": 0, "text": token}
+                        choice["finish_reason"] = None
+                        chunk = {
+                            "id": ident,
+                            "object": kind + ".chunk" if chat else kind,
+                            "created": created,
+                            "model": model,
+                            "choices": [choice],
+                        }
+                        yield f"data: {json.dumps(chunk)}\n\n"
+                except SyntheticFailure as exc:
+                    yield f"data: {json.dumps({'error': {'message': str(exc)}})}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        try:
+            text = await backend.acomplete(prompt, max_tokens)
+        except SyntheticFailure as exc:
+            raise HTTPException(status_code=503, detail=str(exc)) from exc
+        generated = len(text)
+        text = truncate(text, stops)
+        reason = "stop" if len(text) < generated else "length"
+        if chat:
+            choice = {
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": reason,
+            }
+        else:
+            choice = {"index": 0, "text": text, "finish_reason": reason}
+        prompt_tokens = len(prompt.split())
+        completion_tokens = len(text.split())
+        return {
+            "id": ident,
+            "object": kind,
+            "created": created,
+            "model": model,
+            "choices": [choice],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        return await _handle(request, chat=True)
+
+    @app.post("/v1/completions")
+    async def completions(request: Request):
+        return await _handle(request, chat=False)
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        texts = body.get("input") or []
+        if isinstance(texts, str):
+            texts = [texts]
+        vectors = backend.embed(texts, body.get("dimensions") or 16)
+        encoding_format = body.get("encoding_format", "float")
+        prompt_tokens = sum(len(text.split()) for text in texts)
+        return {
+            "object": "list",
+            "data": [
+                {
+                    "object": "embedding",
+                    "index": i,
+                    "embedding": encode_embedding(array("f", vector), encoding_format),
+                }
+                for i, vector in enumerate(vectors)
+            ],
+            "model": body.get("model", PREFIX),
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    @app.get("/v1/models")
+    def models():
+        return {"object": "list", "data": [{"id": PREFIX, "object": "model"}]}
+
+    return app
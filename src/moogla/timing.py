@@ -0,0 +1,127 @@
+"""Per-request timing breakdown reported through ``Server-Timing``.
+
+:class:`TimingMiddleware` attaches a :class:`RequestTimer` to a sampled
+fraction of requests through a context variable. Code on the request path
+wraps its phases in :func:`timed`, which does nothing for requests that were
+not sampled. Non-streaming responses carry the phases in a ``Server-Timing``
+header while streaming responses end with a ``{"timings": {...}}`` frame.
+"""
+
+from __future__ import annotations
+
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+_current: ContextVar[Optional["RequestTimer"]] = ContextVar(
+    "moogla_request_timer", default=None
+)
+
+
+class RequestTimer:
+    """Accumulate named phase durations for one request."""
+
+    __slots__ = ("start", "phases")
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        """Return phase durations and the elapsed total in milliseconds."""
+        result = {name: round(s * 1000, 3) for name, s in self.phases.items()}
+        result["total"] = round((time.perf_counter() - self.start) * 1000, 3)
+        return result
+
+    def header(self) -> str:
+        """Return the phases formatted as a ``Server-Timing`` header value."""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.as_dict().items())
+
+
+def current_timer() -> Optional[RequestTimer]:
+    """Return the timer of the current request if it was sampled."""
+    return _current.get()
+
+
+def record(name: str, seconds: float) -> None:
+    """Add ``seconds`` to phase ``name`` of the current request."""
+    timer = _current.get()
+    if timer is not None:
+        timer.add(name, seconds)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Time the enclosed block as phase ``name`` of the current request."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+async def timed_stream(
+    stream: AsyncIterator[T], first: str = "prompt", rest: str = "generate"
+) -> AsyncIterator[T]:
+    """Time a token stream as ``first`` until the first item and ``rest`` after."""
+    timer = _current.get()
+    if timer is None:
+        async for item in stream:
+            yield item
+        return
+    start = time.perf_counter()
+    first_at = None
+    try:
+        async for item in stream:
+            if first_at is None:
+                first_at = time.perf_counter()
+                timer.add(first, first_at - start)
+            yield item
+    finally:
+        if first_at is None:
+            timer.add(first, time.perf_counter() - start)
+        else:
+            timer.add(rest, time.perf_counter() - first_at)
+
+
+class TimingMiddleware:
+    """ASGI middleware sampling requests for a timing breakdown."""
+
+    def __init__(self, app: Any, sample_rate: float = 1.0) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+        timer = RequestTimer()
+        token = _current.set(timer)
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                streaming = any(
+                    k.lower() == b"content-type" and v.startswith(b"text/event-stream")
+                    for k, v in headers
+                )
+                if not streaming:
+                    headers.append((b"server-timing", timer.header().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
@@ -0,0 +1,414 @@
+"""Minimal distributed tracing with W3C ``traceparent`` propagation.
+
+:class:`TracingMiddleware` decides per request whether to trace it. An
+incoming ``traceparent`` header is honoured, otherwise a fraction
+``sample_rate`` of requests is sampled. Code on the request path opens child
+spans with :func:`span`, which costs a single context variable lookup when
+the request is not traced. Finished spans are handed to an exporter that
+writes them in batches from a background thread, either as JSON lines with
+:class:`JSONLExporter` or to an OTLP/HTTP collector with
+:class:`OTLPExporter`.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+SERVICE_NAME = "moogla"
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_STOP = object()
+
+_current: ContextVar[Optional["Span"]] = ContextVar("moogla_span", default=None)
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    __slots__ = (
+        "tracer",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "kind",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        kind: str = "internal",
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def child(self, name: str, **attributes: Any) -> "Span":
+        return Span(
+            self.tracer, name, self.trace_id, self.span_id, "internal", attributes
+        )
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self) -> None:
+        if not self.end_ns:
+            self.end_ns = time.time_ns()
+            self.tracer.exporter.submit(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def current_span() -> Optional[Span]:
+    """Return the active span if the current request is traced."""
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Run the block in a child span of the active span, if there is one."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, **attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.error = type(exc).__name__
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+
+def start_span(name: str, **attributes: Any) -> Optional[Span]:
+    """Start a child span without activating it.
+
+    Use this for work that outlives the current block, such as a streamed
+    response, and call :meth:`Span.end` when it completes.
+    """
+    parent = _current.get()
+    return parent.child(name, **attributes) if parent is not None else None
+
+
+async def traced_stream(
+    stream: AsyncIterator[T], name: str, **attributes: Any
+) -> AsyncIterator[T]:
+    """Wrap a stream in a span that stays active while items are produced."""
+    current = start_span(name, **attributes)
+    if current is None:
+        async for item in stream:
+            yield item
+        return
+    count = 0
+    try:
+        while True:
+            token = _current.set(current)
+            try:
+                item = await stream.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                _current.reset(token)
+            count += 1
+            yield item
+    except Exception as exc:
+        current.error = type(exc).__name__
+        raise
+    finally:
+        current.set("items", count)
+        current.end()
+
+
+def trace_headers() -> Dict[str, str]:
+    """Return the ``traceparent`` header to propagate to upstream services."""
+    current = _current.get()
+    return {"traceparent": current.traceparent} if current is not None else {}
+
+
+def parse_traceparent(value: str) -> Optional[tuple]:
+    """Return ``(trace_id, parent_id, sampled)`` of a W3C traceparent header."""
+    match = _TRACEPARENT.match(value.strip().lower())
+    if not match:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+class BatchExporter:
+    """Collect finished spans and export them in batches on a worker thread."""
+
+    def __init__(self, batch_size: int = 512, interval: float = 2.0) -> None:
+        self.batch_size = batch_size
+        self.interval = interval
+        self.closed = False
+        self._start()
+        _exporters.add(self)
+
+    def _start(self) -> None:
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(
+            target=self._run, name="moogla-span-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, span: Span) -> None:
+        self._queue.put(span)
+
+    def export(self, spans: List[Span]) -> None:  # pragma: no cover - abstract
+        raise NotImplementedError
+
+    def _flush(self, batch: List[Span]) -> None:
+        if not batch:
+            return
+        try:
+            self.export(batch)
+        except Exception as exc:
+            logger.warning("Failed to export %d spans: %s", len(batch), exc)
+
+    def _run(self) -> None:
+        batch: List[Span] = []
+        deadline = time.monotonic() + self.interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._flush(batch)
+                return
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.interval
+
+    def shutdown(self) -> None:
+        """Export pending spans and stop the worker thread."""
+        self.closed = True
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+
+_exporters: "weakref.WeakSet[BatchExporter]" = weakref.WeakSet()
+
+
+def _restart_exporters() -> None:
+    """Give exporters inherited by a forked child a fresh worker thread."""
+    for exporter in list(_exporters):
+        if not exporter.closed:
+            exporter._start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_exporters)
+
+
+class JSONLExporter(BatchExporter):
+    """Append spans as JSON lines to a local file."""
+
+    def __init__(self, path: Path | str, **kwargs: Any) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(**kwargs)
+
+    def export(self, spans: List[Span]) -> None:
+        lines = "".join(json.dumps(s.to_dict(), default=str) + "\n" for s in spans)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+def otlp_payload(spans: List[Span], service: str = SERVICE_NAME) -> Dict[str, Any]:
+    """Encode spans as an OTLP/JSON ``ExportTraceServiceRequest``."""
+    encoded = []
+    for s in spans:
+        item: Dict[str, Any] = {
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": _OTLP_KINDS.get(s.kind, 1),
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [
+                {"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()
+            ],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 0},
+        }
+        if s.parent_id:
+            item["parentSpanId"] = s.parent_id
+        encoded.append(item)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": service}}
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": "moogla"}, "spans": encoded}],
+            }
+        ]
+    }
+
+
+class OTLPExporter(BatchExporter):
+    """Send spans to an OTLP/HTTP collector using the JSON encoding."""
+
+    def __init__(
+        self,
+        endpoint: str,
+        *,
+        transport: Optional[httpx.BaseTransport] = None,
+        **kwargs: Any,
+    ) -> None:
+        endpoint = endpoint.rstrip("/")
+        if not endpoint.endswith("/v1/traces"):
+            endpoint += "/v1/traces"
+        self.endpoint = endpoint
+        self._client = httpx.Client(timeout=5.0, transport=transport)
+        super().__init__(**kwargs)
+
+    def export(self, spans: List[Span]) -> None:
+        resp = self._client.post(self.endpoint, json=otlp_payload(spans))
+        resp.raise_for_status()
+
+    def shutdown(self) -> None:
+        super().shutdown()
+        self._client.close()
+
+
+class Tracer:
+    """Start root spans for sampled requests and hand finished spans on."""
+
+    def __init__(self, exporter: BatchExporter, sample_rate: float = 1.0) -> None:
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def start_request(self, traceparent: Optional[str], name: str) -> Optional[Span]:
+        """Return a server span for a request, or ``None`` if not sampled."""
+        parsed = parse_traceparent(traceparent) if traceparent else None
+        if parsed is not None:
+            trace_id, parent_id, sampled = parsed
+            if not sampled:
+                return None
+        elif random.random() < self.sample_rate:
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+        else:
+            return None
+        return Span(self, name, trace_id, parent_id, "server")
+
+    def shutdown(self) -> None:
+        self.exporter.shutdown()
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a server span for sampled requests."""
+
+    def __init__(self, app: Any, tracer: Tracer) -> None:
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for key, value in scope.get("headers", ()):
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        root = self.tracer.start_request(traceparent, scope["method"])
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+        root.attributes.update(
+            {"http.method": scope["method"], "http.target": scope["path"]}
+        )
+        token = _current.set(root)
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                root.set("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.error = f"HTTP {message['status']}"
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as exc:
+            root.error = type(exc).__name__
+            raise
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                root.set("http.route", route)
+                root.name = f"{scope['method']} {route}"
+            root.end()
@@ -7,10 +7,57 @@ const fileInput = document.getElementById('file-input');
 const hintsContainer = document.getElementById('hints');
 const clearBtn = document.getElementById('clear-chat');
 const toggleDarkBtn = document.getElementById('toggle-dark');
+const stopBtn = document.getElementById('stop');
 
 const plugins = ['tests.dummy_plugin'];
 const hints = ['Summarize the text', 'List key points', 'Explain it simply'];
 let history = [];
+let socket = null;
+let pending = null;
+const conversation = 'chat';
+
+function connectSocket() {
+    if (!('WebSocket' in window)) return;
+    const scheme = location.protocol === 'https:' ? 'wss' : 'ws';
+    const ws = new WebSocket(`${scheme}://${location.host}/v1/chat/ws`);
+    ws.addEventListener('open', () => {
+        // Credentials go in the first frame, never in the URL
+        const token = localStorage.getItem('token');
+        if (token) ws.send(JSON.stringify({type: 'auth', token}));
+        socket = ws;
+    });
+    ws.addEventListener('close', () => {
+        if (socket === ws) socket = null;
+        if (pending) pending.finish('Connection closed');
+    });
+    ws.addEventListener('message', (event) => {
+        const frame = JSON.parse(event.data);
+        if (!pending || frame.id !== conversation) return;
+        if (frame.t !== undefined) {
+            pending.span.textContent += frame.t;
+            chatEl.scrollTop = chatEl.scrollHeight;
+        } else if (frame.done || frame.cancelled) {
+            pending.finish();
+        } else if (frame.error) {
+            pending.finish(frame.error);
+        }
+    });
+}
+
+function sendOverSocket(text) {
+    return new Promise((resolve) => {
+        const span = addMessage('assistant', '');
+        pending = {
+            span,
+            finish(error) {
+                if (error) span.textContent += ` [Error: ${error}]`;
+                pending = null;
+                resolve(span.textContent);
+            },
+        };
+        socket.send(JSON.stringify({type: 'message', id: conversation, content: text}));
+    });
+}
 
 async function loadModels() {
     try {
@@ -96,6 +143,15 @@ async function sendMessage(textOverride) {
     localStorage.setItem('chatHistory', JSON.stringify(history));
     inputEl.value = '';
     loadingEl.classList.remove('hidden');
+    if (socket && socket.readyState === WebSocket.OPEN) {
+        stopBtn.classList.remove('hidden');
+        const reply = await sendOverSocket(text);
+        history.push({role:'assistant', content: reply});
+        stopBtn.classList.add('hidden');
+        loadingEl.classList.add('hidden');
+        localStorage.setItem('chatHistory', JSON.stringify(history));
+        return;
+    }
     try {
         const resp = await fetch('/v1/chat/completions', {
             method:'POST',
@@ -161,6 +217,10 @@ fileInput.addEventListener('change', async () => {
     fileInput.value = '';
 });
 
+stopBtn.addEventListener('click', () => {
+    if (socket && pending) socket.send(JSON.stringify({type: 'cancel', id: conversation}));
+});
+
 clearBtn.addEventListener('click', () => {
     history = [];
     localStorage.removeItem('chatHistory');
@@ -172,6 +232,7 @@ toggleDarkBtn.addEventListener('click', () => {
     localStorage.setItem('darkMode', enabled ? '1' : '0');
 });
 
+connectSocket();
 loadModels().catch(() => {});
 loadPlugins();
 loadHistory();
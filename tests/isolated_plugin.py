@@ -0,0 +1,20 @@
+import os
+
+order = 3
+configured = {}
+
+
+def setup(settings: dict) -> None:
+    configured.update(settings)
+
+
+def preprocess(text: str) -> str:
+    if text == "crash":
+        os._exit(1)
+    if text == "fail":
+        raise ValueError("bad input")
+    return f"{text}:{configured.get('tag', '')}"
+
+
+def postprocess(text: str) -> str:
+    return f"{text}@{os.getpid()}"
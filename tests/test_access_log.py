@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import queue
+import sys
+import types
+
+from fastapi.testclient import TestClient
+
+from moogla import logs, server
+from moogla.config import Settings
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("MOOGLA_JWT_SECRET", "access-secret")
+
+
+class DummyExecutor:
+    async def acomplete(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ) -> str:
+        return prompt[::-1]
+
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ):
+        for word in prompt.split():
+            yield word
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+    async def aclose(self):
+        pass
+
+
+def make_client(monkeypatch, rate, plugins=None, **kwargs):
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    settings = Settings(MOOGLA_ACCESS_LOG_SAMPLE_RATE=rate)
+    return TestClient(create_app(plugins, settings=settings, **kwargs))
+
+
+def access_records(caplog):
+    return [r.access for r in caplog.records if r.name == logs.ACCESS_LOGGER]
+
+
+def test_access_record_fields(monkeypatch, caplog):
+    mod = types.ModuleType("access_cache_plugin")
+    mod.cacheable = True
+    mod.preprocess = lambda text: text
+    monkeypatch.setitem(sys.modules, "access_cache_plugin", mod)
+    client = make_client(
+        monkeypatch, 1.0, ["access_cache_plugin"], server_api_key="key"
+    )
+    headers = {"X-API-Key": "key", "X-Request-ID": "req-1"}
+    with caplog.at_level(logging.INFO, logger=logs.ACCESS_LOGGER):
+        first = client.post(
+            "/v1/completions", json={"prompt": "a b c"}, headers=headers
+        )
+        client.post(
+            "/v1/completions",
+            json={"prompt": "a b c", "stream": True},
+            headers={"X-API-Key": "key"},
+        )
+    assert first.headers["x-request-id"] == "req-1"
+    plain, streamed = access_records(caplog)
+    assert plain["request_id"] == "req-1"
+    assert plain["route"] == "/v1/completions" and plain["status"] == 200
+    assert plain["tenant"] == "api-key"
+    assert plain["tokens_in"] == 3 and plain["tokens_out"] == 3
+    assert plain["cache_hit"] is False and streamed["cache_hit"] is True
+    assert streamed["tokens_out"] == 3 and streamed["ttft_ms"] >= 0
+    assert streamed["duration_ms"] >= streamed["ttft_ms"]
+
+
+def test_access_log_sampling_keeps_errors(monkeypatch, caplog):
+    mod = types.ModuleType("access_fail_plugin")
+
+    def preprocess(text: str) -> str:
+        raise RuntimeError("boom")
+
+    mod.preprocess = preprocess
+    monkeypatch.setitem(sys.modules, "access_fail_plugin", mod)
+    client = make_client(monkeypatch, 1e-9, ["access_fail_plugin"])
+    with caplog.at_level(logging.INFO, logger=logs.ACCESS_LOGGER):
+        for _ in range(5):
+            client.get("/health")
+        client.post("/v1/completions", json={"prompt": "x"})
+    records = access_records(caplog)
+    assert [r["status"] for r in records] == [500]
+
+
+def test_unsampled_requests_skip_token_counts(monkeypatch, caplog):
+    counted = []
+
+    class CountingExecutor(DummyExecutor):
+        def count_tokens(self, text: str) -> int:
+            counted.append(text)
+            return super().count_tokens(text)
+
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: CountingExecutor())
+    settings = Settings(MOOGLA_ACCESS_LOG_SAMPLE_RATE=1e-9)
+    client = TestClient(create_app(settings=settings))
+    with caplog.at_level(logging.INFO, logger=logs.ACCESS_LOGGER):
+        resp = client.post("/v1/completions", json={"prompt": "a b c"})
+        client.post("/v1/completions", json={"prompt": "a b c", "stream": True})
+    assert resp.status_code == 200
+    assert counted == []
+    assert access_records(caplog) == []
+
+
+def test_queue_logging_formats_off_thread(monkeypatch):
+    root = logging.Logger("test-root")
+    monkeypatch.setattr(logging, "getLogger", lambda name=None: root)
+    logs.configure_logging("INFO", "json")
+    try:
+        handler = root.handlers[0]
+        assert isinstance(handler, logs._DeferredQueueHandler)
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        handler.queue = records
+        try:
+            raise ValueError("bad")
+        except ValueError:
+            root.exception("failed %s", "hook")
+        root.info("access", extra={"access": {"status": 200}})
+        failed, access = records.get_nowait(), records.get_nowait()
+    finally:
+        logs.stop_logging()
+    assert failed.msg == "failed hook" and failed.exc_info is not None
+    formatter = logs.JSONFormatter()
+    assert "ValueError" in json.loads(formatter.format(failed))["exc_info"]
+    assert json.loads(formatter.format(access))["status"] == 200
+    assert '"status": 200' in logs.TextFormatter().format(access)
+
+
+def test_listener_replaced_after_fork(monkeypatch):
+    root = logging.Logger("test-root")
+    monkeypatch.setattr(logging, "getLogger", lambda name=None: root)
+    logs.configure_logging("INFO", "text")
+    try:
+        parent = logs._listener
+        # The parent's thread is not running in a forked child
+        parent.stop()
+        logs._restart_listener()
+        child = logs._listener
+        assert child is not parent
+        assert child.queue is parent.queue and child.handlers == parent.handlers
+        assert child._thread.is_alive()
+    finally:
+        logs.stop_logging()
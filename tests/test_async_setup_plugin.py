@@ -1,4 +1,3 @@
-import asyncio
 import importlib
 import os
 
@@ -55,10 +54,10 @@ def test_async_setup_called(tmp_path, monkeypatch):
     app = create_app()
 
     async_setup_plugin = importlib.import_module("tests.async_setup_plugin")
-    assert async_setup_plugin.configured == {"suffix": "##"}
-
-    client = TestClient(app)
-    resp = client.post("/v1/completions", json={"prompt": "abc"})
+    async_setup_plugin.configured.clear()
+    with TestClient(app) as client:
+        assert async_setup_plugin.configured == {"suffix": "##"}
+        resp = client.post("/v1/completions", json={"prompt": "abc"})
     assert resp.status_code == 200
     assert resp.json()["choices"][0]["text"] == "cba##"
     plugins_config.set_plugin_file(None)
@@ -74,13 +73,13 @@ async def test_async_setup_inside_running_loop(tmp_path, monkeypatch):
     app = create_app()
 
     async_setup_plugin = importlib.import_module("tests.async_setup_plugin")
-    await asyncio.sleep(0.01)
-    assert async_setup_plugin.configured == {"suffix": "@@"}
-
-    async with httpx.AsyncClient(
-        transport=httpx.ASGITransport(app=app), base_url="http://test"
-    ) as client:
-        resp = await client.post("/v1/completions", json={"prompt": "abc"})
+    async_setup_plugin.configured.clear()
+    async with app.router.lifespan_context(app):
+        assert async_setup_plugin.configured == {"suffix": "@@"}
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            resp = await client.post("/v1/completions", json={"prompt": "abc"})
     assert resp.status_code == 200
     assert resp.json()["choices"][0]["text"] == "cba@@"
     plugins_config.set_plugin_file(None)
@@ -0,0 +1,239 @@
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel, create_engine
+from typer.testing import CliRunner
+
+from moogla import cli, server
+from moogla.batches import BatchRunner, describe_job
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+async def upload(*lines):
+    text = "\n".join(json.dumps(line) for line in lines)
+    # Chunk boundaries fall inside lines
+    for i in range(0, len(text), 7):
+        yield text[i : i + 7].encode()
+
+
+def make_runner(tmp_path, handle, **kwargs):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    SQLModel.metadata.create_all(engine)
+    return BatchRunner(engine, tmp_path / "batches", handle, **kwargs)
+
+
+def read_output(runner, job_id):
+    lines = runner.output_path(job_id).read_text().splitlines()
+    return [json.loads(line) for line in lines]
+
+
+@pytest.mark.asyncio
+async def test_submit_validates_lines(tmp_path):
+    async def handle(url, body):
+        return {}
+
+    runner = make_runner(tmp_path, handle)
+    with pytest.raises(ValueError, match="Line 2: unsupported url"):
+        await runner.submit(upload({"body": {}}, {"url": "/x", "body": {}}))
+    with pytest.raises(ValueError, match="duplicate custom_id"):
+        await runner.submit(
+            upload({"body": {}}, {"custom_id": "request-0", "body": {}})
+        )
+    with pytest.raises(ValueError, match="no requests"):
+        await runner.submit(upload())
+    assert list(runner.directory.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_submit_joins_lines_split_across_chunks(tmp_path):
+    async def handle(url, body):
+        return {}
+
+    async def byte_chunks(data):
+        for i in range(len(data)):
+            yield data[i : i + 1]
+
+    runner = make_runner(tmp_path, handle)
+    long = json.dumps({"custom_id": "long", "body": {"prompt": "x" * 2000}})
+    data = f"{long}\r\n\n{json.dumps({'body': {}})}".encode()
+    job = await runner.submit(byte_chunks(data))
+    assert job.total == 2
+    stored = runner.input_path(job.id).read_bytes().splitlines()
+    assert [json.loads(line) for line in stored] == [
+        json.loads(long),
+        {"body": {}},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_cancel_and_resume_skip_finished_requests(tmp_path):
+    calls = []
+    gate = asyncio.Event()
+
+    async def handle(url, body):
+        calls.append(body["prompt"])
+        if body["prompt"] == "fail":
+            raise ValueError("bad prompt")
+        if len(calls) == 2:
+            await gate.wait()
+        return {"text": body["prompt"], "usage": {"completion_tokens": 2}}
+
+    runner = make_runner(tmp_path, handle, workers=1)
+    prompts = ["a", "b", "fail", "c"]
+    job = await runner.submit(upload(*({"body": {"prompt": p}} for p in prompts)))
+    assert job.total == 4
+
+    task = asyncio.create_task(runner.process(job.id))
+    while len(calls) < 2:
+        await asyncio.sleep(0)
+    assert runner.cancel(job.id).status == "cancelling"
+    gate.set()
+    job = await task
+    assert job.status == "cancelled"
+    assert (job.completed, job.failed) == (2, 0)
+
+    # A partial line from an interrupted write is dropped on resume
+    with runner.output_path(job.id).open("a") as f:
+        f.write('{"custom_id": "request-2"')
+    assert runner.resume(job.id).status == "queued"
+    job = await runner.process(job.id)
+    assert job.status == "completed"
+    assert calls == ["a", "b", "fail", "c"]
+    assert (job.completed, job.failed, job.output_tokens) == (3, 1, 6)
+
+    records = read_output(runner, job.id)
+    assert [r["custom_id"] for r in records] == [f"request-{i}" for i in range(4)]
+    assert records[2]["error"] == {"status_code": 500, "message": "bad prompt"}
+    assert records[3]["response"]["body"]["text"] == "c"
+    stats = describe_job(job)["stats"]
+    assert stats["requests_per_second"] > 0
+    assert stats["eta_seconds"] is None
+
+
+@pytest.mark.asyncio
+async def test_workers_yield_to_interactive_traffic(tmp_path):
+    busy = [True]
+    calls = []
+
+    async def handle(url, body):
+        calls.append(body)
+        return {}
+
+    runner = make_runner(tmp_path, handle, busy=lambda: busy[0], poll_interval=0)
+    job = await runner.submit(upload({"body": {}}))
+    task = asyncio.create_task(runner.process(job.id))
+    for _ in range(20):
+        await asyncio.sleep(0)
+    assert calls == []
+    busy[0] = False
+    assert (await task).completed == 1
+
+
+@pytest.mark.asyncio
+async def test_jobs_are_claimed_by_one_runner(tmp_path):
+    async def handle(url, body):
+        return {}
+
+    first = make_runner(tmp_path, handle)
+    second = BatchRunner(first.engine, first.directory, handle)
+    job = await first.submit(upload({"body": {}}))
+    assert first._next_job() == job.id
+    assert second._next_job() is None
+    assert first.get(job.id).owner == first.owner
+
+    # A job of a live process stays running, one of a dead process is queued
+    second._requeue_interrupted()
+    assert first.get(job.id).status == "running"
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    first._update(job.id, owner=f"{socket.gethostname()}:{dead.pid}")
+    second._requeue_interrupted()
+    assert first.get(job.id).status == "queued"
+    assert second._next_job() == job.id
+
+
+class DummyExecutor:
+    async def acomplete(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ) -> str:
+        return prompt[::-1]
+
+    async def abatch(self, prompts, **kwargs):
+        return [p[::-1] for p in prompts]
+
+    def count_tokens(self, text: str) -> int:
+        return len(text)
+
+    async def aclose(self):
+        pass
+
+
+def test_batch_api_and_cli(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    monkeypatch.setenv("MOOGLA_BATCH_DIR", str(tmp_path / "batches"))
+    monkeypatch.setenv("MOOGLA_DB_URL", f"sqlite:///{tmp_path / 'moogla.db'}")
+    app = create_app(["tests.dummy_plugin"])
+    requests = tmp_path / "requests.jsonl"
+    requests.write_text(
+        "\n".join(
+            json.dumps(line)
+            for line in (
+                {"custom_id": "c", "body": {"prompt": "ab cd"}},
+                {
+                    "custom_id": "m",
+                    "url": "/v1/chat/completions",
+                    "body": {"messages": [{"role": "user", "content": "hi"}]},
+                },
+                {"custom_id": "n", "body": {"prompt": "ab", "n": 2}},
+                {"custom_id": "s", "body": {"prompt": "ab", "stream": True}},
+                {"custom_id": "x", "body": {"messages": []}},
+            )
+        )
+    )
+    with TestClient(app) as client:
+        monkeypatch.setattr(
+            cli.httpx,
+            "Client",
+            lambda base_url, headers, timeout: contextlib.nullcontext(client),
+        )
+        output = tmp_path / "results.jsonl"
+        result = CliRunner().invoke(
+            cli.app,
+            ["batch", str(requests), "--output", str(output), "--poll-interval", "0"],
+        )
+        assert result.exit_code == 0, result.output
+        assert "5 requests" in result.output
+        assert "completed: 5/5 requests (2 failed)" in result.output
+
+        records = {r["custom_id"]: r for r in map(json.loads, output.open())}
+        assert records["c"]["response"]["body"] == {
+            "choices": [{"text": "!!DC BA!!"}],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 9, "total_tokens": 14},
+        }
+        message = records["m"]["response"]["body"]["choices"][0]["message"]
+        assert message["content"] == "!!IH!!"
+        assert len(records["n"]["response"]["body"]["choices"]) == 2
+        assert records["s"]["error"]["status_code"] == 400
+        assert records["x"]["error"]["message"].startswith("prompt: Field required")
+
+        jobs = client.get("/v1/batches").json()["data"]
+        assert [job["status"] for job in jobs] == ["completed"]
+        job_id = jobs[0]["id"]
+        assert client.post(f"/v1/batches/{job_id}/resume").status_code == 409
+        assert client.get("/v1/batches/missing").status_code == 404
+        resp = client.post("/v1/batches", content=b"not json\n")
+        assert resp.status_code == 400
+        assert resp.json()["detail"] == "Line 1: invalid JSON"
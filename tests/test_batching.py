@@ -0,0 +1,119 @@
+import asyncio
+import os
+import sys
+import types
+
+import httpx
+import pytest
+
+from moogla import server
+from moogla.executor import LLMExecutor
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+class DummyExecutor:
+    def __init__(self):
+        self.batches = []
+
+    async def abatch(
+        self,
+        prompts,
+        max_tokens=None,
+        temperature=None,
+        top_p=None,
+        concurrency=8,
+    ):
+        self.batches.append(list(prompts))
+        return [f"{p[::-1]}{i}" for i, p in enumerate(prompts)]
+
+    async def aclose(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_completion_batch_keeps_order(monkeypatch):
+    dummy = DummyExecutor()
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: dummy)
+    app = create_app(["tests.dummy_plugin"])
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        resp = await client.post(
+            "/v1/completions", json={"prompt": ["ab", "cd"], "n": 2}
+        )
+        assert resp.status_code == 200
+        assert resp.json()["choices"] == [
+            {"index": 0, "text": "!!BA0!!"},
+            {"index": 1, "text": "!!BA1!!"},
+            {"index": 2, "text": "!!DC2!!"},
+            {"index": 3, "text": "!!DC3!!"},
+        ]
+        # Hooks run once per prompt, the backend sees one batch
+        assert dummy.batches == [["AB", "AB", "CD", "CD"]]
+
+        resp = await client.post("/v1/completions", json={"prompt": "ab", "n": 65})
+        assert resp.status_code == 400
+        resp = await client.post(
+            "/v1/completions", json={"prompt": ["a"], "stream": True}
+        )
+        assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_abatch_bounds_remote_concurrency(monkeypatch):
+    active = 0
+    peak = 0
+
+    class Completions:
+        async def create(self, messages, **kwargs):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            message = types.SimpleNamespace(content=messages[0]["content"].upper())
+            return types.SimpleNamespace(
+                choices=[types.SimpleNamespace(message=message)]
+            )
+
+    client = types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=Completions())
+    )
+    monkeypatch.setattr("openai.OpenAI", lambda **kw: object())
+    monkeypatch.setattr("openai.AsyncOpenAI", lambda **kw: client)
+    executor = LLMExecutor(model="gpt-4o-mini")
+    prompts = [f"p{i}" for i in range(10)]
+    assert await executor.abatch(prompts, concurrency=3) == [p.upper() for p in prompts]
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_abatch_runs_pipeline_once(monkeypatch):
+    calls = []
+
+    class DummyPipeline:
+        tokenizer = types.SimpleNamespace(pad_token_id=None)
+        model = types.SimpleNamespace(config=types.SimpleNamespace(eos_token_id=2))
+
+        def __call__(self, texts, max_new_tokens=16, batch_size=1, **options):
+            calls.append((batch_size, options))
+            return [[{"generated_text": t[::-1]}] for t in texts]
+
+    monkeypatch.setitem(
+        sys.modules,
+        "transformers",
+        types.SimpleNamespace(pipeline=lambda *a, **k: DummyPipeline()),
+    )
+    executor = LLMExecutor(model="some/model")
+    assert await executor.abatch(["abc", "de"]) == ["cba", "ed"]
+    assert calls == [(2, {})]
+    assert executor.generator.tokenizer.pad_token_id == 2
+
+    await executor.abatch(["abc"], temperature=0.5, top_p=0.9)
+    await executor.abatch(["abc"], temperature=0)
+    assert calls[1:] == [
+        (1, {"do_sample": True, "temperature": 0.5, "top_p": 0.9}),
+        (1, {}),
+    ]
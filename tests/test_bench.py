@@ -0,0 +1,91 @@
+import json
+import os
+
+import httpx
+import pytest
+from typer.testing import CliRunner
+
+from moogla import bench, server
+from moogla.cli import app
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+runner = CliRunner()
+
+
+class DummyExecutor:
+    async def acomplete(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ) -> str:
+        return prompt[::-1]
+
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ):
+        text = prompt[::-1]
+        for i in range(0, len(text), 2):
+            yield text[i : i + 2]
+
+    async def aclose(self):
+        pass
+
+
+def test_percentile():
+    values = [1, 2, 3, 4]
+    assert bench.percentile(values, 50) == 2.5
+    assert bench.percentile(values, 100) == 4
+    assert bench.percentile([], 90) == 0.0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream", [False, True])
+@pytest.mark.parametrize("rate", [None, 500.0])
+async def test_run_benchmark(monkeypatch, stream, rate):
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    transport = httpx.ASGITransport(app=create_app())
+    config = bench.BenchConfig(
+        url="http://test",
+        endpoint="completions",
+        requests=6,
+        concurrency=3,
+        rate=rate,
+        stream=stream,
+        prompt="abcdef",
+        seed=1,
+    )
+    report = await bench.run_benchmark(config, transport=transport)
+    assert report["requests"] == 6
+    assert report["failed"] == 0
+    assert report["latency"]["p99"] > 0
+    if stream:
+        assert report["tokens_per_second"] > 0
+        assert report["itl"]["p50"] > 0
+    assert "ttft" in bench.format_table(report)
+
+
+def test_bench_command_json(monkeypatch, tmp_path):
+    async def fake_run(config):
+        assert config.endpoint == "chat"
+        assert config.stream is True
+        return bench.summarize(
+            [bench.RequestResult(ok=True, status=200, latency=0.1, ttft=0.05)],
+            1.0,
+            config,
+        )
+
+    monkeypatch.setattr(bench, "run_benchmark", fake_run)
+    out = tmp_path / "report.json"
+    result = runner.invoke(app, ["bench", "--stream", "--json", "-o", str(out)])
+    assert result.exit_code == 0
+    report = json.loads(out.read_text())
+    assert report["succeeded"] == 1
+    assert json.loads(result.output)["ttft"]["p50"] == 0.05
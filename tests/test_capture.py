@@ -0,0 +1,149 @@
+import json
+import os
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from typer.testing import CliRunner
+
+from moogla import capture, server
+from moogla.cli import app
+from moogla.config import Settings
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+runner = CliRunner()
+
+
+class DummyExecutor:
+    async def acomplete(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ) -> str:
+        return prompt[::-1]
+
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ):
+        for ch in prompt[::-1]:
+            yield ch
+
+    async def aclose(self):
+        pass
+
+
+def make_app(monkeypatch, path, mode):
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    settings = Settings(MOOGLA_CAPTURE_FILE=path, MOOGLA_CAPTURE_MODE=mode)
+    return create_app(settings=settings)
+
+
+@pytest.mark.parametrize("mode", ["redact", "hash", "full"])
+def test_capture_records_requests(monkeypatch, tmp_path, mode):
+    path = tmp_path / "capture.jsonl"
+    with TestClient(make_app(monkeypatch, path, mode)) as client:
+        client.post(
+            "/v1/chat/completions",
+            json={"messages": [{"role": "user", "content": "secret"}], "top_p": 0.5},
+        )
+        client.post("/v1/completions", json={"prompt": "secret", "stream": True})
+        client.get("/health")
+
+    chat, completion = list(capture.read_capture(path))
+    assert chat["ep"] == "chat" and chat["status"] == 200
+    assert chat["chars"] == 6 and chat["msgs"] == 1 and chat["top_p"] == 0.5
+    assert completion["stream"] is True and completion["latency"] > 0
+    raw = path.read_text()
+    assert ("secret" in raw) is (mode == "full")
+    assert ("sha" in chat) is (mode == "hash")
+
+
+def test_replay_payloads_preserve_shape():
+    hashed = {"ep": "completions", "chars": 12, "sha": "abc", "max_tokens": 5}
+    payload = capture.build_replay_payload(hashed, 0)
+    assert len(payload["prompt"]) == 12 and payload["max_tokens"] == 5
+    assert capture.build_replay_payload(hashed, 1) == payload
+    redacted = {"ep": "chat", "chars": 7, "stream": True}
+    first = capture.build_replay_payload(redacted, 0)
+    assert len(first["messages"][0]["content"]) == 7 and first["stream"]
+    assert capture.build_replay_payload(redacted, 1) != first
+
+
+def test_batched_prompts_are_captured_and_replayed():
+    body = {"prompt": ["ab", "cde"], "n": 2}
+    record = capture.describe_request("completions", body, "redact")
+    assert record == {"stream": False, "n": 2, "chars": 5, "prompts": 2}
+    assert capture.describe_request("completions", body, "full")["prompt"] == [
+        "ab",
+        "cde",
+    ]
+    payload = capture.build_replay_payload({"ep": "completions", **record})
+    assert len(payload["prompt"]) == 2 and payload["n"] == 2
+
+
+def test_stop_sequences_are_replayed():
+    body = {"prompt": "x", "stop": ["\n", "END"]}
+    record = capture.describe_request("completions", body, "redact")
+    assert record["stop"] == ["\n", "END"]
+    payload = capture.build_replay_payload({"ep": "completions", **record})
+    assert payload["stop"] == ["\n", "END"]
+
+
+@pytest.mark.asyncio
+async def test_replay_against_app(monkeypatch, tmp_path):
+    path = tmp_path / "capture.jsonl"
+    writer = capture.CaptureWriter(path)
+    for i, stream in enumerate([False, True, False]):
+        writer.write(
+            {
+                "t": 100 + i * 0.01,
+                "ep": "completions",
+                "status": 200,
+                "latency": 0.01,
+                "stream": stream,
+                "chars": 4,
+            }
+        )
+    writer.close()
+    with open(path, "a") as f:
+        f.write('{"t": 1')  # truncated trailing record is ignored
+
+    transport = httpx.ASGITransport(app=make_app(monkeypatch, None, "redact"))
+    records = list(capture.read_capture(path))
+    report = await capture.replay(records, "http://test", speed=2, transport=transport)
+    assert report["replayed"]["requests"] == 3
+    assert report["replayed"]["failed"] == 0
+    assert report["captured"]["latency"]["p50"] == 0.01
+    assert "captured" in capture.format_comparison(report)
+
+
+def test_invalid_capture_mode(tmp_path):
+    with pytest.raises(ValueError):
+        capture.CaptureWriter(tmp_path / "c.jsonl", mode="nope")
+
+
+def test_replay_command(monkeypatch, tmp_path):
+    path = tmp_path / "capture.jsonl"
+    path.write_text(
+        json.dumps({"t": 1, "ep": "chat", "status": 200, "latency": 0.2}) + "\n"
+    )
+
+    async def fake_replay(records, url, *, speed, api_key):
+        assert len(records) == 1 and speed == 0
+        return {"captured": {}, "replayed": {"requests": 1}, "speed": speed}
+
+    monkeypatch.setattr(capture, "replay", fake_replay)
+    result = runner.invoke(app, ["replay", str(path), "--speed", "0", "--json"])
+    assert result.exit_code == 0
+    assert json.loads(result.output)["replayed"]["requests"] == 1
+    empty = tmp_path / "empty.jsonl"
+    empty.write_text("")
+    assert runner.invoke(app, ["replay", str(empty)]).exit_code == 1
@@ -22,7 +22,7 @@ def test_help():
 def test_serve_with_plugin(monkeypatch):
     captured = {}
 
-    def fake_run(app, host="0.0.0.0", port=11434):
+    def fake_run(app, host="0.0.0.0", port=11434, **options):
         captured["app"] = app
 
     class DummyClient:
@@ -108,12 +108,22 @@ def test_serve_option_forwarding(monkeypatch):
             "http://a.com",
             "--token-exp-minutes",
             "60",
+            "--uds",
+            "/tmp/moogla.sock",
+            "--loop",
+            "asyncio",
+            "--keepalive-timeout",
+            "30",
         ],
     )
     assert result.exit_code == 0
     assert captured["log_level"] == "DEBUG"
     assert captured["cors_origins"] == "http://a.com"
     assert captured["token_exp_minutes"] == 60
+    assert captured["uds"] == "/tmp/moogla.sock"
+    assert captured["loop"] == "asyncio"
+    assert captured["keepalive_timeout"] == 30
+    assert captured["http"] is None
 
 
 def test_pull_downloads_to_custom_dir():
@@ -0,0 +1,111 @@
+import os
+
+import httpx
+import pytest
+
+from moogla import server
+from moogla.context import ContextManager
+from moogla.server import create_app
+from moogla.sessions import Session
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+def word_counter(calls):
+    def count(text):
+        calls.append(text)
+        return len(text.split())
+
+    return count
+
+
+def test_counts_are_cached_by_text():
+    calls = []
+    context = ContextManager(word_counter(calls))
+    assert context.count("a b c") == 3
+    assert context.count("a b c") == 3
+    assert calls == ["a b c"]
+    assert context.cache.stats()["hits"] == 1
+
+
+def test_fit_keeps_system_and_latest_turns():
+    calls = []
+    context = ContextManager(word_counter(calls), window=40)
+    session = Session("s", context.count)
+    session.add("system", "rules " * 5)
+    for i in range(6):
+        session.add("user", f"question {i} " * 2)
+        session.add("assistant", f"answer {i} " * 2)
+    tokenized = len(calls)
+
+    start, trimmed = context.fit(session.turns, reserve=8)
+    assert start > 1
+    assert trimmed == sum(t.tokens for t in session.turns[1:start])
+    prompt = session.prompt(start)
+    assert prompt.startswith("System: rules")
+    assert "answer 5" in prompt and "question 0" not in prompt
+    # Fitting only adds up cached counts
+    assert len(calls) == tokenized + 3
+
+    # The window start stays put while the prompt still fits
+    session.add("user", "short")
+    assert context.fit(session.turns, reserve=8, start=start)[0] == start
+
+
+def test_fit_without_window_keeps_everything():
+    context = ContextManager(str.__len__)
+    session = Session("s", context.count)
+    session.add("user", "x" * 100)
+    assert context.fit(session.turns, reserve=10) == (0, 0)
+
+
+class DummyExecutor:
+    def __init__(self):
+        self.prompts = []
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+    def context_window(self):
+        return 24
+
+    async def acomplete(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ) -> str:
+        self.prompts.append(prompt)
+        return "one two three four"
+
+    async def aclose(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_session_prompts_are_trimmed(monkeypatch):
+    dummy = DummyExecutor()
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: dummy)
+    app = create_app()
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        resp = await client.post("/v1/sessions", json={"system": "hi"})
+        session_id = resp.json()["id"]
+        usages = []
+        for i in range(4):
+            resp = await client.post(
+                "/v1/chat/completions",
+                json={
+                    "session_id": session_id,
+                    "messages": [{"role": "user", "content": f"turn {i} of chat"}],
+                    "max_tokens": 4,
+                },
+            )
+            usages.append(resp.json()["usage"])
+    assert usages[0]["trimmed_tokens"] == 0
+    assert usages[-1]["trimmed_tokens"] > 0
+    assert all(u["prompt_tokens"] <= 24 - 4 for u in usages)
+    assert dummy.prompts[-1].startswith("System: hi\n")
+    assert "turn 3 of chat" in dummy.prompts[-1]
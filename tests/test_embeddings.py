@@ -0,0 +1,216 @@
+import asyncio
+import base64
+import math
+import os
+import types
+from array import array
+
+import httpx
+import openai
+import pytest
+
+from moogla.embeddings import EmbeddingBatcher, encode_embedding
+from moogla.executor import LLMExecutor
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+def recording_embed(calls):
+    async def embed(texts, model):
+        calls.append(list(texts))
+        return [[float(len(text)), 0.1] for text in texts]
+
+    return embed
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_a_batch():
+    calls = []
+    batcher = EmbeddingBatcher(recording_embed(calls), max_batch=8, max_wait=0.05)
+    results = await asyncio.gather(
+        batcher.embed(["a", "bb"]), batcher.embed(["ccc"]), batcher.embed(["a"])
+    )
+    assert calls == [["a", "bb", "ccc"]]
+    assert [[v[0] for v in vectors] for vectors in results] == [[1, 2], [3], [1]]
+    # Values are stored as float32
+    assert results[0][0][1] == array("f", [0.1])[0] != 0.1
+
+    await batcher.embed(["bb", "ccc"])
+    assert len(calls) == 1
+    assert batcher.cache.hits == 2
+    await batcher.close()
+
+
+@pytest.mark.asyncio
+async def test_batches_are_bounded():
+    calls = []
+    batcher = EmbeddingBatcher(recording_embed(calls), max_batch=2, max_wait=1)
+    vectors = await batcher.embed(["a", "bb", "ccc", "dddd", "eeeee"])
+    assert [len(batch) for batch in calls] == [2, 2, 1]
+    assert [v[0] for v in vectors] == [1, 2, 3, 4, 5]
+    await batcher.close()
+
+
+@pytest.mark.asyncio
+async def test_failures_reach_callers_and_are_not_cached():
+    failing = [True]
+
+    async def embed(texts, model):
+        if failing[0]:
+            raise RuntimeError("backend down")
+        return [[1.0] for _ in texts]
+
+    batcher = EmbeddingBatcher(embed, max_wait=0)
+    with pytest.raises(RuntimeError, match="backend down"):
+        await batcher.embed(["a"])
+    failing[0] = False
+    assert (await batcher.embed(["a"]))[0].tolist() == [1.0]
+    await batcher.close()
+
+
+@pytest.mark.asyncio
+async def test_batches_hold_one_model():
+    calls = []
+
+    async def embed(texts, model):
+        calls.append((model, list(texts)))
+        return [[float(len(model))] for _ in texts]
+
+    batcher = EmbeddingBatcher(embed, max_wait=0.05)
+    first, second = await asyncio.gather(
+        batcher.embed(["a", "b"], "m1"), batcher.embed(["a"], "model2")
+    )
+    assert sorted(calls) == [("m1", ["a", "b"]), ("model2", ["a"])]
+    assert [v[0] for v in first] == [2, 2]
+    assert [v[0] for v in second] == [6]
+    await batcher.close()
+
+
+@pytest.mark.asyncio
+async def test_texts_in_flight_do_not_start_empty_batches():
+    calls = []
+    release = asyncio.Event()
+
+    async def embed(texts, model):
+        calls.append(list(texts))
+        await release.wait()
+        return [[1.0] for _ in texts]
+
+    batcher = EmbeddingBatcher(embed, max_wait=0)
+    first = asyncio.create_task(batcher.embed(["a"]))
+    while not calls:
+        await asyncio.sleep(0)
+    second = asyncio.create_task(batcher.embed(["a"]))
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(first, second)
+    await batcher.embed(["a"])
+    for _ in range(5):
+        await asyncio.sleep(0)
+    assert calls == [["a"]]
+    assert batcher.batches == 1
+    await batcher.close()
+
+
+def test_base64_encoding_is_little_endian_float32():
+    vector = array("f", [0.5, -2.0])
+    encoded = encode_embedding(vector, "base64")
+    decoded = array("f")
+    decoded.frombytes(base64.b64decode(encoded))
+    assert decoded.tolist() == [0.5, -2.0]
+    assert encode_embedding(vector) == [0.5, -2.0]
+
+
+def test_openai_embeddings(monkeypatch):
+    calls = []
+
+    class DummyClient:
+        def __init__(self):
+            self.chat = types.SimpleNamespace(completions=None)
+            self.embeddings = self
+
+        def create(self, model, input, **kwargs):
+            calls.append((model, input))
+            data = [types.SimpleNamespace(embedding=[1.0, 2.0]) for _ in input]
+            return types.SimpleNamespace(data=data)
+
+    monkeypatch.setattr(
+        openai, "OpenAI", lambda api_key=None, base_url=None: DummyClient()
+    )
+    monkeypatch.setattr(openai, "AsyncOpenAI", lambda api_key=None, base_url=None: None)
+    executor = LLMExecutor(model="gpt-3.5-turbo")
+    assert executor.embed(["a", "b"], model="text-embedding-3-small") == [
+        [1.0, 2.0],
+        [1.0, 2.0],
+    ]
+    assert calls == [("text-embedding-3-small", ["a", "b"])]
+
+
+@pytest.mark.asyncio
+async def test_embeddings_endpoint():
+    app = create_app(model="synthetic:seed=1")
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        resp = await client.post("/v1/embeddings", json={"input": ["a b", "c"]})
+        assert resp.status_code == 200
+        body = resp.json()
+        assert [item["index"] for item in body["data"]] == [0, 1]
+        first = body["data"][0]["embedding"]
+        assert math.isclose(sum(v * v for v in first), 1.0, rel_tol=1e-5)
+        assert body["usage"] == {"prompt_tokens": 3, "total_tokens": 3}
+        assert body["model"] == "synthetic:seed=1"
+
+        resp = await client.post(
+            "/v1/embeddings", json={"input": "a b", "encoding_format": "base64"}
+        )
+        decoded = array("f")
+        decoded.frombytes(base64.b64decode(resp.json()["data"][0]["embedding"]))
+        assert decoded.tolist() == first
+
+        resp = await client.post(
+            "/v1/embeddings", json={"input": "a", "model": "synthetic:seed=1"}
+        )
+        assert resp.status_code == 200
+        resp = await client.post(
+            "/v1/embeddings", json={"input": "a", "model": "text-embedding-3-small"}
+        )
+        assert resp.status_code == 400
+
+        resp = await client.post("/v1/embeddings", json={"input": []})
+        assert resp.status_code == 400
+        resp = await client.post("/v1/embeddings", json={"input": ["a", ""]})
+        assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_embeddings_endpoint_asks_for_requested_model(monkeypatch):
+    calls = []
+
+    class DummyClient:
+        def __init__(self):
+            self.chat = types.SimpleNamespace(completions=None)
+            self.embeddings = self
+
+        def create(self, model, input, **kwargs):
+            calls.append(model)
+            data = [types.SimpleNamespace(embedding=[1.0]) for _ in input]
+            return types.SimpleNamespace(data=data)
+
+    monkeypatch.setattr(
+        openai, "OpenAI", lambda api_key=None, base_url=None: DummyClient()
+    )
+    monkeypatch.setattr(openai, "AsyncOpenAI", lambda api_key=None, base_url=None: None)
+    monkeypatch.setenv("MOOGLA_EMBEDDING_MODEL", "text-embedding-3-small")
+    app = create_app(model="gpt-3.5-turbo")
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        resp = await client.post("/v1/embeddings", json={"input": "a"})
+        assert resp.json()["model"] == "text-embedding-3-small"
+        resp = await client.post(
+            "/v1/embeddings", json={"input": "a", "model": "text-embedding-3-large"}
+        )
+        assert resp.json()["model"] == "text-embedding-3-large"
+    assert calls == ["text-embedding-3-small", "text-embedding-3-large"]
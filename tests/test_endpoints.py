@@ -251,3 +251,9 @@ async def test_reload_plugin_code_change(monkeypatch, tmp_path):
         assert r.status_code == 200
         resp = await client.post("/v1/completions", json={"prompt": "abc"})
         assert resp.json()["choices"][0]["text"] == "cba**"
+
+
+def test_encode_stream_chunk_matches_json():
+    for token in ["abc", 'quote " and \\ slash', "\n", "ünï"]:
+        expected = json.dumps({"choices": [{"delta": {"content": token}}]}) + "\n"
+        assert server.encode_stream_chunk(token) == expected
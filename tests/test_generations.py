@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+
+import httpx
+import pytest
+
+from moogla import generations, server
+from moogla.generations import GenerationStore, TokensDropped
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+async def produce(tokens, gate=None):
+    for i, token in enumerate(tokens):
+        if gate is not None and i == 3:
+            await gate.wait()
+        yield token
+
+
+@pytest.mark.asyncio
+async def test_replay_buffer_keeps_recent_tokens():
+    store = GenerationStore(buffer_tokens=3)
+    gate = asyncio.Event()
+    generation = store.start(produce("abcde", gate))
+    reader = generation.follow(0)
+    assert [await reader.__anext__() for _ in range(3)] == [
+        (0, "a"),
+        (1, "b"),
+        (2, "c"),
+    ]
+    # A reader going away does not stop the generation
+    await reader.aclose()
+    gate.set()
+    await generation._task
+    assert generation.as_dict()["status"] == "completed"
+    assert generation.total == 5
+    with pytest.raises(TokensDropped):
+        generation.tokens(1)
+    assert [item async for item in generation.follow(3)] == [(3, "d"), (4, "e")]
+
+
+@pytest.mark.asyncio
+async def test_store_bounds_and_expiry(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(generations.time, "monotonic", lambda: now[0])
+    store = GenerationStore(max_generations=2, ttl=10)
+    gate = asyncio.Event()
+    running = store.start(produce("abcd", gate))
+    done = store.start(produce("ab"))
+    await done._task
+    # The finished generation makes room for a new one
+    store.start(produce("xy"))
+    assert store.get(done.id) is None
+    assert store.stats()["evictions"] == 1
+    with pytest.raises(RuntimeError):
+        store.start(produce("z"))
+
+    gate.set()
+    await running._task
+    now[0] += 11
+    assert store.get(running.id) is None
+    assert store.stats()["expirations"] == 1
+    await store.close()
+
+
+class DummyExecutor:
+    def __init__(self):
+        self.gate = asyncio.Event()
+
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ):
+        async for token in produce(list(prompt), self.gate):
+            yield token
+
+    async def aclose(self):
+        pass
+
+
+def parse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append(
+            (fields.get("id"), fields.get("event"), json.loads(fields["data"]))
+        )
+    return events
+
+
+@pytest.mark.asyncio
+async def test_resume_generation_after_disconnect(monkeypatch):
+    dummy = DummyExecutor()
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: dummy)
+    monkeypatch.setenv("MOOGLA_GENERATION_BUFFER_TOKENS", "4")
+    app = create_app(["tests.dummy_plugin"])
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        resp = await client.post(
+            "/v1/completions", json={"prompt": "abcdef", "background": True}
+        )
+        assert resp.status_code == 202
+        generation_id = resp.json()["id"]
+        while (await client.get(f"/v1/generations/{generation_id}")).json()[
+            "tokens"
+        ] < 3:
+            await asyncio.sleep(0)
+        status = (await client.get(f"/v1/generations/{generation_id}")).json()
+        assert status["status"] == "running"
+        assert status["text"] == "ABC"
+
+        dummy.gate.set()
+        resp = await client.get(
+            f"/v1/generations/{generation_id}/events",
+            headers={"Last-Event-ID": "2"},
+        )
+        events = parse_events(resp.text)
+        assert [e[0] for e in events[:-1]] == ["3", "4", "5"]
+        tokens = [e[2]["choices"][0]["delta"]["content"] for e in events[:-1]]
+        assert tokens == ["D", "E", "F"]
+        assert events[-1][1] == "completed"
+        assert events[-1][2]["tokens"] == 6
+
+        resp = await client.get(f"/v1/generations/{generation_id}/events")
+        assert resp.status_code == 410
+        status = (await client.get(f"/v1/generations/{generation_id}")).json()
+        assert status["text"] is None
+
+        resp = await client.post(
+            "/v1/chat/completions",
+            json={
+                "messages": [{"role": "user", "content": "hi"}],
+                "background": True,
+                "stream": True,
+            },
+        )
+        assert resp.headers["X-Generation-Id"]
+        events = parse_events(resp.text)
+        assert [e[1] for e in events] == [None, None, "completed"]
+
+        resp = await client.delete(f"/v1/generations/{generation_id}")
+        assert resp.status_code == 204
+        resp = await client.get(f"/v1/generations/{generation_id}")
+        assert resp.status_code == 404
@@ -0,0 +1,103 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from moogla import plugins_config, server
+from moogla.isolation import IsolatedPlugin
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+class DummyExecutor:
+    async def acomplete(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ) -> str:
+        return prompt
+
+    async def aclose(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_isolated_hooks_run_in_worker():
+    plugin = IsolatedPlugin("tests.isolated_plugin", settings={"tag": "t"})
+    assert plugin.pid is None
+    try:
+        await plugin.run_setup()
+        assert plugin.order == 3
+        assert await plugin.run_preprocess("a") == "a:t"
+        out = await plugin.run_postprocess("b")
+        assert out == f"b@{plugin.pid}"
+        assert plugin.pid != os.getpid()
+    finally:
+        await plugin.run_teardown()
+    assert plugin.pid is None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_are_batched(monkeypatch):
+    plugin = IsolatedPlugin("tests.isolated_plugin")
+    sizes = []
+    exchange = plugin._exchange
+
+    def recording_exchange(batch):
+        sizes.append(len(batch))
+        return exchange(batch)
+
+    monkeypatch.setattr(plugin, "_exchange", recording_exchange)
+    try:
+        results = await asyncio.gather(
+            *(plugin.run_preprocess(str(i)) for i in range(20))
+        )
+    finally:
+        await plugin.run_teardown()
+    assert results == [f"{i}:" for i in range(20)]
+    assert sum(sizes) == 20
+    assert len(sizes) < 20
+
+
+@pytest.mark.asyncio
+async def test_worker_recycled_and_restarted():
+    plugin = IsolatedPlugin(
+        "tests.isolated_plugin", settings={"tag": "x", "isolate_max_calls": "2"}
+    )
+    try:
+        await plugin.run_setup()
+        first = plugin.pid
+        await plugin.run_preprocess("a")
+        await plugin.run_preprocess("b")
+        assert plugin.pid != first
+        assert await plugin.run_preprocess("c") == "c:x"
+
+        with pytest.raises(RuntimeError, match="bad input"):
+            await plugin.run_preprocess("fail")
+        with pytest.raises(RuntimeError, match="crashed"):
+            await plugin.run_preprocess("crash")
+        assert await plugin.run_preprocess("d") == "d:x"
+        assert plugin.restarts >= 2
+    finally:
+        await plugin.run_teardown()
+
+
+@pytest.mark.asyncio
+async def test_isolated_plugin_from_store(tmp_path, monkeypatch):
+    cfg = tmp_path / "plugins.yaml"
+    monkeypatch.setenv("MOOGLA_PLUGIN_FILE", str(cfg))
+    plugins_config.add_plugin("tests.isolated_plugin", isolate="true", tag="s")
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    app = create_app()
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            resp = await client.post("/v1/completions", json={"prompt": "q"})
+    text = resp.json()["choices"][0]["text"]
+    assert text.startswith("q:s@")
+    assert text != f"q:s@{os.getpid()}"
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from moogla import server
+from moogla.config import Settings
+from moogla.loop_monitor import LoopMonitor
+from moogla.metrics import LOOP_BLOCKED, LOOP_LAG_SECONDS
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+class DummyExecutor:
+    async def aclose(self):
+        pass
+
+
+def blocking_call():
+    time.sleep(0.3)
+
+
+@pytest.mark.asyncio
+async def test_monitor_captures_blocking_stack(caplog):
+    monitor = LoopMonitor(0.1, interval=0.02)
+    blocked = LOOP_BLOCKED.get()
+    monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        with caplog.at_level(logging.WARNING, logger="moogla.loop_monitor"):
+            blocking_call()
+            await asyncio.sleep(0.05)
+            blocking_call()
+            await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+    assert monitor.stalls == 2
+    assert LOOP_BLOCKED.get() == blocked + 2
+    assert "blocking_call" in monitor.last_stack
+    # The second stall falls inside the log interval and is only counted
+    dumps = [r for r in caplog.records if "Event loop blocked" in r.message]
+    assert len(dumps) == 1
+    assert "blocking_call" in dumps[0].getMessage()
+
+
+@pytest.mark.asyncio
+async def test_monitor_records_lag_without_stalls():
+    monitor = LoopMonitor(1.0, interval=0.01)
+    samples = LOOP_LAG_SECONDS.count()
+    monitor.start()
+    await asyncio.sleep(0.1)
+    await monitor.stop()
+    assert monitor.stalls == 0
+    assert LOOP_LAG_SECONDS.count() > samples
+
+
+@pytest.mark.parametrize("threshold, enabled", [(None, True), (0.0, False)])
+def test_app_starts_monitor(monkeypatch, threshold, enabled):
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    values = {} if threshold is None else {"MOOGLA_LOOP_LAG_THRESHOLD": threshold}
+    app = create_app(settings=Settings(**values))
+    with TestClient(app):
+        assert hasattr(app.state, "loop_monitor") is enabled
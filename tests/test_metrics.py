@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+
+import httpx
+import pytest
+
+from moogla import server
+from moogla.metrics import Registry
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+class DummyExecutor:
+    async def acomplete(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ) -> str:
+        return prompt[::-1]
+
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ):
+        text = prompt[::-1]
+        for i in range(0, len(text), 2):
+            yield text[i : i + 2]
+
+    async def aclose(self):
+        pass
+
+
+def sample(text: str, prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{prefix} not found")
+
+
+def test_histogram_rendering():
+    registry = Registry()
+    hist = registry.histogram("lat_seconds", "Latency", ("route",), buckets=(0.1, 1))
+    hist.observe(0.05, ("/a",))
+    hist.observe(0.5, ("/a",))
+    hist.observe(5, ("/a",))
+    text = registry.render()
+    assert "# TYPE lat_seconds histogram" in text
+    assert sample(text, 'lat_seconds_bucket{route="/a",le="0.1"}') == 1
+    assert sample(text, 'lat_seconds_bucket{route="/a",le="1.0"}') == 2
+    assert sample(text, 'lat_seconds_bucket{route="/a",le="+Inf"}') == 3
+    assert sample(text, 'lat_seconds_count{route="/a"}') == 3
+    assert sample(text, 'lat_seconds_sum{route="/a"}') == pytest.approx(5.55)
+
+
+class YieldingDict(dict):
+    """Dict switching threads between reading and writing a value."""
+
+    def get(self, key, default=None):
+        value = super().get(key, default)
+        time.sleep(0)
+        return value
+
+
+def test_updates_from_threads_are_not_lost():
+    registry = Registry()
+    counter = registry.counter("hits_total", "Hits")
+    gauge = registry.gauge("busy", "Busy")
+    hist = registry.histogram("size", "Size", buckets=(1,))
+    for metric in (counter, gauge, hist):
+        metric.values = YieldingDict()
+
+    def work():
+        for _ in range(200):
+            counter.inc()
+            with gauge.track():
+                hist.observe(0.5)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.get() == 1600
+    assert gauge.get() == 0
+    assert hist.count() == 1600
+
+
+def test_multiprocess_merge_skips_dead_gauges(tmp_path):
+    registry = Registry()
+    counter = registry.counter("hits_total", "Hits")
+    gauge = registry.gauge("busy", "Busy")
+    counter.inc(2)
+    gauge.set(1)
+    other = registry.snapshot()
+    other["pid"] = 999999999
+    (tmp_path / "999999999.json").write_text(json.dumps(other))
+    text = registry.render(tmp_path)
+    assert sample(text, "hits_total") == 4
+    assert sample(text, "busy") == 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(monkeypatch):
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    app = create_app(["tests.dummy_plugin"])
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        before = (await client.get("/metrics")).text
+        await client.post("/v1/completions", json={"prompt": "abcd", "stream": True})
+        await client.post("/v1/completions", json={"prompt": "abcd"})
+        resp = await client.get("/metrics")
+    assert resp.status_code == 200
+    text = resp.text
+
+    def delta(prefix: str) -> float:
+        try:
+            old = sample(before, prefix)
+        except AssertionError:
+            old = 0.0
+        return sample(text, prefix) - old
+
+    assert delta('moogla_requests_total{route="/v1/completions",status="200"}') == 2
+    assert delta("moogla_time_to_first_token_seconds_count") == 1
+    assert delta("moogla_inter_token_latency_seconds_count") == 1
+    assert delta("moogla_generated_tokens_total") == 2
+    hook = 'moogla_plugin_hook_duration_seconds_count{plugin="tests.dummy_plugin"'
+    assert delta(hook + ',hook="preprocess"}') == 2
+    assert delta(hook + ',hook="postprocess"}') == 1
+    assert sample(text, "moogla_queue_depth") == 0
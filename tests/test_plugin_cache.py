@@ -0,0 +1,116 @@
+import os
+import sys
+import types
+
+import httpx
+import pytest
+
+from moogla import server
+from moogla.cache import LRUCache
+from moogla.plugins import Plugin, pure
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+class DummyExecutor:
+    async def acomplete(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ) -> str:
+        return prompt[::-1]
+
+    async def aclose(self):
+        pass
+
+
+def make_counting_plugin(name: str, *, cacheable: bool = True) -> types.ModuleType:
+    mod = types.ModuleType(name)
+    mod.calls = 0
+    mod.cacheable = cacheable
+
+    def preprocess(text: str) -> str:
+        mod.calls += 1
+        return text.upper()
+
+    mod.preprocess = preprocess
+    return mod
+
+
+def test_lru_cache_evicts_oldest():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("missing") is None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cacheable_module_memoizes_hooks():
+    mod = make_counting_plugin("memo_plugin")
+    plugin = Plugin(mod)
+    assert await plugin.run_preprocess("abc") == "ABC"
+    assert await plugin.run_preprocess("abc") == "ABC"
+    assert mod.calls == 1
+    assert plugin.cache_stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_pure_decorator_and_cache_size():
+    mod = types.ModuleType("decorated_plugin")
+    calls = []
+
+    @pure
+    async def postprocess_async(text: str) -> str:
+        calls.append(text)
+        return text + "!"
+
+    def preprocess(text: str) -> str:
+        calls.append(text)
+        return text
+
+    mod.postprocess_async = postprocess_async
+    mod.preprocess = preprocess
+    plugin = Plugin(mod, settings={"cache_size": "1"})
+    for text in ("a", "b", "a"):
+        await plugin.run_postprocess(text)
+        await plugin.run_preprocess(text)
+    assert calls.count("a") == 4
+    assert plugin.cache_stats()["max_size"] == 1
+
+
+def test_non_cacheable_plugin_has_no_cache():
+    plugin = Plugin(make_counting_plugin("plain_plugin", cacheable=False))
+    assert plugin.cache_stats() is None
+
+
+@pytest.mark.asyncio
+async def test_cache_stats_endpoint_and_reload(monkeypatch):
+    mod = make_counting_plugin("memo_server_plugin")
+    monkeypatch.setitem(sys.modules, "memo_server_plugin", mod)
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    app = create_app(["memo_server_plugin"])
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        for _ in range(3):
+            resp = await client.post("/v1/completions", json={"prompt": "abc"})
+            assert resp.json()["choices"][0]["text"] == "CBA"
+        stats = (await client.get("/plugin-cache")).json()["plugins"]
+        assert stats["memo_server_plugin"]["hits"] == 2
+        assert mod.calls == 1
+
+        monkeypatch.setattr(
+            "moogla.plugins.reload", lambda module: sys.modules[module.__name__]
+        )
+        await client.post("/reload-plugins")
+        stats = (await client.get("/plugin-cache")).json()["plugins"]
+        assert stats["memo_server_plugin"]["size"] == 0
@@ -91,10 +91,10 @@ def test_plugin_settings_used(tmp_path, monkeypatch):
     import importlib
 
     setup_plugin = importlib.import_module("tests.setup_plugin")
-    assert setup_plugin.configured == {"suffix": "??"}
-
-    client = TestClient(app_instance)
-    resp = client.post("/v1/completions", json={"prompt": "abc"})
+    setup_plugin.configured.clear()
+    with TestClient(app_instance) as client:
+        assert setup_plugin.configured == {"suffix": "??"}
+        resp = client.post("/v1/completions", json={"prompt": "abc"})
     assert resp.status_code == 200
     assert resp.json()["choices"][0]["text"] == "cba??"
 
@@ -142,3 +142,102 @@ def test_cli_plugin_clear(tmp_path, monkeypatch):
     assert result.exit_code == 0
     assert "Cleared" in result.output
     assert plugins_config.get_plugins() == []
+
+
+def test_cli_plugin_remove_missing(tmp_path, monkeypatch):
+    cfg = tmp_path / "plugins.yaml"
+    monkeypatch.setenv("MOOGLA_PLUGIN_FILE", str(cfg))
+    plugins_config.add_plugin("tests.dummy_plugin")
+    before = cfg.stat()
+    result = runner.invoke(app, ["plugin", "remove", "missing"])
+    assert result.exit_code == 1
+    assert "Plugin not configured: missing" in result.output
+    after = cfg.stat()
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+    assert plugins_config.apply_manifest({"remove": ["missing"]}) == 0
+    assert plugins_config.get_plugins() == ["tests.dummy_plugin"]
+
+
+def test_store_reuses_parsed_snapshot(tmp_path, monkeypatch):
+    cfg = tmp_path / "plugins.yaml"
+    store = plugins_config.PluginStore(cfg)
+    store.add_plugin("tests.dummy_plugin", flag="yes")
+
+    calls = 0
+    real_validate = plugins_config.PluginConfigModel.model_validate
+
+    def counting_validate(raw):
+        nonlocal calls
+        calls += 1
+        return real_validate(raw)
+
+    monkeypatch.setattr(
+        plugins_config.PluginConfigModel, "model_validate", counting_validate
+    )
+    for _ in range(5):
+        assert store.get_plugins() == ["tests.dummy_plugin"]
+        assert store.get_plugin_settings("tests.dummy_plugin") == {"flag": "yes"}
+    assert calls == 1
+
+    store.get_plugin_settings("tests.dummy_plugin")["flag"] = "mutated"
+    assert store.get_all_plugin_settings() == {"tests.dummy_plugin": {"flag": "yes"}}
+
+    store.add_plugin("tests.setup_plugin")
+    assert store.get_plugins() == ["tests.dummy_plugin", "tests.setup_plugin"]
+
+    cfg.write_text("plugins:\n  - other\n")
+    assert store.get_plugins() == ["other"]
+
+
+def test_parallel_adds_are_not_lost(tmp_path):
+    import threading
+
+    cfg = tmp_path / "plugins.yaml"
+    names = [f"plugin_{i}" for i in range(20)]
+    threads = [
+        threading.Thread(
+            target=lambda n=n: plugins_config.PluginStore(cfg).add_plugin(n, idx=n)
+        )
+        for n in names
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    store = plugins_config.PluginStore(cfg)
+    assert sorted(store.get_plugins()) == sorted(names)
+    assert len(store.get_all_plugin_settings()) == 20
+
+
+def test_cli_plugin_apply(tmp_path, monkeypatch):
+    cfg = tmp_path / "plugins.yaml"
+    monkeypatch.setenv("MOOGLA_PLUGIN_FILE", str(cfg))
+    plugins_config.add_plugin("old_plugin", keep="no")
+    manifest = tmp_path / "manifest.yaml"
+    manifest.write_text(
+        "remove:\n"
+        "  - old_plugin\n"
+        "add:\n"
+        "  - tests.dummy_plugin\n"
+        "  - name: tests.setup_plugin\n"
+        "    settings:\n"
+        "      suffix: '!'\n"
+    )
+    result = runner.invoke(app, ["plugin", "apply", str(manifest)])
+    assert result.exit_code == 0
+    assert "Applied 3 change(s)" in result.output
+    assert plugins_config.get_plugins() == ["tests.dummy_plugin", "tests.setup_plugin"]
+    assert plugins_config.get_all_plugin_settings() == {
+        "tests.setup_plugin": {"suffix": "!"}
+    }
+
+
+def test_cli_plugin_apply_invalid_manifest(tmp_path, monkeypatch):
+    cfg = tmp_path / "plugins.yaml"
+    monkeypatch.setenv("MOOGLA_PLUGIN_FILE", str(cfg))
+    plugins_config.add_plugin("tests.dummy_plugin")
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text('{"add": ["a"], "bogus": 1}')
+    result = runner.invoke(app, ["plugin", "apply", str(manifest)])
+    assert result.exit_code == 1
+    assert plugins_config.get_plugins() == ["tests.dummy_plugin"]
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import sys
+import time
+import types
+
+import httpx
+import pytest
+
+from moogla import server
+from moogla.plugins import Plugin, load_plugins, setup_plugins
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+class DummyExecutor:
+    async def acomplete(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ) -> str:
+        return prompt[::-1]
+
+    async def aclose(self):
+        pass
+
+
+def make_slow_plugin(name: str, delay: float) -> types.ModuleType:
+    mod = types.ModuleType(name)
+    mod.ready = False
+
+    async def setup_async(settings: dict) -> None:
+        await asyncio.sleep(delay)
+        mod.ready = True
+
+    def postprocess(text: str) -> str:
+        return text + ("+" if mod.ready else "-")
+
+    mod.setup_async = setup_async
+    mod.postprocess = postprocess
+    return mod
+
+
+@pytest.mark.asyncio
+async def test_setup_async_runs_concurrently():
+    plugins = [Plugin(make_slow_plugin(f"slow_{i}", 0.2)) for i in range(3)]
+    start = time.perf_counter()
+    await setup_plugins(plugins)
+    elapsed = time.perf_counter() - start
+    assert all(p.module.ready for p in plugins)
+    assert elapsed < 0.5
+
+
+@pytest.mark.asyncio
+async def test_setup_timeout_raises():
+    plugin = Plugin(make_slow_plugin("too_slow", 1.0))
+    with pytest.raises(asyncio.TimeoutError):
+        await setup_plugins([plugin], timeout=0.05)
+
+
+@pytest.mark.asyncio
+async def test_load_plugins_setup_inside_loop_deprecated(monkeypatch):
+    monkeypatch.setitem(sys.modules, "slow_loop", make_slow_plugin("slow_loop", 0))
+    plugins = load_plugins(["slow_loop"], setup=False)
+    assert plugins[0].module.ready is False
+    with pytest.warns(DeprecationWarning):
+        plugins = load_plugins(["slow_loop"])
+    # setup_async is scheduled on the running loop
+    await asyncio.sleep(0.01)
+    assert plugins[0].module.ready is True
+
+
+@pytest.mark.asyncio
+async def test_failed_reload_keeps_old_plugins(monkeypatch, tmp_path):
+    (tmp_path / "broken_setup.py").write_text(
+        "def setup(settings: dict) -> None:\n    raise ValueError('bad config')\n"
+    )
+    monkeypatch.syspath_prepend(tmp_path)
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    names = ["tests.dummy_plugin"]
+    app = create_app(names)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        names[:] = ["broken_setup"]
+        resp = await client.post("/reload-plugins")
+        assert resp.status_code == 500
+        assert resp.json()["detail"] == "Plugin setup failed: bad config"
+        resp = await client.post("/v1/completions", json={"prompt": "ab"})
+        assert resp.json()["choices"][0]["text"] == "!!BA!!"
+
+
+@pytest.mark.asyncio
+async def test_requests_wait_for_plugin_setup(monkeypatch):
+    monkeypatch.setitem(sys.modules, "slow_gate", make_slow_plugin("slow_gate", 0.05))
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    app = create_app(["slow_gate"])
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        resp = await client.post("/v1/completions", json={"prompt": "abc"})
+    assert resp.status_code == 200
+    assert resp.json()["choices"][0]["text"] == "cba+"
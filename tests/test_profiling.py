@@ -0,0 +1,90 @@
+import os
+import threading
+
+from fastapi.testclient import TestClient
+
+from moogla import server
+from moogla.profiling import MemoryTracker, format_collapsed, sample_stacks
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("MOOGLA_JWT_SECRET", "profile-secret")
+
+ADMIN = {"X-API-Key": "admin-key"}
+
+
+class DummyExecutor:
+    async def aclose(self):
+        pass
+
+
+def busy_loop(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def idle_loop(stop: threading.Event) -> None:
+    stop.wait()
+
+
+def test_sample_stacks_cpu_mode_skips_idle_threads():
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=busy_loop, args=(stop,), name="busy"),
+        threading.Thread(target=idle_loop, args=(stop,), name="idle"),
+    ]
+    for t in threads:
+        t.start()
+    try:
+        wall = format_collapsed(sample_stacks(0.2, 0.01, "wall"))
+        cpu = format_collapsed(sample_stacks(0.2, 0.01, "cpu"))
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    assert "busy;" in wall and "idle;" in wall
+    assert "busy;" in cpu and "idle;" not in cpu
+    line = next(line for line in wall.splitlines() if "busy_loop" in line)
+    assert int(line.rsplit(" ", 1)[1]) > 0
+
+
+def test_memory_tracker_diff():
+    tracker = MemoryTracker()
+    tracker.start()
+    try:
+        tracker.snapshot()
+        retained = [bytearray(1024) for _ in range(200)]
+        diff = tracker.diff(limit=5)
+    finally:
+        tracker.stop()
+    assert diff["size_diff"] >= 200 * 1024
+    assert "test_profiling.py" in diff["top"][0]["location"]
+    assert len(retained) == 200
+
+
+def test_admin_endpoints(monkeypatch):
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    client = TestClient(create_app(server_api_key="admin-key"))
+    assert client.get("/admin/profile").status_code == 401
+
+    resp = client.get("/admin/profile?seconds=0.05&interval=0.01", headers=ADMIN)
+    assert resp.status_code == 200
+    assert resp.text.strip().endswith(tuple("0123456789"))
+    bad = client.get("/admin/profile?seconds=0.01&mode=gpu", headers=ADMIN)
+    assert bad.status_code == 400
+
+    assert client.get("/admin/memory/snapshot", headers=ADMIN).status_code == 409
+    assert client.post("/admin/memory/start", headers=ADMIN).json()["tracing"]
+    try:
+        snap = client.get("/admin/memory/snapshot?limit=3", headers=ADMIN).json()
+        assert snap["traced_bytes"] > 0 and len(snap["top"]) <= 3
+        diff = client.get("/admin/memory/diff?key_type=filename", headers=ADMIN)
+        assert diff.status_code == 200 and "size_diff" in diff.json()
+    finally:
+        client.post("/admin/memory/stop", headers=ADMIN)
+
+
+def test_admin_endpoints_require_server_key(monkeypatch):
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    client = TestClient(create_app())
+    assert client.get("/admin/profile?seconds=0.01").status_code == 404
@@ -0,0 +1,102 @@
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from moogla import server
+from moogla.config import Settings
+from moogla.supervisor import bind_socket
+
+
+def test_auto_profile_prefers_installed_implementations(monkeypatch):
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: object())
+    options = server.serving_options(Settings())
+    assert options["loop"] == "uvloop"
+    assert options["http"] == "httptools"
+    assert options["backlog"] == 2048
+    assert options["timeout_keep_alive"] == 75
+    assert "uds" not in options and "fd" not in options
+
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+    options = server.serving_options(Settings())
+    assert (options["loop"], options["http"]) == ("asyncio", "h11")
+
+
+def test_overrides_and_settings(monkeypatch):
+    monkeypatch.setenv("MOOGLA_KEEPALIVE_TIMEOUT", "5")
+    monkeypatch.setenv("MOOGLA_UDS", "/tmp/moogla.sock")
+    options = server.serving_options(
+        Settings(), loop="asyncio", http="h11", limit_concurrency=8
+    )
+    assert options["timeout_keep_alive"] == 5
+    assert options["limit_concurrency"] == 8
+    assert options["uds"] == "/tmp/moogla.sock"
+    assert (options["loop"], options["http"]) == ("asyncio", "h11")
+
+    with pytest.raises(ValueError):
+        server.serving_options(Settings(), loop="tokio")
+
+
+def test_systemd_socket_activation(monkeypatch):
+    monkeypatch.setenv("LISTEN_PID", str(os.getpid()))
+    monkeypatch.setenv("LISTEN_FDS", "1")
+    options = server.serving_options(Settings(), uds="/tmp/ignored.sock")
+    assert options["fd"] == 3
+    assert "uds" not in options
+
+    monkeypatch.setenv("LISTEN_PID", "1")
+    assert "fd" not in server.serving_options(Settings())
+
+
+def test_bind_socket_replaces_stale_unix_socket(tmp_path):
+    path = str(tmp_path / "moogla.sock")
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(path)
+    stale.close()
+
+    sock = bind_socket("127.0.0.1", 0, uds=path, backlog=16)
+    try:
+        assert sock.family == socket.AF_UNIX
+        assert sock.getsockname() == path
+        adopted = bind_socket("127.0.0.1", 0, fd=os.dup(sock.fileno()))
+        assert adopted.getsockname() == path
+        adopted.close()
+    finally:
+        sock.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+def test_serve_workers_on_unix_socket(tmp_path):
+    path = str(tmp_path / "moogla.sock")
+    env = {**os.environ, "OPENAI_API_KEY": "test-key"}
+    env.pop("MOOGLA_API_KEY", None)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "moogla", "serve", "--model", "synthetic"]
+        + ["--uds", path, "--workers", "2", "--http", "h11"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    transport = httpx.HTTPTransport(uds=path)
+    try:
+        with httpx.Client(transport=transport, base_url="http://moogla") as client:
+            for _ in range(200):
+                try:
+                    if client.get("/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                proc.poll()
+                assert proc.returncode is None
+                time.sleep(0.1)
+            resp = client.post("/v1/completions", json={"prompt": "hi"})
+            assert resp.status_code == 200
+    finally:
+        proc.terminate()
+        assert proc.wait(timeout=30) == 0
+    assert not os.path.exists(path)
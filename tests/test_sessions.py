@@ -0,0 +1,185 @@
+import json
+import os
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from moogla import server, sessions
+from moogla.server import create_app
+from moogla.sessions import SessionStore
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+class DummyExecutor:
+    def __init__(self):
+        self.prompts = []
+
+    def count_tokens(self, text: str) -> int:
+        return len(text)
+
+    def context_window(self):
+        return None
+
+    async def acomplete(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ) -> str:
+        self.prompts.append(prompt)
+        return f"reply{len(self.prompts)}"
+
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ):
+        self.prompts.append(prompt)
+        for token in ("st", "ream"):
+            yield token
+
+    async def aclose(self):
+        pass
+
+
+def test_store_evicts_and_expires(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(sessions.time, "monotonic", lambda: now[0])
+    store = SessionStore(max_sessions=2, ttl=10)
+    a = store.create()
+    b = store.create("be brief")
+    assert store.get(a.id) is a
+    store.create()
+    assert store.get(b.id) is None
+    assert store.stats()["evictions"] == 1
+
+    now[0] += 5
+    assert store.get(a.id) is a
+    now[0] += 8
+    store.purge()
+    assert store.get(a.id) is a
+    assert len(store) == 1
+    assert store.stats()["expirations"] == 1
+
+
+def test_session_prompt_and_rollback():
+    store = SessionStore()
+    session = store.create("be brief")
+    session.add("user", "hi there")
+    assert session.tokens == 4
+    prompt = session.prompt()
+    assert prompt == "System: be brief\nUser: hi there\nAssistant:"
+
+    session.add("assistant", "hello")
+    session.add("user", "again")
+    assert session.prompt().startswith(prompt[: -len("Assistant:")])
+    session.rollback(2)
+    assert session.prompt() == prompt
+    assert session.tokens == 4
+
+
+@pytest.mark.asyncio
+async def test_chat_with_session(monkeypatch):
+    dummy = DummyExecutor()
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: dummy)
+    app = create_app(["tests.dummy_plugin"])
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        resp = await client.post("/v1/sessions", json={"system": "be brief"})
+        assert resp.status_code == 201
+        session_id = resp.json()["id"]
+
+        turn = {"role": "user", "content": "hi"}
+        resp = await client.post(
+            "/v1/chat/completions", json={"session_id": session_id, "messages": [turn]}
+        )
+        data = resp.json()
+        assert data["choices"][0]["message"]["content"] == "!!reply1!!"
+        assert data["usage"]["prompt_tokens"] == len("be brief") + len("HI")
+        assert dummy.prompts[-1] == "System: be brief\nUser: HI\nAssistant:"
+
+        resp = await client.post(
+            "/v1/chat/completions",
+            json={"session_id": session_id, "messages": [turn], "stream": True},
+        )
+        lines = [json.loads(line) for line in resp.text.splitlines()]
+        assert "".join(c["choices"][0]["delta"]["content"] for c in lines) == "stream"
+        assert dummy.prompts[-1] == (
+            "System: be brief\nUser: HI\nAssistant: reply1\nUser: HI\nAssistant:"
+        )
+
+        history = (await client.get(f"/v1/sessions/{session_id}")).json()
+        assert [m["role"] for m in history["messages"]] == [
+            "system",
+            "user",
+            "assistant",
+            "user",
+            "assistant",
+        ]
+        assert history["messages"][-1] == {
+            "role": "assistant",
+            "content": "stream",
+            "tokens": 6,
+        }
+
+        resp = await client.delete(f"/v1/sessions/{session_id}")
+        assert resp.status_code == 204
+        resp = await client.post(
+            "/v1/chat/completions", json={"session_id": session_id, "messages": [turn]}
+        )
+        assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_streamed_and_complete_turns_store_the_same_reply(monkeypatch):
+    class SameReply(DummyExecutor):
+        async def acomplete(self, prompt: str, **kwargs) -> str:
+            self.prompts.append(prompt)
+            return "stream"
+
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: SameReply())
+    app = create_app(["tests.dummy_plugin"])
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        histories = []
+        for stream in (False, True):
+            session_id = (await client.post("/v1/sessions")).json()["id"]
+            turn = {"role": "user", "content": "hi"}
+            body = {"session_id": session_id, "messages": [turn], "stream": stream}
+            resp = await client.post("/v1/chat/completions", json=body)
+            assert resp.status_code == 200
+            if not stream:
+                reply = resp.json()["choices"][0]["message"]["content"]
+                assert reply == "!!stream!!"
+            history = await client.get(f"/v1/sessions/{session_id}")
+            histories.append(history.json()["messages"])
+    assert histories[0] == histories[1]
+    assert histories[0][-1]["content"] == "stream"
+
+
+def test_websocket_conversation_uses_session(monkeypatch):
+    dummy = DummyExecutor()
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: dummy)
+    with TestClient(create_app()) as client:
+        session_id = client.post("/v1/sessions").json()["id"]
+        with client.websocket_connect("/v1/chat/ws") as ws:
+            for text in ("one", "two"):
+                frame = {"type": "message", "content": text, "session": session_id}
+                ws.send_text(json.dumps(frame))
+                while "t" in (frame := json.loads(ws.receive_text())):
+                    pass
+                assert frame["done"] is True
+            ws.send_text(json.dumps({"type": "message", "session": "missing"}))
+            assert json.loads(ws.receive_text())["error"] == "Session not found"
+        assert dummy.prompts[-1] == (
+            "User: one\nAssistant: stream\nUser: two\nAssistant:"
+        )
+        messages = client.get(f"/v1/sessions/{session_id}").json()["messages"]
+        assert len(messages) == 4
@@ -0,0 +1,182 @@
+import os
+import sys
+import types
+
+import httpx
+import openai
+import pytest
+
+from moogla import server
+from moogla.executor import LLMExecutor, _stop_criteria
+from moogla.server import create_app
+from moogla.stops import StopMatcher, stop_list, stop_tokens, truncate
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+def test_stop_split_across_tokens():
+    matcher = StopMatcher(["</s>", "END"])
+    emitted = [matcher.feed(token) for token in ["Hello <", "/", "s> more"]]
+    assert emitted == ["Hello ", "", ""]
+    assert matcher.stopped
+    assert matcher.feed("ignored") == ""
+
+
+def test_false_starts_are_released():
+    matcher = StopMatcher(["abc"])
+    assert matcher.feed("xa") == "x"
+    assert matcher.feed("b") == ""
+    assert matcher.feed("d") == "abd"
+    assert matcher.feed("ab") == ""
+    assert matcher.flush() == "ab"
+    assert not matcher.stopped
+
+
+def test_overlapping_stops_end_at_first_match():
+    assert truncate("xabcd", ["abcd", "bc"]) == "xa"
+    assert truncate("aab", ["ab"]) == "a"
+    assert truncate("no stop here", None) == "no stop here"
+    assert stop_list("") is None
+    assert stop_list(["a", ""]) == ["a"]
+
+
+def test_stop_tokens_closes_source():
+    closed = []
+
+    def tokens():
+        try:
+            yield from ["one ", "two", " STOP", " three"]
+        finally:
+            closed.append(True)
+
+    assert list(stop_tokens(tokens(), ["STOP"])) == ["one ", "two", " "]
+    assert closed == [True]
+
+
+def test_openai_receives_stop(monkeypatch):
+    calls = []
+
+    class DummyClient:
+        def __init__(self):
+            self.chat = types.SimpleNamespace(completions=self)
+
+        def create(self, **kwargs):
+            calls.append(kwargs)
+            message = types.SimpleNamespace(content="hi")
+            return types.SimpleNamespace(
+                choices=[types.SimpleNamespace(message=message)]
+            )
+
+    dummy = DummyClient()
+    monkeypatch.setattr(openai, "OpenAI", lambda api_key=None, base_url=None: dummy)
+    monkeypatch.setattr(openai, "AsyncOpenAI", lambda api_key=None, base_url=None: None)
+    executor = LLMExecutor(model="gpt-3.5-turbo")
+    executor.complete("hello", stop=["\n"])
+    executor.complete("hello")
+    assert calls[0]["stop"] == ["\n"]
+    assert "stop" not in calls[1]
+
+
+def test_synthetic_backend_truncates():
+    executor = LLMExecutor(model="synthetic:seed=1")
+    text = executor.complete("hello", max_tokens=8)
+    stop = text.split()[2]
+    expected = text[: text.index(stop)]
+    assert executor.complete("hello", max_tokens=8, stop=[stop]) == expected
+    assert "".join(executor.stream("hello", max_tokens=8, stop=[stop])) == expected
+
+
+def test_synthetic_backend_stops_generating():
+    executor = LLMExecutor(model="synthetic:seed=1")
+    text = executor.complete("hello", max_tokens=50)
+    stop = text.split()[2]
+    stream = executor.synthetic.stream
+    pulled = []
+
+    def counting(prompt, max_tokens):
+        for token in stream(prompt, max_tokens):
+            pulled.append(token)
+            yield token
+
+    executor.synthetic.stream = counting
+    executor.complete("hello", max_tokens=50, stop=[stop])
+    assert len(pulled) <= 3
+
+
+def test_stop_criteria_decode_only_new_tokens(monkeypatch):
+    class Criteria:
+        pass
+
+    monkeypatch.setitem(
+        sys.modules,
+        "transformers",
+        types.SimpleNamespace(StoppingCriteria=Criteria, StoppingCriteriaList=list),
+    )
+
+    class Ids:
+        def __init__(self, ids):
+            self.ids = ids
+            self.shape = (1, len(ids))
+
+        def __getitem__(self, index):
+            return self.ids[index[1]]
+
+    decoded = []
+
+    class Tokenizer:
+        def decode(self, ids, skip_special_tokens=False):
+            decoded.append(len(ids))
+            # Token 9 is the first half of a multi-byte character
+            return "".join("\ufffd" if i == 9 else chr(96 + i) for i in ids)
+
+    (criteria,) = _stop_criteria(Tokenizer(), ["cd"])
+    prompt = [20, 21, 22]
+    generated = []
+    for token in [1, 2, 9, 3, 4, 5]:
+        generated.append(token)
+        if criteria(Ids(prompt + generated), None):
+            break
+    assert generated == [1, 2, 9, 3, 4]
+    assert max(decoded) <= 3
+
+
+class DummyExecutor:
+    def __init__(self):
+        self.calls = []
+
+    async def acomplete(self, prompt: str, **kwargs) -> str:
+        self.calls.append(kwargs)
+        return prompt.lower()
+
+    async def astream(self, prompt: str, **kwargs):
+        self.calls.append(kwargs)
+        for token in prompt.lower():
+            yield token
+
+    async def aclose(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_endpoints_forward_stop(monkeypatch):
+    dummy = DummyExecutor()
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: dummy)
+    app = create_app(["tests.dummy_plugin"])
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        resp = await client.post("/v1/completions", json={"prompt": "ab", "stop": "."})
+        assert resp.status_code == 200
+        resp = await client.post(
+            "/v1/chat/completions",
+            json={
+                "messages": [{"role": "user", "content": "ab"}],
+                "stop": ["x", "y"],
+                "stream": True,
+            },
+        )
+        assert resp.status_code == 200
+        await client.post("/v1/completions", json={"prompt": "ab"})
+    assert dummy.calls[0]["stop"] == ["."]
+    assert dummy.calls[1]["stop"] == ["x", "y"]
+    assert "stop" not in dummy.calls[2]
@@ -0,0 +1,121 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+from moogla.supervisor import Supervisor
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "fork") or not Path("/proc/self/task").exists(),
+    reason="requires fork and procfs",
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def worker_pids(pid: int) -> set:
+    children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+    return {int(c) for c in children}
+
+
+def wait_for(predicate, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            result = predicate()
+            if result:
+                return result
+        except (httpx.HTTPError, OSError):
+            pass
+        time.sleep(0.1)
+    raise AssertionError("condition not met in time")
+
+
+def serve(port: int, tmp_path, *args: str, **env: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "test-key",
+        "MOOGLA_METRICS_DIR": str(tmp_path),
+        **env,
+    }
+    env.pop("MOOGLA_API_KEY", None)
+    return subprocess.Popen(
+        [sys.executable, "-m", "moogla", "serve", "--port", str(port)]
+        + ["--model", "synthetic", *args],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def test_serve_workers_rotate_and_stop(tmp_path):
+    port = free_port()
+    proc = serve(port, tmp_path, "--workers", "2")
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_for(lambda: httpx.get(base + "/health").status_code == 200)
+        first = wait_for(
+            lambda: len(worker_pids(proc.pid)) == 2 and worker_pids(proc.pid)
+        )
+
+        for _ in range(6):
+            resp = httpx.post(base + "/v1/completions", json={"prompt": "hi"})
+            assert resp.status_code == 200
+
+        # Metrics snapshots of both workers are merged
+        wait_for(lambda: len(list(tmp_path.glob("*.json"))) == 2)
+
+        proc.send_signal(signal.SIGHUP)
+        second = wait_for(
+            lambda: len(worker_pids(proc.pid)) == 2
+            and not worker_pids(proc.pid) & first
+            and worker_pids(proc.pid)
+        )
+        assert httpx.get(base + "/health").status_code == 200
+
+        os.kill(next(iter(second)), signal.SIGKILL)
+        wait_for(lambda: len(worker_pids(proc.pid) - second) == 1)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=30) == 0
+
+
+def test_workers_use_inherited_in_memory_database(tmp_path):
+    port = free_port()
+    proc = serve(port, tmp_path, MOOGLA_WORKERS="2")
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_for(lambda: len(worker_pids(proc.pid)) == 2)
+        wait_for(lambda: httpx.get(base + "/health").status_code == 200)
+        for i in range(6):
+            resp = httpx.post(
+                base + "/register", json={"username": f"u{i}", "password": "p"}
+            )
+            assert resp.status_code == 201, resp.text
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=30) == 0
+
+
+def test_reap_leaves_other_children_alone():
+    worker = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    supervisor = Supervisor(None, None, 1)
+    supervisor.children.append(worker.pid)
+    other = subprocess.Popen([sys.executable, "-c", "raise SystemExit(3)"])
+    try:
+        wait_for(lambda: Path(f"/proc/{other.pid}/stat").read_text().split()[2] == "Z")
+        assert supervisor._reap() == []
+        assert other.wait(timeout=5) == 3
+    finally:
+        worker.kill()
+        worker.wait()
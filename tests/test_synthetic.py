@@ -0,0 +1,131 @@
+from array import array
+
+import httpx
+import openai
+import pytest
+
+from moogla.executor import LLMExecutor
+from moogla.server import create_app
+from moogla.stops import truncate
+from moogla.synthetic import SyntheticBackend, SyntheticFailure, create_openai_app
+
+
+def test_spec_parsing():
+    backend = SyntheticBackend.from_spec("synthetic:token_ms=5,fail=0.5,seed=3")
+    assert backend.token_ms == 5
+    assert backend.fail == 0.5
+    assert backend.seed == 3
+    with pytest.raises(ValueError):
+        SyntheticBackend.from_spec("synthetic:bogus=1")
+
+
+def test_executor_sync_paths_are_deterministic():
+    executor = LLMExecutor(model="synthetic:seed=1")
+    first = executor.complete("hello", max_tokens=5)
+    assert first == executor.complete("hello", max_tokens=5)
+    assert first != executor.complete("other", max_tokens=5)
+    assert "".join(executor.stream("hello", max_tokens=5)) == first
+    assert len(list(executor.stream("hello", max_tokens=5))) == 5
+
+
+@pytest.mark.asyncio
+async def test_executor_async_paths():
+    executor = LLMExecutor(model="synthetic:token_ms=1,prompt_ms=1")
+    tokens = [t async for t in executor.astream("hi", max_tokens=3)]
+    assert len(tokens) == 3
+    assert await executor.acomplete("hi", max_tokens=3) == "".join(tokens)
+
+
+@pytest.mark.asyncio
+async def test_failure_rate():
+    backend = SyntheticBackend(fail=1.0)
+    with pytest.raises(SyntheticFailure):
+        await backend.acomplete("x", 2)
+    backend = SyntheticBackend(fail=0.5, seed=4)
+    outcomes = []
+    for _ in range(40):
+        try:
+            backend.complete("same prompt", 1)
+            outcomes.append(True)
+        except SyntheticFailure:
+            outcomes.append(False)
+    assert 0 < outcomes.count(False) < 40
+
+
+@pytest.mark.asyncio
+async def test_openai_stand_in_with_client():
+    backend = SyntheticBackend(seed=2)
+    http_client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=create_openai_app(backend))
+    )
+    client = openai.AsyncOpenAI(
+        api_key="x", base_url="http://stub/v1", http_client=http_client
+    )
+    resp = await client.chat.completions.create(
+        model="synthetic",
+        messages=[{"role": "user", "content": "hello"}],
+        max_tokens=4,
+    )
+    expected = "".join(backend.tokens("hello", 4))
+    assert resp.choices[0].message.content == expected
+
+    stream = await client.chat.completions.create(
+        model="synthetic",
+        messages=[{"role": "user", "content": "hello"}],
+        max_tokens=4,
+        stream=True,
+    )
+    chunks = [c.choices[0].delta.content async for c in stream]
+    assert "".join(chunks) == expected
+    await client.close()
+
+
+def serve_stand_in(monkeypatch, backend):
+    """Route the async OpenAI clients created from now on to the stand-in."""
+    client_class = openai.AsyncOpenAI
+    app = create_openai_app(backend)
+
+    def make_client(**kwargs):
+        transport = httpx.ASGITransport(app=app)
+        return client_class(
+            http_client=httpx.AsyncClient(transport=transport), **kwargs
+        )
+
+    monkeypatch.setattr(openai, "AsyncOpenAI", make_client)
+
+
+@pytest.mark.asyncio
+async def test_stand_in_applies_stop_through_api_base(monkeypatch):
+    backend = SyntheticBackend(seed=2)
+    serve_stand_in(monkeypatch, backend)
+    executor = LLMExecutor(model="remote", api_key="x", api_base="http://stub/v1")
+    full = "".join(backend.tokens("hello", 8))
+    stop = backend.tokens("hello", 8)[4]
+    expected = truncate(full, [stop])
+    assert expected != full
+
+    assert await executor.acomplete("hello", max_tokens=8) == full
+    assert await executor.acomplete("hello", max_tokens=8, stop=[stop]) == expected
+
+    stream = await executor.async_client.completions.create(
+        model="remote", prompt="hello", max_tokens=8, stop=stop, stream=True
+    )
+    assert "".join([c.choices[0].text async for c in stream]) == expected
+    await executor.aclose()
+
+
+@pytest.mark.asyncio
+async def test_embeddings_through_stand_in(monkeypatch):
+    backend = SyntheticBackend(seed=3)
+    serve_stand_in(monkeypatch, backend)
+    app = create_app(model="stand-in", api_key="x", api_base="http://stub/v1")
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        resp = await client.post("/v1/embeddings", json={"input": ["a b", "c"]})
+        assert resp.status_code == 200
+        body = resp.json()
+        assert body["model"] == "stand-in"
+        assert [item["embedding"] for item in body["data"]] == [
+            array("f", vector).tolist() for vector in backend.embed(["a b", "c"])
+        ]
@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from moogla import server, timing
+from moogla.config import Settings
+from moogla.executor import LLMExecutor
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("MOOGLA_JWT_SECRET", "timing-secret")
+
+
+def parse_server_timing(value: str) -> dict:
+    phases = {}
+    for item in value.split(","):
+        name, _, dur = item.strip().partition(";dur=")
+        phases[name] = float(dur)
+    return phases
+
+
+def make_client(monkeypatch, rate: float, **kwargs) -> TestClient:
+    executor = LLMExecutor(model="synthetic:token_ms=1")
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: executor)
+    settings = Settings(MOOGLA_TIMING_SAMPLE_RATE=rate)
+    return TestClient(create_app(["tests.dummy_plugin"], settings=settings, **kwargs))
+
+
+def test_server_timing_header(monkeypatch):
+    with make_client(monkeypatch, 1.0, server_api_key="key") as client:
+        resp = client.post(
+            "/v1/completions", json={"prompt": "abc"}, headers={"X-API-Key": "key"}
+        )
+    assert resp.status_code == 200
+    phases = parse_server_timing(resp.headers["server-timing"])
+    assert {"auth", "preprocess", "generate", "postprocess", "total"} <= set(phases)
+    assert phases["total"] >= phases["generate"] > 0
+
+
+def test_stream_ends_with_timing_frame(monkeypatch):
+    with make_client(monkeypatch, 1.0) as client:
+        resp = client.post(
+            "/v1/completions", json={"prompt": "abc", "stream": True, "max_tokens": 3}
+        )
+    assert "server-timing" not in resp.headers
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert len(lines) == 4
+    timings = lines[-1]["timings"]
+    assert timings["prompt"] > 0 and timings["generate"] > 0
+
+
+def test_unsampled_requests_have_no_timings(monkeypatch):
+    with make_client(monkeypatch, 0.0) as client:
+        resp = client.post("/v1/completions", json={"prompt": "abc", "stream": True})
+    assert "server-timing" not in resp.headers
+    assert "timings" not in resp.text
+
+
+@pytest.mark.asyncio
+async def test_timed_noop_without_timer():
+    with timing.timed("phase"):
+        pass
+    assert timing.current_timer() is None
+    timer = timing.RequestTimer()
+    token = timing._current.set(timer)
+    try:
+        with timing.timed("phase"):
+            pass
+        timing.record("phase", 0.5)
+        assert [t async for t in timing.timed_stream(_agen())] == [1, 2]
+    finally:
+        timing._current.reset(token)
+    assert timer.phases["phase"] >= 0.5
+    assert set(timer.as_dict()) == {"phase", "prompt", "generate", "total"}
+
+
+async def _agen():
+    yield 1
+    yield 2
@@ -0,0 +1,148 @@
+import json
+import os
+import types
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from moogla import server, tracing
+from moogla.config import Settings
+from moogla.executor import LLMExecutor
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class ListExporter(tracing.BatchExporter):
+    def __init__(self):
+        self.spans = []
+        super().__init__(interval=0.01)
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+def make_client(monkeypatch, tmp_path, rate=1.0):
+    executor = LLMExecutor(model="synthetic")
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: executor)
+    settings = Settings(
+        MOOGLA_TRACE_FILE=tmp_path / "spans.jsonl", MOOGLA_TRACE_SAMPLE_RATE=rate
+    )
+    return TestClient(create_app(["tests.dummy_plugin"], settings=settings))
+
+
+def read_spans(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_request_spans_continue_incoming_trace(monkeypatch, tmp_path):
+    traceparent = f"00-{TRACE_ID}-{PARENT_ID}-01"
+    with make_client(monkeypatch, tmp_path, rate=0.0) as client:
+        client.post(
+            "/v1/completions",
+            json={"prompt": "abc"},
+            headers={"traceparent": traceparent},
+        )
+    spans = {s["name"]: s for s in read_spans(tmp_path)}
+    root = spans["POST /v1/completions"]
+    assert root["trace_id"] == TRACE_ID and root["parent_id"] == PARENT_ID
+    assert root["kind"] == "server"
+    assert root["attributes"]["http.status_code"] == 200
+    for name in ("plugin.preprocess", "llm.complete", "plugin.postprocess"):
+        assert spans[name]["parent_id"] == root["span_id"]
+        assert spans[name]["trace_id"] == TRACE_ID
+    assert spans["plugin.preprocess"]["attributes"]["plugin"] == "tests.dummy_plugin"
+
+
+def test_stream_span_and_sampling(monkeypatch, tmp_path):
+    with make_client(monkeypatch, tmp_path) as client:
+        client.post("/v1/completions", json={"prompt": "abc", "stream": True})
+        client.post(
+            "/v1/completions",
+            json={"prompt": "abc"},
+            headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-00"},
+        )
+    spans = read_spans(tmp_path)
+    assert TRACE_ID not in {s["trace_id"] for s in spans}
+    stream = next(s for s in spans if s["name"] == "llm.stream")
+    assert stream["attributes"]["items"] == 16
+    assert len({s["trace_id"] for s in spans}) == 1
+
+
+def test_unsampled_requests_export_nothing(monkeypatch, tmp_path):
+    with make_client(monkeypatch, tmp_path, rate=0.0) as client:
+        client.post("/v1/completions", json={"prompt": "abc"})
+    assert read_spans(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_traceparent_propagates_upstream():
+    seen = {}
+
+    async def create(**kwargs):
+        seen.update(kwargs)
+        message = types.SimpleNamespace(content="ok")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+    executor = LLMExecutor(model="gpt-test", api_key="key")
+    executor.async_client = types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+    )
+    assert await executor.acomplete("hi") == "ok"
+    assert "extra_headers" not in seen
+
+    exporter = ListExporter()
+    root = tracing.Tracer(exporter).start_request(None, "test")
+    token = tracing._current.set(root)
+    try:
+        await executor.acomplete("hi")
+    finally:
+        tracing._current.reset(token)
+    exporter.shutdown()
+    (llm_span,) = exporter.spans
+    assert seen["extra_headers"]["traceparent"] == llm_span.traceparent
+    assert llm_span.parent_id == root.span_id
+
+
+def test_otlp_exporter_payload():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200)
+
+    exporter = tracing.OTLPExporter(
+        "http://collector:4318", transport=httpx.MockTransport(handler)
+    )
+    tracer = tracing.Tracer(exporter)
+    root = tracer.start_request(f"00-{TRACE_ID}-{PARENT_ID}-01", "GET /health")
+    root.set("http.status_code", 200)
+    child = root.child("work", ok=True, ratio=0.5)
+    child.error = "ValueError"
+    child.end()
+    root.end()
+    tracer.shutdown()
+
+    assert requests[0].url == "http://collector:4318/v1/traces"
+    body = json.loads(requests[0].content)
+    spans = body["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["work", "GET /health"]
+    assert spans[0]["parentSpanId"] == root.span_id
+    assert spans[0]["status"]["code"] == 2
+    assert {"key": "ok", "value": {"boolValue": True}} in spans[0]["attributes"]
+    assert spans[1]["kind"] == 2 and spans[1]["parentSpanId"] == PARENT_ID
+
+
+@pytest.mark.parametrize(
+    "value",
+    ["", "01-" + TRACE_ID + "-" + PARENT_ID + "-01", f"00-{'0' * 32}-{PARENT_ID}-01"],
+)
+def test_invalid_traceparent(value):
+    assert tracing.parse_traceparent(value) is None
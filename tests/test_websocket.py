@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import types
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from moogla import server
+from moogla.server import create_app
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+
+class DummyExecutor:
+    async def astream(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+        top_p: float | None = None,
+    ):
+        if prompt == "slow":
+            for i in range(1000):
+                await asyncio.sleep(0.01)
+                yield str(i)
+            return
+        text = prompt[::-1]
+        for i in range(0, len(text), 2):
+            yield text[i : i + 2]
+
+    async def aclose(self):
+        pass
+
+
+def receive_until(ws, conversation, key):
+    frames = []
+    while True:
+        frame = json.loads(ws.receive_text())
+        if frame.get("id") != conversation:
+            continue
+        frames.append(frame)
+        if key in frame:
+            return frames
+
+
+def test_streams_incremental_messages(monkeypatch):
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    with TestClient(create_app(["tests.dummy_plugin"])) as client:
+        with client.websocket_connect("/v1/chat/ws") as ws:
+            for text in ("abc", "hello"):
+                ws.send_text(
+                    json.dumps({"type": "message", "id": "a", "content": text})
+                )
+                frames = receive_until(ws, "a", "done")
+                reply = "".join(f["t"] for f in frames if "t" in f)
+                assert reply == text.upper()[::-1]
+                assert frames[-1] == {
+                    "id": "a",
+                    "done": True,
+                    "tokens": len(frames) - 1,
+                }
+
+            ws.send_text("not json")
+            assert json.loads(ws.receive_text()) == {"error": "Invalid frame"}
+
+
+def test_cancel_and_multiplexed_conversations(monkeypatch):
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    with TestClient(create_app()) as client:
+        with client.websocket_connect("/v1/chat/ws") as ws:
+            ws.send_text(
+                json.dumps({"type": "message", "id": "slow", "content": "slow"})
+            )
+            ws.send_text(json.dumps({"type": "message", "id": "slow", "content": "x"}))
+            assert receive_until(ws, "slow", "error")[-1]["error"] == (
+                "Conversation is busy"
+            )
+
+            ws.send_text(json.dumps({"type": "message", "id": "fast", "content": "ab"}))
+            assert receive_until(ws, "fast", "done")[-1]["tokens"] == 1
+
+            ws.send_text(json.dumps({"type": "cancel", "id": "slow"}))
+            last = receive_until(ws, "slow", "cancelled")[-1]
+            assert last["cancelled"] is True
+            assert last["tokens"] < 1000
+
+
+def test_no_frames_after_the_client_left(monkeypatch):
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    sent = []
+    send_text = WebSocket.send_text
+
+    async def record(self, data):
+        sent.append(json.loads(data))
+        await send_text(self, data)
+
+    monkeypatch.setattr(WebSocket, "send_text", record)
+    with TestClient(create_app()) as client:
+        with client.websocket_connect("/v1/chat/ws") as ws:
+            ws.send_text(json.dumps({"type": "message", "content": "slow"}))
+            assert "t" in json.loads(ws.receive_text())
+    assert sent
+    assert not any("cancelled" in frame for frame in sent)
+
+
+def test_authenticates_once_per_connection(monkeypatch):
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+    app = create_app(server_api_key="secret", jwt_secret="jwt")
+    with TestClient(app) as client:
+        with pytest.raises(WebSocketDisconnect) as exc:
+            with client.websocket_connect("/v1/chat/ws", headers={"X-API-Key": "x"}):
+                pass
+        assert exc.value.code == 1008
+
+        # Keys in the URL are not accepted, the first frame must authenticate
+
+        with pytest.raises(WebSocketDisconnect) as exc:
+            with client.websocket_connect("/v1/chat/ws?api_key=secret") as ws:
+                ws.send_text(json.dumps({"type": "message", "content": "ab"}))
+                ws.receive_text()
+        assert exc.value.code == 1008
+
+        with pytest.raises(WebSocketDisconnect) as exc:
+            with client.websocket_connect("/v1/chat/ws") as ws:
+                ws.send_text(json.dumps({"type": "auth", "api_key": "wrong"}))
+                ws.receive_text()
+        assert exc.value.code == 1008
+
+        with client.websocket_connect("/v1/chat/ws") as ws:
+            ws.send_text(json.dumps({"type": "auth", "api_key": "secret"}))
+            ws.send_text(json.dumps({"type": "message", "content": "ab"}))
+            assert receive_until(ws, "0", "done")[0]["t"] == "ba"
+
+        headers = {"X-API-Key": "secret"}
+        with client.websocket_connect("/v1/chat/ws", headers=headers) as ws:
+            ws.send_text(json.dumps({"type": "message", "content": "ab"}))
+            assert receive_until(ws, "0", "done")[-1]["done"] is True
+
+
+def test_rate_limit_applies_per_message(monkeypatch):
+    monkeypatch.setattr(server, "LLMExecutor", lambda *a, **kw: DummyExecutor())
+
+    class MemoryLimiter:
+        def __init__(self, times, callback):
+            self.times = times
+            self.callback = callback
+            self.hits = 0
+
+        async def __call__(self, ws, context_key=""):
+            self.hits += 1
+            if self.hits > self.times:
+                return await self.callback(ws, 1000)
+
+    monkeypatch.setattr(
+        server,
+        "WebSocketRateLimiter",
+        lambda times=1, seconds=60, callback=None: MemoryLimiter(times, callback),
+    )
+
+    async def noop(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(server, "RateLimiter", lambda times=1, seconds=60: None)
+    monkeypatch.setattr(
+        server, "FastAPILimiter", types.SimpleNamespace(init=noop, close=noop)
+    )
+    monkeypatch.setattr(
+        "redis.asyncio.from_url", lambda *a, **kw: types.SimpleNamespace(close=noop)
+    )
+    app = create_app(rate_limit=1, redis_url="redis://test")
+    with TestClient(app) as client:
+        with client.websocket_connect("/v1/chat/ws") as ws:
+            ws.send_text(json.dumps({"type": "message", "content": "ab"}))
+            assert receive_until(ws, "0", "done")
+            ws.send_text(json.dumps({"type": "message", "content": "ab"}))
+            assert receive_until(ws, "0", "error")[-1]["error"] == "Too Many Requests"